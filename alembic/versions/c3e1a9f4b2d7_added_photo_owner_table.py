@@ -0,0 +1,30 @@
+"""added photo_owner table
+
+Revision ID: c3e1a9f4b2d7
+Revises: 11e4c0b67854
+Create Date: 2026-10-18 09:12:44.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e1a9f4b2d7'
+down_revision = '11e4c0b67854'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('photo_owner',
+    sa.Column('photo_hash', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('uploaded', sa.Date(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['athlete.user_id'], ),
+    sa.PrimaryKeyConstraint('photo_hash', 'user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('photo_owner')
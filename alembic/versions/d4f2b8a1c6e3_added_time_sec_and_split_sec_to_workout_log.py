@@ -0,0 +1,86 @@
+"""added time_sec and split_sec to workout_log
+
+Numeric copies of the time / split strings so SQL can sort, filter and aggregate by duration.
+Existing rows are backfilled in batches, each committed on its own: if the migration is
+interrupted, running it again picks up the rows that are still NULL.
+
+Revision ID: d4f2b8a1c6e3
+Revises: c3e1a9f4b2d7
+Create Date: 2026-10-18 11:31:07.512964
+
+"""
+import json
+from typing import Optional
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f2b8a1c6e3'
+down_revision = 'c3e1a9f4b2d7'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _duration_to_seconds(duration: Optional[str]) -> Optional[float]:
+    # same arithmetic as src.metrics.durations_to_seconds - kept here so the migration doesn't depend on app code
+    if not duration:
+        return None
+    try:
+        time_components = [float(item) for item in duration.split(":")]
+    except ValueError:
+        return None
+    seconds = time_components.pop()
+    if time_components:
+        seconds += time_components.pop() * 60
+    if time_components:
+        seconds += time_components.pop() * 3600
+    return seconds
+
+
+def upgrade() -> None:
+    existing_columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('workout_log')}
+    # re-running after an interrupted backfill - the columns were already committed
+    if 'time_sec' not in existing_columns:
+        op.add_column('workout_log', sa.Column('time_sec', sa.Float(), nullable=True))
+    if 'split_sec' not in existing_columns:
+        op.add_column('workout_log', sa.Column('split_sec', sa.Float(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        last_id = 0
+        while True:
+            # walk by primary key so unparseable rows (left NULL) are only visited once
+            rows = bind.execute(
+                sa.text(
+                    "SELECT workout_id, time, split FROM workout_log "
+                    "WHERE workout_id > :last_id AND (time_sec IS NULL OR split_sec IS NULL) "
+                    "ORDER BY workout_id LIMIT :batch_size"
+                ),
+                {"last_id": last_id, "batch_size": BACKFILL_BATCH_SIZE},
+            ).fetchall()
+            if not rows:
+                break
+            values = [
+                {"workout_id": workout_id, "time_sec": _duration_to_seconds(time), "split_sec": _duration_to_seconds(split)}
+                for workout_id, time, split in rows
+            ]
+            # one statement per batch -> one transaction per batch in autocommit mode
+            bind.execute(
+                sa.text(
+                    "UPDATE workout_log AS w SET time_sec = v.time_sec, split_sec = v.split_sec "
+                    "FROM json_to_recordset(CAST(:values AS json)) "
+                    "AS v(workout_id integer, time_sec double precision, split_sec double precision) "
+                    "WHERE w.workout_id = v.workout_id"
+                ),
+                {"values": json.dumps(values)},
+            )
+            last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    op.drop_column('workout_log', 'split_sec')
+    op.drop_column('workout_log', 'time_sec')
@@ -0,0 +1,70 @@
+"""added indexes for the per-request lookups
+
+athlete.auth_uid (unique, every authenticated request), athlete.email (/login/), athlete.team
+(team endpoints), workout_log.user_id (/workout) and a partial index on the workouts posted to
+the team (/team, /teamlog).
+
+Built with CREATE INDEX CONCURRENTLY so writes aren't blocked while they build. That can't run
+inside a transaction, hence the autocommit block. A failed concurrent build leaves an INVALID
+index behind - those are dropped first, so re-running the migration rebuilds them.
+
+Revision ID: e7a3c5d9f1b2
+Revises: d4f2b8a1c6e3
+Create Date: 2026-10-18 11:48:20.137245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c5d9f1b2'
+down_revision = 'd4f2b8a1c6e3'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # (name, table, columns, unique, partial index condition)
+    ('ix_athlete_auth_uid', 'athlete', ['auth_uid'], True, None),
+    ('ix_athlete_email', 'athlete', ['email'], False, None),
+    ('ix_athlete_team', 'athlete', ['team'], False, None),
+    ('ix_workout_log_user_id', 'workout_log', ['user_id'], False, None),
+    ('ix_workout_log_posted_user_id', 'workout_log', ['user_id'], False, 'post_to_team'),
+]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    duplicates = bind.execute(
+        sa.text("SELECT auth_uid FROM athlete WHERE auth_uid IS NOT NULL GROUP BY auth_uid HAVING COUNT(*) > 1 LIMIT 5")
+    ).fetchall()
+    if duplicates:
+        raise RuntimeError(
+            f"athlete.auth_uid has duplicates, merge them before adding the unique index: {[row[0] for row in duplicates]}"
+        )
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique, where in INDEXES:
+            invalid = bind.execute(
+                sa.text(
+                    "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                    "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+                ),
+                {"name": name},
+            ).fetchone()
+            if invalid:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -1,70 +1,341 @@
-import os
-from hashlib import  sha256
+"""
+Bulk OCR ingest for a folder of erg photos (e.g. a regatta's worth).
+
+Photos flow through a pipeline of bounded stages running concurrently:
+    hash   - read + sha256, one reader thread
+    ocr    - prepare_for_ocr + OCR provider call, --workers threads (photos already in the raw OCR store skip the call)
+    store  - new responses written to the raw OCR store in batches of --batch-size, one transaction each
+    upload - photo stored in the blob store under its hash, --upload-workers threads
+Queues between stages are bounded, so only a few photos are held in memory at once.
+
+Progress is appended to a manifest (one json line per finished photo). A photo is only recorded
+once its response is committed and its upload done, so an interrupted run resumes where it
+stopped - re-run the same command. Failed photos are retried on the next run.
+
+    python bulkocr.py ergImages/ergathon23/ --workers 8
+    python bulkocr.py ergImages/ergathon23/ --no-upload --manifest /tmp/ergathon23.manifest
+"""
+import argparse
 import json
-from google.cloud import storage
-from src.ocr import hit_textract_api
-
-# Specify the path to the folder containing your JPEG images
-folder_path = 'ergImages/ergathon23/'
-
-# List all files in the folder
-files = os.listdir(folder_path)
-
-# List all jpegs in folder
-jpeg_images = [file for file in files if file.lower().endswith('.jpeg') or file.lower().endswith('.jpg')]
-
-def textract_ocr(byte_array, photo_hash):
-    # Check if image is already in raw_ocr library
-    with open("src/rawocr.json", "r") as f:
-        raw_ocr_library = json.load(f)
-    library_entries = raw_ocr_library.keys()
-    # var below used for testing ocr - change to True for Prod
-    search_library = True
-    # If yes -> grab raw response
-    if search_library and photo_hash in library_entries:
-        # get raw data using photo_hash
-        raw_textract_resp = raw_ocr_library[photo_hash]
-        return False
-    # If no -> send to textract
-    else:
-        raw_textract_resp = hit_textract_api(byte_array)
-        # save raw_resp to raw_ocr library
-        with open("src/rawocr.json", "w") as f:
-            raw_ocr_library[photo_hash] = raw_textract_resp
-            json.dump(raw_ocr_library, f)
-    print('ocr complete: ', photo_hash)
-    return True
-    
-  
-def upload_blob_gcb(bucket_name: str, image_bytes: bytes, image_hash: str) -> None:
-    """Uploads erg_image to google cloud bucket if not already stored"""
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(image_hash)
-    if blob.exists():
-        print("Duplicate: blob already exists in bucket")
-    else:
-        blob.upload_from_string(image_bytes, "image/jpeg")
-        print(f"{image_hash} uploaded to {bucket_name}.")
-        
-def extract_and_save(image_list, folder_path):
-    processed_images = []
-    for image_name in image_list:
-        image_path = os.path.join(folder_path, image_name)
-        with open(image_path, 'rb') as image_file:
-            image_bytes = image_file.read()
-            # convert bytes to byte array & create photo_hash
-            byte_array = bytearray(image_bytes)
-            photo_hash = sha256(byte_array).hexdigest()
-            new_img = textract_ocr(byte_array, photo_hash)
-            if new_img:
-                upload_blob_gcb("erg_memory_screen_photos", image_bytes, photo_hash)
-        processed_images.append(image_name)
-    print(processed_images)
-
-extract_and_save(jpeg_images,folder_path)           
-        
+import os
+import queue
+import threading
+import time
+from hashlib import sha256
+from typing import Dict, List, Optional, Set
+
+from src.backends import BlobStore, OcrProvider, blob_store, ocr_provider
+from src.imageprep import prepare_for_ocr
+from src.ocrstore import RawOcrStore, raw_ocr_store
+
+DEFAULT_FOLDER = "ergImages/ergathon23/"
+DEFAULT_BUCKET = "erg_memory_screen_photos"
+MANIFEST_NAME = ".bulkocr_manifest.jsonl"
+STAGES = ["hash", "ocr", "store", "upload"]
+
+_STOP = object()
+
+
+def list_jpegs(folder_path: str) -> List[str]:
+    return sorted(file for file in os.listdir(folder_path) if file.lower().endswith((".jpeg", ".jpg")))
+
+
+class Manifest:
+    """Append-only record of finished photos - {"file", "photo_hash", "status", "error"} per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # torn last line from a crash mid-write
+                        continue
+                    if entry["status"] == "done":
+                        self.done.add(entry["file"])
+                    else:
+                        self.done.discard(entry["file"])
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+
+    def record(self, file_name: str, photo_hash: Optional[str], status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._file.write(json.dumps({"file": file_name, "photo_hash": photo_hash, "status": status, "error": error}) + "\n")
+            self._file.flush()
+            if status == "done":
+                self.done.add(file_name)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class StageStats:
+    def __init__(self):
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.first_start: Optional[float] = None
+        self.last_end = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, start: float, end: float, items: int = 1) -> None:
+        with self._lock:
+            self.items += items
+            self.busy_seconds += end - start
+            if self.first_start is None or start < self.first_start:
+                self.first_start = start
+            self.last_end = max(self.last_end, end)
+
+    def todict(self) -> dict:
+        with self._lock:
+            wall = self.last_end - self.first_start if self.first_start is not None else 0
+            return {
+                "items": self.items,
+                "per_second": round(self.items / wall, 1) if wall else 0,
+                "avg_ms": round(self.busy_seconds / self.items * 1000, 1) if self.items else 0,
+            }
+
+
+class _Photo:
+    __slots__ = ("file_name", "image_bytes", "photo_hash", "raw_response", "pending", "error")
+
+    def __init__(self, file_name: str, image_bytes: bytes, photo_hash: str):
+        self.file_name = file_name
+        self.image_bytes = image_bytes
+        self.photo_hash = photo_hash
+        self.raw_response: Optional[dict] = None
+        # stages still to finish before the photo is recorded as done
+        self.pending = 0
+        self.error: Optional[str] = None
+
+
+class BulkIngest:
+    def __init__(
+        self,
+        folder_path: str,
+        manifest: Manifest,
+        store: RawOcrStore = raw_ocr_store,
+        provider: OcrProvider = ocr_provider,
+        blobs: Optional[BlobStore] = blob_store,
+        bucket_name: str = DEFAULT_BUCKET,
+        workers: int = 8,
+        upload_workers: int = 4,
+        batch_size: int = 25,
+        batch_seconds: float = 2.0,
+    ):
+        self.folder_path = folder_path
+        self.manifest = manifest
+        self.store = store
+        self.provider = provider
+        # None -> OCR only, no uploads
+        self.blobs = blobs
+        self.bucket_name = bucket_name
+        self.workers = workers
+        self.upload_workers = upload_workers
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.stats: Dict[str, StageStats] = {stage: StageStats() for stage in STAGES}
+        self.ocr_calls = 0
+        self.cached = 0
+        self.failed = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def run(self, file_names: List[str]) -> dict:
+        pending = [name for name in file_names if name not in self.manifest.done]
+        print(f"{len(file_names)} photos, {len(file_names) - len(pending)} already done, {len(pending)} to ingest")
+        t1 = time.perf_counter()
+        ocr_queue: queue.Queue = queue.Queue(maxsize=self.workers * 2)
+        store_queue: queue.Queue = queue.Queue(maxsize=self.batch_size * 4)
+        upload_queue: queue.Queue = queue.Queue(maxsize=self.upload_workers * 2)
+
+        threads = [threading.Thread(target=self._hash_stage, args=(pending, ocr_queue), daemon=True)]
+        threads += [
+            threading.Thread(target=self._ocr_stage, args=(ocr_queue, store_queue, upload_queue), daemon=True)
+            for _ in range(self.workers)
+        ]
+        store_thread = threading.Thread(target=self._store_stage, args=(store_queue,), daemon=True)
+        upload_threads = [
+            threading.Thread(target=self._upload_stage, args=(upload_queue,), daemon=True)
+            for _ in range(self.upload_workers if self.blobs is not None else 0)
+        ]
+        for thread in threads + [store_thread] + upload_threads:
+            thread.start()
+        # hash + ocr stages finish first, then the stages they feed are told to drain and stop
+        for thread in threads:
+            thread.join()
+        store_queue.put(_STOP)
+        for _ in upload_threads:
+            upload_queue.put(_STOP)
+        store_thread.join()
+        for thread in upload_threads:
+            thread.join()
+
+        summary = {
+            "photos": len(pending),
+            "completed": self.completed,
+            "failed": self.failed,
+            "ocr_calls": self.ocr_calls,
+            "cached": self.cached,
+            "seconds": round(time.perf_counter() - t1, 1),
+            "stages": {stage: stage_stats.todict() for stage, stage_stats in self.stats.items()},
+        }
+        return summary
+
+    def _hash_stage(self, file_names: List[str], ocr_queue: queue.Queue) -> None:
+        try:
+            for file_name in file_names:
+                start = time.perf_counter()
+                try:
+                    with open(os.path.join(self.folder_path, file_name), "rb") as f:
+                        image_bytes = f.read()
+                except OSError as e:
+                    self._fail(_Photo(file_name, b"", None), f"read failed, {e}")
+                    continue
+                photo = _Photo(file_name, image_bytes, sha256(image_bytes).hexdigest())
+                self.stats["hash"].add(start, time.perf_counter())
+                ocr_queue.put(photo)
+        finally:
+            # always stop the ocr workers - run() joins them
+            for _ in range(self.workers):
+                ocr_queue.put(_STOP)
+
+    def _ocr_stage(self, ocr_queue: queue.Queue, store_queue: queue.Queue, upload_queue: queue.Queue) -> None:
+        while True:
+            photo = ocr_queue.get()
+            if photo is _STOP:
+                return
+            start = time.perf_counter()
+            try:
+                new_response = photo.photo_hash not in self.store
+                if new_response:
+                    photo.raw_response = self.provider.analyze(prepare_for_ocr(photo.image_bytes), photo.photo_hash)
+            except Exception as e:
+                self._fail(photo, f"ocr failed, {getattr(e, 'message', e)}")
+                continue
+            self.stats["ocr"].add(start, time.perf_counter())
+            with self._lock:
+                if new_response:
+                    self.ocr_calls += 1
+                else:
+                    self.cached += 1
+            photo.pending = int(new_response) + int(self.blobs is not None)
+            if not photo.pending:
+                self._finish_stage(photo)
+                continue
+            if new_response:
+                store_queue.put(photo)
+            if self.blobs is not None:
+                upload_queue.put(photo)
+
+    def _store_stage(self, store_queue: queue.Queue) -> None:
+        batch: List[_Photo] = []
+        stopping = False
+        while not stopping:
+            # flush a batch when it's full, or when no new response arrived for batch_seconds
+            try:
+                photo = store_queue.get(timeout=self.batch_seconds)
+            except queue.Empty:
+                photo = None
+            if photo is _STOP:
+                stopping = True
+            elif photo is not None:
+                batch.append(photo)
+                if len(batch) < self.batch_size:
+                    continue
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                self.store.put_many((photo.photo_hash, photo.raw_response) for photo in batch)
+            except Exception as e:
+                for photo in batch:
+                    self._fail(photo, f"store failed, {e}")
+            else:
+                self.stats["store"].add(start, time.perf_counter(), items=len(batch))
+                for photo in batch:
+                    # the response is committed - only the upload still needs it
+                    photo.raw_response = None
+                    self._finish_stage(photo)
+            batch = []
+
+    def _upload_stage(self, upload_queue: queue.Queue) -> None:
+        while True:
+            photo = upload_queue.get()
+            if photo is _STOP:
+                return
+            start = time.perf_counter()
+            try:
+                self.blobs.put_if_absent(self.bucket_name, photo.image_bytes, photo.photo_hash)
+            except Exception as e:
+                self._fail(photo, f"upload failed, {e}")
+                continue
+            self.stats["upload"].add(start, time.perf_counter())
+            photo.image_bytes = b""
+            self._finish_stage(photo)
+
+    def _finish_stage(self, photo: _Photo) -> None:
+        with self._lock:
+            photo.pending -= 1
+            if photo.pending > 0 or photo.error is not None:
+                return
+            self.completed += 1
+            completed = self.completed
+        self.manifest.record(photo.file_name, photo.photo_hash, "done")
+        if completed % 100 == 0:
+            print(f"{completed} photos done")
+
+    def _fail(self, photo: _Photo, error: str) -> None:
+        with self._lock:
+            # a photo whose store and upload both fail is only recorded once
+            if photo.error is not None:
+                return
+            photo.error = error
+            self.failed += 1
+        print(f"{photo.file_name}: {error}")
+        self.manifest.record(photo.file_name, photo.photo_hash, "failed", error)
+
+
+def print_summary(summary: dict) -> None:
+    print(
+        f"{summary['completed']}/{summary['photos']} photos ingested in {summary['seconds']}s, "
+        f"{summary['failed']} failed, {summary['ocr_calls']} OCR calls, {summary['cached']} already in the store"
+    )
+    for stage, stage_stats in summary["stages"].items():
+        print(f"  {stage:<7} {stage_stats['items']:>6} items  {stage_stats['per_second']:>7} /s  {stage_stats['avg_ms']:>8} ms avg")
+
 
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="OCR and upload a folder of erg photos")
+    parser.add_argument("folder", nargs="?", default=DEFAULT_FOLDER)
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    parser.add_argument("--workers", type=int, default=8, help="concurrent OCR calls")
+    parser.add_argument("--upload-workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=25, help="responses per raw OCR store transaction")
+    parser.add_argument("--manifest", help=f"progress file, defaults to <folder>/{MANIFEST_NAME}")
+    parser.add_argument("--no-upload", action="store_true", help="OCR only, skip the blob store")
+    args = parser.parse_args(argv)
 
+    manifest = Manifest(args.manifest or os.path.join(args.folder, MANIFEST_NAME))
+    ingest = BulkIngest(
+        args.folder,
+        manifest,
+        blobs=None if args.no_upload else blob_store,
+        bucket_name=args.bucket,
+        workers=args.workers,
+        upload_workers=args.upload_workers,
+        batch_size=args.batch_size,
+    )
+    try:
+        summary = ingest.run(list_jpegs(args.folder))
+    finally:
+        manifest.close()
+    print_summary(summary)
+    return 1 if summary["failed"] else 0
 
 
+if __name__ == "__main__":
+    raise SystemExit(main())
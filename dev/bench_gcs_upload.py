@@ -0,0 +1,65 @@
+"""
+Per-upload latency of the old upload path (new storage.Client + blob.exists() + upload per image)
+vs the shared client with a single conditional create-if-absent request.
+
+Needs GCP credentials and a scratch bucket:
+    python dev/bench_gcs_upload.py --bucket my-scratch-bucket --uploads 20
+"""
+import sys
+sys.path.append('.')
+import argparse
+import os
+import statistics
+import time
+import uuid
+from google.cloud import storage
+from src.gcs import GcsUploader
+
+
+def old_upload(bucket_name, image_bytes, image_hash):
+    storage_client = storage.Client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(image_hash)
+    if not blob.exists():
+        blob.upload_from_string(image_bytes, "image/jpeg")
+
+
+def time_uploads(upload, bucket_name, image_bytes, names):
+    latencies = []
+    for name in names:
+        t1 = time.perf_counter()
+        upload(bucket_name, image_bytes, name)
+        latencies.append((time.perf_counter() - t1) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{label:<28} mean {statistics.mean(latencies):7.1f}ms  p50 {statistics.median(latencies):7.1f}ms  p95 {p95:7.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--image", default="tests/erg-screen.jpeg")
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    new_names = [f"{prefix}-new-{i}" for i in range(args.uploads)]
+    old_names = [f"{prefix}-old-{i}" for i in range(args.uploads)]
+    uploader = GcsUploader()
+    upload_new = lambda bucket_name, data, name: uploader.upload_if_absent(bucket_name, data, name)
+
+    report("old: new blob", time_uploads(old_upload, args.bucket, image_bytes, old_names))
+    report("shared client: new blob", time_uploads(upload_new, args.bucket, image_bytes, new_names))
+    report("old: duplicate", time_uploads(old_upload, args.bucket, image_bytes, old_names))
+    report("shared client: duplicate", time_uploads(upload_new, args.bucket, image_bytes, new_names))
+
+    bucket = storage.Client().bucket(args.bucket)
+    for name in old_names + new_names:
+        bucket.blob(name).delete()
+    print(f"{os.path.getsize(args.image)} byte image, {args.uploads} uploads per case")
@@ -0,0 +1,69 @@
+"""
+Time process_raw_ocr over the cached raw OCR library.
+
+    python dev/bench_ocr_parse.py                      # every entry in raw_ocr_db_path
+    python dev/bench_ocr_parse.py --json src/ocrlibrary.json dev/sandbox.json --repeat 200
+
+Logging below WARNING is disabled so log rendering doesn't dominate the timings.
+"""
+import sys
+sys.path.append('.')
+import argparse
+import json
+import logging
+import statistics
+import time
+import structlog
+from src.ocr import build_document_index, extract_metadata, extract_table_data, process_raw_ocr
+from src.ocrstore import raw_ocr_store
+
+
+def load_responses(json_paths):
+    if not json_paths:
+        return [raw_ocr_store.get(photo_hash) for photo_hash in raw_ocr_store.photo_hashes()]
+    responses = []
+    for path in json_paths:
+        with open(path, "r") as f:
+            library = json.load(f)
+        responses.extend(value for value in library.values() if isinstance(value, dict) and "Blocks" in value)
+    return responses
+
+
+def time_per_call(fn, responses, repeat):
+    per_call = []
+    for raw_response in responses:
+        t1 = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                fn(raw_response)
+            except Exception:
+                pass
+        per_call.append((time.perf_counter() - t1) / repeat * 1000)
+    return per_call
+
+
+def block_stages(raw_response):
+    # the stages that walk the Textract blocks
+    doc_index = build_document_index(raw_response)
+    extract_table_data(doc_index)
+    extract_metadata(doc_index)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--json", nargs="*", help="JSON libraries instead of raw_ocr_db_path")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    responses = load_responses(args.json)
+    if not responses:
+        raise SystemExit("no raw OCR responses found")
+    blocks = statistics.mean(len(raw_response["Blocks"]) for raw_response in responses)
+    print(f"{len(responses)} responses, {blocks:.0f} blocks on average, {args.repeat} runs each")
+    for label, fn in [
+        ("block stages", block_stages),
+        ("process_raw_ocr", lambda raw_response: process_raw_ocr(raw_response, "bench", False)),
+    ]:
+        per_call = time_per_call(fn, responses, args.repeat)
+        print(f"{label:<16} mean {statistics.mean(per_call):.3f}ms  max {max(per_call):.3f}ms per response")
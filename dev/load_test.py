@@ -0,0 +1,121 @@
+"""
+Load test the /ergImage pipeline, reporting throughput and p50/p95/p99 latency.
+
+Run offline with the stand-in backends (config/config.yaml):
+    backends: {ocr: replay, blob_store: filesystem}
+and raw_ocr_db_path pointed at a scratch db so replayed responses don't land in the real library.
+
+    # in process: OCR + parsing only, no API server or database needed
+    python dev/load_test.py --in-process --requests 200 --concurrency 16
+    # against a running API server (uploads go through the full endpoint)
+    python dev/load_test.py --url http://localhost:8000/ergImage --requests 200 --concurrency 16
+
+--unique appends random bytes after each JPEG's end marker so every request misses the OCR cache.
+Against a server, also set near_dup.enabled: false there - it reuses OCR for the same JPEG image data.
+"""
+import sys
+sys.path.append('.')
+import argparse
+import glob
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_images(image_dir):
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jp*g")))
+    if not paths:
+        raise SystemExit(f"no jpegs in {image_dir}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def make_request_images(images, n, unique):
+    request_images = []
+    for i in range(n):
+        image_bytes = images[i % len(images)]
+        # bytes after the JPEG EOI marker are ignored by decoders but change the sha256
+        request_images.append(image_bytes + os.urandom(16) if unique else image_bytes)
+    return request_images
+
+
+def in_process_request(image_bytes):
+    from src.admission import CLI_TENANT
+    from src.helper import create_photo_hash, extract_and_process_erg_images
+
+    photo_hash = create_photo_hash(image_bytes)
+    extract_and_process_erg_images([image_bytes], [photo_hash], None, False, 8, CLI_TENANT)
+
+
+def http_request(url, token, image_bytes):
+    import requests
+
+    resp = requests.post(
+        url,
+        files={"photo1": ("erg.jpeg", image_bytes, "image/jpeg")},
+        headers={"Authorization": token},
+        params={"numSubs": 8},
+        timeout=60,
+    )
+    if resp.status_code != 200:
+        raise RuntimeError(f"{resp.status_code}: {resp.text[:200]}")
+
+
+def run(send, request_images, concurrency):
+    def timed(image_bytes):
+        t1 = time.perf_counter()
+        try:
+            send(image_bytes)
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - t1, ok
+
+    t1 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, request_images))
+    return time.perf_counter() - t1, results
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image-dir", default="tests")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--unique", action="store_true")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--in-process", action="store_true")
+    mode.add_argument("--url")
+    parser.add_argument("--auth-uid", default="fake-auth-uid")
+    args = parser.parse_args()
+
+    request_images = make_request_images(load_images(args.image_dir), args.requests, args.unique)
+    if args.in_process:
+        from src.backends import ocr_provider, blob_store
+
+        print(f"backends: ocr={ocr_provider.name} blob_store={blob_store.name}")
+        send = in_process_request
+    else:
+        from tests.utils import generate_token
+
+        token = generate_token(args.auth_uid)
+        send = lambda image_bytes: http_request(args.url, token, image_bytes)
+
+    elapsed, results = run(send, request_images, args.concurrency)
+    latencies = sorted(duration * 1000 for duration, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+    print(f"{len(results)} requests, concurrency {args.concurrency}, {elapsed:.1f}s")
+    print(f"throughput {len(results) / elapsed:.1f} req/s, errors {errors} ({errors / len(results):.1%})")
+    if latencies:
+        print(
+            f"latency ms: mean {statistics.mean(latencies):.0f}  p50 {percentile(latencies, 50):.0f}  "
+            f"p95 {percentile(latencies, 95):.0f}  p99 {percentile(latencies, 99):.0f}  max {latencies[-1]:.0f}"
+        )
@@ -0,0 +1,191 @@
+"""
+Replay benchmark + golden-output regression runner for the OCR parser.
+
+Pushes every cached Textract response through process_raw_ocr (with and without ints_var),
+records per-stage timings and throughput and compares outputs with stored golden results.
+
+    # compare against tests/golden/ocr_outputs.json (the corpus tests/test_golden.py uses)
+    python dev/replay_bench.py --json src/ocrlibrary.json dev/sandbox.json
+    # regenerate goldens after an intended output change - review the diff before committing
+    python dev/replay_bench.py --json src/ocrlibrary.json dev/sandbox.json --update-golden
+    # whole raw OCR library across 8 processes, fail if >20% slower than the saved baseline
+    python dev/replay_bench.py --workers 8 --golden none --baseline dev/replay_baseline.json --max-regression 0.2
+    python dev/replay_bench.py --workers 8 --golden none --baseline dev/replay_baseline.json --save-baseline
+
+Exits 1 on golden mismatches or a throughput regression.
+"""
+import sys
+sys.path.append('.')
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+DEFAULT_GOLDEN_PATH = "tests/golden/ocr_outputs.json"
+STAGES = ["index", "table", "workout", "metadata", "output"]
+
+
+def load_json_libraries(json_paths: Iterable[str]) -> Dict[str, dict]:
+    """{key: raw response} from legacy {photo_hash: response} json files, non-response entries skipped"""
+    responses = {}
+    for path in json_paths:
+        with open(path, "r") as f:
+            library = json.load(f)
+        for key, value in library.items():
+            if isinstance(value, dict) and "Blocks" in value:
+                responses[key] = value
+    return responses
+
+
+def load_store_keys() -> List[str]:
+    from src.ocrstore import raw_ocr_store
+
+    return raw_ocr_store.photo_hashes()
+
+
+def golden_key(key: str, ints_var: bool) -> str:
+    return f"{key}|ints_var={ints_var}"
+
+
+def replay(raw_response: dict, ints_var: bool) -> Tuple[dict, Dict[str, float], float]:
+    """Returns (json compatible output or error description, stage timings, total seconds)"""
+    from fastapi.encoders import jsonable_encoder
+    from src.ocr import process_raw_ocr
+    from src.schemas import CustomError
+
+    timings: Dict[str, float] = {}
+    t1 = time.perf_counter()
+    try:
+        output = jsonable_encoder(process_raw_ocr(raw_response, "replay", ints_var, timings=timings))
+    except CustomError as e:
+        output = {"error": {"type": "CustomError", "status_code": e.status_code, "message": e.message}}
+    except Exception as e:
+        output = {"error": {"type": type(e).__name__, "message": str(e)}}
+    return output, timings, time.perf_counter() - t1
+
+
+def replay_all(responses: Dict[str, dict], repeat: int = 1) -> Dict[str, tuple]:
+    """{golden key: (output, timings, seconds)} - timings/seconds averaged over repeat runs"""
+    results = {}
+    for key, raw_response in responses.items():
+        for ints_var in (False, True):
+            runs = [replay(raw_response, ints_var) for _ in range(repeat)]
+            timings = {stage: sum(run[1].get(stage, 0.0) for run in runs) / repeat for stage in STAGES}
+            results[golden_key(key, ints_var)] = (runs[0][0], timings, sum(run[2] for run in runs) / repeat)
+    return results
+
+
+def _replay_chunk(args) -> Dict[str, tuple]:
+    json_paths, keys, repeat = args
+    # quiet workers - log rendering would dominate the timings
+    import structlog
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    if json_paths:
+        library = load_json_libraries(json_paths)
+        responses = {key: library[key] for key in keys}
+    else:
+        from src.ocrstore import raw_ocr_store
+
+        responses = {key: raw_ocr_store.get(key) for key in keys}
+    return replay_all(responses, repeat)
+
+
+def run(json_paths: List[str], workers: int, repeat: int) -> Tuple[Dict[str, tuple], float]:
+    keys = list(load_json_libraries(json_paths)) if json_paths else load_store_keys()
+    if not keys:
+        raise SystemExit("no raw OCR responses found")
+    t1 = time.perf_counter()
+    if workers <= 1:
+        results = _replay_chunk((json_paths, keys, repeat))
+    else:
+        # workers load their own responses - only keys cross the process boundary
+        chunk_size = max(1, len(keys) // (workers * 4))
+        chunks = [(json_paths, keys[i:i + chunk_size], repeat) for i in range(0, len(keys), chunk_size)]
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_results in executor.map(_replay_chunk, chunks):
+                results.update(chunk_results)
+    return results, time.perf_counter() - t1
+
+
+def compare_to_golden(outputs: Dict[str, dict], golden: Dict[str, dict]) -> List[str]:
+    problems = []
+    for key, output in outputs.items():
+        if key not in golden:
+            problems.append(f"{key}: no golden output")
+        elif output != golden[key]:
+            problems.append(f"{key}: output differs\n  golden: {json.dumps(golden[key])}\n  actual: {json.dumps(output)}")
+    for key in golden.keys() - outputs.keys():
+        problems.append(f"{key}: golden output but response missing from corpus")
+    return problems
+
+
+def report(results: Dict[str, tuple], elapsed: float, workers: int, repeat: int) -> float:
+    """Print throughput + stage timings, returns mean ms per process_raw_ocr call"""
+    per_call_ms = [seconds * 1000 for _, _, seconds in results.values()]
+    mean_ms = statistics.mean(per_call_ms)
+    calls = len(results) * repeat
+    errors = sum(1 for output, _, _ in results.values() if "error" in output)
+    print(f"{len(results)} replays ({errors} errors), {workers} worker(s), {elapsed:.2f}s wall")
+    print(f"throughput {calls / elapsed:.0f} calls/s, {1000 / mean_ms:.0f} calls/s per worker")
+    sorted_ms = sorted(per_call_ms)
+    p95 = sorted_ms[int(0.95 * (len(sorted_ms) - 1))]
+    print(f"process_raw_ocr mean {mean_ms:.3f}ms  p95 {p95:.3f}ms  max {sorted_ms[-1]:.3f}ms")
+    for stage in STAGES:
+        stage_ms = [timings.get(stage, 0.0) * 1000 for _, timings, _ in results.values()]
+        print(f"  {stage:<9} mean {statistics.mean(stage_ms):.3f}ms")
+    return mean_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--json", nargs="*", default=[], help="JSON libraries instead of the raw OCR store")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20, help="runs per response, timings are averaged")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN_PATH, help="golden outputs file, 'none' to skip")
+    parser.add_argument("--update-golden", action="store_true")
+    parser.add_argument("--baseline", help="json file with the reference mean ms per call")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown vs baseline")
+    args = parser.parse_args()
+
+    results, elapsed = run(args.json, args.workers, args.repeat)
+    mean_ms = report(results, elapsed, args.workers, args.repeat)
+    failed = False
+
+    outputs = {key: output for key, (output, _, _) in results.items()}
+    if args.golden != "none":
+        if args.update_golden:
+            os.makedirs(os.path.dirname(args.golden), exist_ok=True)
+            with open(args.golden, "w") as f:
+                json.dump(outputs, f, indent=1, sort_keys=True)
+                f.write("\n")
+            print(f"wrote {len(outputs)} golden outputs to {args.golden}")
+        else:
+            with open(args.golden, "r") as f:
+                problems = compare_to_golden(outputs, json.load(f))
+            for problem in problems:
+                print(problem)
+            print(f"golden: {len(outputs) - len(problems)}/{len(outputs)} match")
+            failed |= bool(problems)
+
+    if args.baseline:
+        if args.save_baseline:
+            with open(args.baseline, "w") as f:
+                json.dump({"mean_ms_per_call": mean_ms}, f)
+            print(f"saved baseline {mean_ms:.3f}ms per call")
+        else:
+            with open(args.baseline, "r") as f:
+                baseline_ms = json.load(f)["mean_ms_per_call"]
+            slowdown = mean_ms / baseline_ms - 1
+            print(f"vs baseline {baseline_ms:.3f}ms: {slowdown:+.1%}")
+            if slowdown > args.max_regression:
+                print(f"throughput regression beyond {args.max_regression:.0%}")
+                failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,199 @@
+"""
+Admission control and per-tenant fair queueing for OCR provider calls.
+
+A global budget of concurrent Textract calls is shared between tenants (uploading user, or
+their team). When the budget is used up, callers queue per tenant and freed slots are handed
+out round-robin across tenants - one coach bulk-uploading a regatta only queues behind
+themselves. Callers are rejected straight away with a 429 + Retry-After when their tenant's
+queue or the overall queue is full, or when they've waited longer than max_wait_seconds.
+
+Tenant keys contain auth_uids / team ids, so stats() (served unauthenticated on /stats) only
+reports totals - per-tenant counters are read with tenant_stats(). Counters of tenants idle for
+tenant_stats_ttl_seconds are dropped.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Iterator, Optional
+import yaml
+import structlog
+
+from src.cache import TtlCache
+from src.schemas import CustomError
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+ADMISSION_CONFIG = config_data.get("ocr_admission", {})
+ADMISSION_MAX_CONCURRENT = ADMISSION_CONFIG.get("max_concurrent", 8)
+ADMISSION_MAX_QUEUE_PER_TENANT = ADMISSION_CONFIG.get("max_queue_per_tenant", 16)
+ADMISSION_MAX_QUEUE = ADMISSION_CONFIG.get("max_queue", 64)
+ADMISSION_MAX_WAIT_SECONDS = ADMISSION_CONFIG.get("max_wait_seconds", 30)
+# "user": each uploader is a tenant, "team": uploads from the same team share a queue
+ADMISSION_TENANT_KEY = ADMISSION_CONFIG.get("tenant_key", "user")
+ADMISSION_TENANT_STATS_MAX_ENTRIES = ADMISSION_CONFIG.get("tenant_stats_max_entries", 10000)
+ADMISSION_TENANT_STATS_TTL_SECONDS = ADMISSION_CONFIG.get("tenant_stats_ttl_seconds", 3600)
+
+log = structlog.get_logger()
+
+# tenant of in-process callers without a signed-in user (dev scripts, load tests)
+CLI_TENANT = "cli"
+
+
+def ocr_tenant(auth_uid: str, team_id: Optional[int] = None) -> str:
+    if ADMISSION_TENANT_KEY == "team" and team_id is not None:
+        return f"team:{team_id}"
+    return f"user:{auth_uid}"
+
+
+class _Waiter:
+    def __init__(self):
+        self.granted = threading.Event()
+
+
+class TenantStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.queued = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+
+    def todict(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queued": self.queued,
+            "avg_queue_ms": round(self.queue_seconds / self.admitted * 1000, 1) if self.admitted else 0,
+            "max_queue_ms": round(self.max_queue_seconds * 1000, 1),
+        }
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_queue_per_tenant: int = ADMISSION_MAX_QUEUE_PER_TENANT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS,
+        tenant_stats_max_entries: int = ADMISSION_TENANT_STATS_MAX_ENTRIES,
+        tenant_stats_ttl_seconds: float = ADMISSION_TENANT_STATS_TTL_SECONDS,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue_per_tenant = max_queue_per_tenant
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self._free_slots = max_concurrent
+        # tenant -> its waiters, in rotation order: the first tenant is served next
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._waiting = 0
+        self._tenant_stats = TtlCache(tenant_stats_max_entries, tenant_stats_ttl_seconds)
+        # smoothed slot hold time, used for the Retry-After estimate
+        self._avg_hold_seconds = 1.0
+
+    def _stats_for(self, tenant: str) -> TenantStats:
+        tenant_stats = self._tenant_stats.get(tenant)
+        if tenant_stats is None:
+            tenant_stats = TenantStats()
+        # stored again on every request, so the ttl runs from the tenant's last request
+        self._tenant_stats.put(tenant, tenant_stats)
+        return tenant_stats
+
+    def _retry_after(self) -> int:
+        # time for the current queue to drain through the slot budget
+        return max(1, math.ceil(self._avg_hold_seconds * (self._waiting + 1) / self.max_concurrent))
+
+    def _reject(self, tenant: str, reason: str) -> CustomError:
+        self._stats_for(tenant).rejected += 1
+        log.warning("OCR request rejected", tenant=tenant, reason=reason, waiting=self._waiting)
+        return CustomError(status_code=429, message=f"Too many OCR requests, {reason}", retry_after=self._retry_after())
+
+    def _acquire(self, tenant: str) -> None:
+        t1 = time.monotonic()
+        with self._lock:
+            tenant_stats = self._stats_for(tenant)
+            if self._free_slots > 0 and not self._waiting:
+                self._free_slots -= 1
+                tenant_stats.admitted += 1
+                return
+            queue = self._queues.get(tenant)
+            if self._waiting >= self.max_queue:
+                raise self._reject(tenant, "queue full")
+            if queue is not None and len(queue) >= self.max_queue_per_tenant:
+                raise self._reject(tenant, "too many queued requests for this user")
+            waiter = _Waiter()
+            if queue is None:
+                queue = self._queues[tenant] = deque()
+            queue.append(waiter)
+            self._waiting += 1
+            tenant_stats.queued += 1
+        granted = waiter.granted.wait(self.max_wait_seconds)
+        queue_seconds = time.monotonic() - t1
+        with self._lock:
+            tenant_stats.queued -= 1
+            if not granted and not waiter.granted.is_set():
+                # still queued - withdraw, the slot was never handed to us
+                queue.remove(waiter)
+                if not queue and self._queues.get(tenant) is queue:
+                    del self._queues[tenant]
+                self._waiting -= 1
+                raise self._reject(tenant, "timed out waiting for a slot")
+            tenant_stats.admitted += 1
+            tenant_stats.queue_seconds += queue_seconds
+            tenant_stats.max_queue_seconds = max(tenant_stats.max_queue_seconds, queue_seconds)
+
+    def _release(self, hold_seconds: float) -> None:
+        with self._lock:
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * hold_seconds
+            if not self._queues:
+                self._free_slots += 1
+                return
+            # hand the slot straight to the next tenant in rotation, then move them to the back
+            tenant, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[tenant] = queue
+            self._waiting -= 1
+            waiter.granted.set()
+
+    @contextmanager
+    def slot(self, tenant: str) -> Iterator[None]:
+        """Hold one of the global OCR slots - raises CustomError 429 if the tenant can't be admitted"""
+        self._acquire(tenant)
+        t1 = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - t1)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained - for callers giving up on OCR"""
+        with self._lock:
+            return self._retry_after()
+
+    def tenant_stats(self, tenant: str) -> Optional[dict]:
+        """One tenant's counters, None if it has been idle for tenant_stats_ttl_seconds"""
+        with self._lock:
+            tenant_stats = self._tenant_stats.get(tenant)
+            return tenant_stats.todict() if tenant_stats is not None else None
+
+    def stats(self) -> dict:
+        """Totals only - safe to publish, no tenant keys"""
+        with self._lock:
+            tenants = self._tenant_stats.values()
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_use": self.max_concurrent - self._free_slots,
+                "waiting": self._waiting,
+                "tenants": len(tenants),
+                "admitted": sum(tenant_stats.admitted for tenant_stats in tenants),
+                "rejected": sum(tenant_stats.rejected for tenant_stats in tenants),
+                "max_queue_ms": round(max((t.max_queue_seconds for t in tenants), default=0) * 1000, 1),
+            }
+
+
+ocr_admission = FairScheduler()
@@ -0,0 +1,174 @@
+"""
+Pluggable OCR provider and blob store backends.
+
+Production uses AWS Textract + GCS. For offline load tests the replay OCR provider serves
+responses from a raw OCR library with configurable latency, jitter and error rate, and the
+filesystem blob store writes photos to a local directory - see dev/load_test.py.
+"""
+import os
+import random
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import List, Optional
+import yaml
+import structlog
+
+from src.gcs import GcsUploader, gcs_uploader
+from src.ocr import hit_textract_api, textract_caller
+from src.ocrstore import RawOcrStore, RAW_OCR_DB_PATH
+from src.resilience import ResilientCaller, RetryableError, PERMANENT, THROTTLE
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+BACKENDS_CONFIG = config_data.get("backends", {})
+OCR_BACKEND = BACKENDS_CONFIG.get("ocr", "textract")
+BLOB_BACKEND = BACKENDS_CONFIG.get("blob_store", "gcs")
+REPLAY_CONFIG = BACKENDS_CONFIG.get("replay", {})
+FILESYSTEM_BLOB_ROOT = BACKENDS_CONFIG.get("filesystem_root", "blobstore")
+
+log = structlog.get_logger()
+
+
+class OcrProvider(ABC):
+    name = "ocr"
+
+    @abstractmethod
+    def analyze(self, image_bytes: bytes, photo_hash: str) -> dict:
+        """Raw Textract-format response (dict with "Blocks") for the image"""
+
+
+class TextractOcrProvider(OcrProvider):
+    name = "textract"
+
+    def analyze(self, image_bytes: bytes, photo_hash: str) -> dict:
+        return hit_textract_api(bytearray(image_bytes))
+
+
+class ReplayOcrProvider(OcrProvider):
+    """
+    Textract stand-in: returns the library's response for photo_hash if it has one, otherwise
+    a library entry picked deterministically from the hash - so any photo gets a realistic response.
+    Calls go through the same retry / concurrency / circuit breaker layer as Textract.
+    """
+
+    name = "replay"
+
+    def __init__(
+        self,
+        library: RawOcrStore,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        error_kind: str = THROTTLE,
+        seed: Optional[int] = None,
+        caller: ResilientCaller = textract_caller,
+    ):
+        self.library = library
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.caller = caller
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._photo_hashes: Optional[List[str]] = None
+
+    def _library_hashes(self) -> List[str]:
+        if self._photo_hashes is None:
+            self._photo_hashes = self.library.photo_hashes()
+        return self._photo_hashes
+
+    def analyze(self, image_bytes: bytes, photo_hash: str) -> dict:
+        return self.caller.call(self._replay, photo_hash)
+
+    def _replay(self, photo_hash: str) -> dict:
+        with self._random_lock:
+            delay_ms = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay_ms / 1000)
+        if failed:
+            if self.error_kind == PERMANENT:
+                raise ValueError("injected replay error")
+            raise RetryableError("injected replay error", kind=self.error_kind)
+        raw_response = self.library.get(photo_hash)
+        if raw_response is None:
+            photo_hashes = self._library_hashes()
+            if not photo_hashes:
+                raise ValueError("replay library is empty")
+            # crc32 rather than hash() - stable across processes and runs
+            raw_response = self.library.get(photo_hashes[zlib.crc32(photo_hash.encode()) % len(photo_hashes)])
+        return raw_response
+
+
+class BlobStore(ABC):
+    name = "blob_store"
+
+    @abstractmethod
+    def put_if_absent(self, bucket_name: str, data: bytes, blob_name: str, content_type: str = "image/jpeg") -> bool:
+        """Store data unless blob_name already exists. Returns False for duplicates"""
+
+
+class GcsBlobStore(BlobStore):
+    name = "gcs"
+
+    def __init__(self, uploader: GcsUploader = gcs_uploader):
+        self.uploader = uploader
+
+    def put_if_absent(self, bucket_name: str, data: bytes, blob_name: str, content_type: str = "image/jpeg") -> bool:
+        return self.uploader.upload_if_absent(bucket_name, data, blob_name, content_type)
+
+
+class FilesystemBlobStore(BlobStore):
+    """Buckets are directories under root, blobs are files"""
+
+    name = "filesystem"
+
+    def __init__(self, root: str = FILESYSTEM_BLOB_ROOT):
+        self.root = root
+
+    def put_if_absent(self, bucket_name: str, data: bytes, blob_name: str, content_type: str = "image/jpeg") -> bool:
+        bucket_dir = os.path.join(self.root, bucket_name)
+        os.makedirs(bucket_dir, exist_ok=True)
+        path = os.path.join(bucket_dir, blob_name)
+        # write under a temp name and hard link into place - readers never see a partial blob
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        try:
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+
+def build_ocr_provider(backend: str = OCR_BACKEND) -> OcrProvider:
+    if backend == "textract":
+        return TextractOcrProvider()
+    if backend == "replay":
+        return ReplayOcrProvider(
+            RawOcrStore(REPLAY_CONFIG.get("library_path", RAW_OCR_DB_PATH)),
+            latency_ms=REPLAY_CONFIG.get("latency_ms", 0),
+            jitter_ms=REPLAY_CONFIG.get("jitter_ms", 0),
+            error_rate=REPLAY_CONFIG.get("error_rate", 0),
+            error_kind=REPLAY_CONFIG.get("error_kind", THROTTLE),
+            seed=REPLAY_CONFIG.get("seed"),
+        )
+    raise ValueError(f"unknown OCR backend {backend}")
+
+
+def build_blob_store(backend: str = BLOB_BACKEND) -> BlobStore:
+    if backend == "gcs":
+        return GcsBlobStore()
+    if backend == "filesystem":
+        return FilesystemBlobStore()
+    raise ValueError(f"unknown blob store backend {backend}")
+
+
+ocr_provider = build_ocr_provider()
+blob_store = build_blob_store()
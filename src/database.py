@@ -6,11 +6,12 @@ from sqlalchemy import (
     ForeignKey,
     Date,
     Boolean,
-    Float
+    Float,
+    Index,
 )
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 
 Base = declarative_base()
@@ -25,9 +26,9 @@ class AthleteTable(Base):
         primary_key=True,
         server_default="nextval('user_user_id_seq')",
     )
-    auth_uid = Column(String)  # from firebase
+    auth_uid = Column(String, unique=True, index=True)  # from firebase
     user_name = Column(String)  # from firebase or edited by user
-    email = Column(String)  # from firebase
+    email = Column(String, index=True)  # from firebase
     last_post = Column(Date)
     dob = Column(Date)
     sex = Column(String)
@@ -35,7 +36,7 @@ class AthleteTable(Base):
     para_class = Column(String)
     country = Column(String)
     joined = Column(Date, server_default=func.now())
-    team = Column(Integer, ForeignKey("team.team_id"))
+    team = Column(Integer, ForeignKey("team.team_id"), index=True)
     team_admin = Column(Boolean)
 
     def __repr__(self):
@@ -61,6 +62,10 @@ class AthleteTable(Base):
 
 class WorkoutLogTable(Base):
     __tablename__ = "workout_log"
+    __table_args__ = (
+        # team workout feeds only read posted workouts
+        Index("ix_workout_log_posted_user_id", "user_id", postgresql_where=text("post_to_team")),
+    )
 
     workout_id = Column(
         Integer,
@@ -68,7 +73,7 @@ class WorkoutLogTable(Base):
         primary_key=True,
         server_default="nextval('workout_log_workout_id_seq')",
     )
-    user_id = Column(Integer, ForeignKey("athlete.user_id"))
+    user_id = Column(Integer, ForeignKey("athlete.user_id"), index=True)
     description = Column(String)
     date = Column(Date)
     time = Column(String)
@@ -84,6 +89,9 @@ class WorkoutLogTable(Base):
     comment = Column(String)
     post_to_team = Column(Boolean)
     var_ints_rest = Column(JSON)
+    # time / split in seconds - lets SQL sort and aggregate by duration
+    time_sec = Column(Float)
+    split_sec = Column(Float)
 
     def __repr__(self):
         return f"""<WorkoutLogTable(
@@ -92,7 +100,7 @@ class WorkoutLogTable(Base):
             stroke_rate={self.stroke_rate}, heart_rate={self.heart_rate}, split_variance={self.split_variance}, 
             watts={self.watts}, cal={self.cal}, image_hash={self.image_hash}, 
             subworkouts={self.subworkouts}, comment={self.comment}, post_to_team={self.post_to_team},
-            var_ints_rest_info={self.var_ints_rest})>"""
+            var_ints_rest_info={self.var_ints_rest}, time_sec={self.time_sec}, split_sec={self.split_sec})>"""
     
 class TeamTable(Base):
     __tablename__ = 'team'
@@ -124,3 +132,15 @@ class FeedbackTable(Base):
     
     def __repr__(self):
         return f"<FeedbackTable(feedback_id={self.feedback_id}, date={self.date}, user_id={self.user_id}, feedback_type='{self.feedback_type}', comment='{self.comment}')>"
+
+
+class PhotoOwnerTable(Base):
+    """Which athletes uploaded which photo - photos (OCR + blob) are stored once per content hash"""
+    __tablename__ = 'photo_owner'
+
+    photo_hash = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("athlete.user_id"), primary_key=True)
+    uploaded = Column(Date, server_default=func.now())
+
+    def __repr__(self):
+        return f"<PhotoOwnerTable(photo_hash={self.photo_hash}, user_id={self.user_id}, uploaded={self.uploaded})>"
@@ -0,0 +1,95 @@
+"""
+Shared Google Cloud Storage client for erg photo uploads.
+
+One storage.Client per process (credential discovery and the HTTP connection pool are
+reused across uploads) with a cache of bucket handles. Uploads are create-if-absent in a
+single request: if_generation_match=0 makes GCS reject the write with 412 when the
+object already exists, instead of a separate blob.exists() round trip.
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+import yaml
+import structlog
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import storage
+from requests.adapters import HTTPAdapter
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+GCS_CONFIG = config_data.get("gcs", {})
+# max pooled HTTP connections - should be at least the number of upload workers
+GCS_POOL_SIZE = GCS_CONFIG.get("pool_size", 16)
+
+log = structlog.get_logger()
+
+
+class GcsUploader:
+    def __init__(self, client_factory: Callable[[], storage.Client] = storage.Client, pool_size: int = GCS_POOL_SIZE):
+        self._client_factory = client_factory
+        self.pool_size = pool_size
+        self._client: Optional[storage.Client] = None
+        self._buckets: Dict[str, storage.Bucket] = {}
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.duplicates = 0
+        self.failures = 0
+        self.upload_seconds = 0.0
+
+    @property
+    def client(self) -> storage.Client:
+        # created on first use - importing the module shouldn't need GCP credentials
+        with self._lock:
+            if self._client is None:
+                client = self._client_factory()
+                # requests' default pool keeps 10 connections per host, too few for concurrent upload workers
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                client._http.mount("https://", adapter)
+                self._client = client
+            return self._client
+
+    def bucket(self, bucket_name: str) -> storage.Bucket:
+        client = self.client
+        with self._lock:
+            bucket = self._buckets.get(bucket_name)
+            if bucket is None:
+                bucket = self._buckets[bucket_name] = client.bucket(bucket_name)
+            return bucket
+
+    def upload_if_absent(self, bucket_name: str, data: bytes, blob_name: str, content_type: str = "image/jpeg") -> bool:
+        """Upload unless blob_name already exists in the bucket. Returns False for duplicates"""
+        blob = self.bucket(bucket_name).blob(blob_name)
+        t1 = time.perf_counter()
+        try:
+            blob.upload_from_string(data, content_type, if_generation_match=0)
+            uploaded = True
+        except PreconditionFailed:
+            uploaded = False
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        duration = time.perf_counter() - t1
+        with self._lock:
+            self.upload_seconds += duration
+            if uploaded:
+                self.uploads += 1
+            else:
+                self.duplicates += 1
+        return uploaded
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests_made = self.uploads + self.duplicates
+            return {
+                "uploads": self.uploads,
+                "duplicates": self.duplicates,
+                "failures": self.failures,
+                "buckets": len(self._buckets),
+                "avg_upload_ms": round(self.upload_seconds / requests_made * 1000, 1) if requests_made else 0,
+            }
+
+
+gcs_uploader = GcsUploader()
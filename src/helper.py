@@ -1,57 +1,92 @@
 import pdb
-from typing import Union, List, Tuple, Dict
+from typing import Union, List, Tuple, Dict, Optional
 import json
-import math
-from google.cloud import storage
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import yaml
 from hashlib import sha256
 from PIL import Image
 from io import BytesIO
 from fastapi import File, UploadFile, Form, Header
+from fastapi.encoders import jsonable_encoder
 from datetime import datetime, date as dt_date
 import structlog
 
-from src.schemas import OcrDataReturn, WorkoutDataReturn
-from src.database import AthleteTable
-from src.ocr import hit_textract_api, process_raw_ocr
+from src.schemas import OcrDataReturn, WorkoutDataReturn, CustomError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from src.database import PhotoOwnerTable
+from src.ocr import process_raw_ocr
+from src.ocrstore import raw_ocr_store
+from src.cache import SingleFlight
+from src.neardup import NEAR_DUP_ENABLED, image_content_key, near_dup_index
+from src.imageprep import prepare_for_ocr
+from src.uploads import UploadQueue
+from src.backends import ocr_provider, blob_store
+from src.admission import ocr_admission
+from src.metrics import durations_to_seconds
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+# threads one multi-photo upload OCRs its photos on - per upload, so one big upload can't queue
+# in front of everyone else's photos (Textract calls still go through ocr_admission)
+PHOTO_OCR_WORKERS_PER_UPLOAD = config_data.get("photo_ocr_workers_per_upload", 3)
+# longest a multi-photo upload waits for its photos - admission max_wait_seconds + the Textract deadline
+PHOTO_OCR_TIMEOUT_SECONDS = config_data.get("photo_ocr_timeout_seconds", 60)
 
 log = structlog.get_logger()
 
+# coalesces concurrent Textract calls for the same photo_hash
+textract_single_flight = SingleFlight()
+
 
 def get_processed_ocr_data(
-    image_bytes: bytes, photo_hash:str, ints_var:bool
+    image_bytes: bytes,
+    photo_hash:str,
+    ints_var:bool,
+    tenant: str,
+    user_id: Optional[int] = None,
 ) -> OcrDataReturn:
     """
-    Receives: erg image filename & bytes
-    Get raw_ocr (retrieve from library or from AWS Textract) and process
+    Receives: erg image bytes & photo_hash, tenant whose share of the OCR admission budget a Textract call
+    uses (ocr_tenant(), or CLI_TENANT), uploader's user_id
+    Get raw_ocr (retrieve from library, reuse the OCR of a re-sent photo or hit AWS Textract) and process
     Returns: processed workout data
     """
     t1 = datetime.now()
     # Check if image is already in raw_ocr library
-    with open("src/rawocr.json", "r") as f:
-        raw_ocr_library = json.load(f)
-    library_entries = raw_ocr_library.keys()
-    # var below used for testing ocr - change to True for Prod
-    search_library = True
-    # If yes -> grab raw response
-    if search_library and photo_hash in library_entries:
-        # get raw data using photo_hash
-        raw_textract_resp = raw_ocr_library[photo_hash]
+    raw_textract_resp = raw_ocr_store.get(photo_hash)
+    # If yes -> use stored raw response
+    if raw_textract_resp is not None:
         t2 = datetime.now()
         log.info("Raw OCR from library")
-    # If no -> create byte array, display img, send to textract
+    # If no -> reuse OCR of the same image (different file bytes) recently uploaded by the same user
     else:
-        # open image (dev only) + send to AWS Textract for OCR extraction
-        # pil_image = Image.open(BytesIO(byte_array))
-        # pil_image.show()
-        byte_array = bytearray(image_bytes)
-        raw_textract_resp = hit_textract_api(byte_array)
-        t2 = datetime.now()
-        d1 = t2 - t1
-        log.info("Time for Textract to complete OCR", duration=d1)
-        # save raw_resp to raw_ocr library
-        with open("src/rawocr.json", "w") as f:
-            raw_ocr_library[photo_hash] = raw_textract_resp
-            json.dump(raw_ocr_library, f)
+        content_key = None
+        if NEAR_DUP_ENABLED and user_id is not None:
+            content_key = image_content_key(image_bytes)
+        if content_key is not None:
+            near_dup_hash = near_dup_index.find(user_id, content_key)
+            if near_dup_hash is not None:
+                raw_textract_resp = raw_ocr_store.get(near_dup_hash)
+        if raw_textract_resp is not None:
+            near_dup_index.record_reuse()
+            # stored under this photo's hash too - a later upload of the same bytes is a library hit
+            raw_ocr_store.put(photo_hash, raw_textract_resp)
+            near_dup_index.add(user_id, content_key, photo_hash)
+            t2 = datetime.now()
+            log.info("Raw OCR from re-sent photo", near_dup_hash=near_dup_hash)
+        # Else -> send to textract, concurrent requests for the same photo share one call
+        else:
+            raw_textract_resp = textract_single_flight.do(
+                photo_hash, fetch_and_store_raw_ocr, image_bytes, photo_hash, tenant
+            )
+            if content_key is not None:
+                near_dup_index.add(user_id, content_key, photo_hash)
+            t2 = datetime.now()
+            d1 = t2 - t1
+            log.info("Time for Textract to complete OCR", duration=d1)
 
     processed_data = process_raw_ocr(raw_textract_resp, photo_hash, ints_var)
     t3 = datetime.now()
@@ -59,26 +94,136 @@ def get_processed_ocr_data(
     log.info("Time to process raw data", process_dur=d2)
     return processed_data
 
-def create_photo_hash(image_bytes, auth_uid, session)-> str:
-    #get user name
-    user = session.query(AthleteTable).filter_by(auth_uid=auth_uid).first()
-    user_name = user.email.split('@')[0]
-    # convert bytes to byte array & create photo_hash
-    byte_array = bytearray(image_bytes)
-    photo_hash = user_name+'_'+sha256(byte_array).hexdigest()
+
+def fetch_and_store_raw_ocr(image_bytes: bytes, photo_hash: str, tenant: str) -> dict:
+    """Send image to Textract and save raw response to raw_ocr library - only stored on success"""
+    # another request may have stored this photo while we were waiting to become leader
+    raw_textract_resp = raw_ocr_store.get(photo_hash)
+    if raw_textract_resp is not None:
+        return raw_textract_resp
+    # downscale/grayscale/recompress before upload to Textract
+    prepared_bytes = prepare_for_ocr(image_bytes)
+    # fair share of the global Textract budget - 429 if this tenant has too much queued
+    with ocr_admission.slot(tenant):
+        raw_textract_resp = ocr_provider.analyze(prepared_bytes, photo_hash)
+    raw_ocr_store.put(photo_hash, raw_textract_resp)
+    return raw_textract_resp
+
+
+def create_photo_hash(image_bytes: bytes) -> str:
+    """Content hash of the photo - shared OCR cache and blob key for everyone uploading the same image"""
+    photo_hash = sha256(image_bytes).hexdigest()
     log.debug("Photo hash", data=photo_hash)
     return photo_hash
 
+
+def record_photo_owner(session, photo_hash: str, user_id: int) -> None:
+    """Track who uploaded a photo - photos themselves are only stored once per content hash"""
+    session.execute(
+        pg_insert(PhotoOwnerTable)
+        .values(photo_hash=photo_hash, user_id=user_id)
+        .on_conflict_do_nothing()
+    )
+    session.commit()
+
+
+def collect_uploaded_photos(*photos: Union[UploadFile, List[UploadFile], None]) -> List[UploadFile]:
+    """Flatten photo1/photo2/photo3 + photos[] params into one ordered list of uploaded photos"""
+    ergImgs = []
+    for photo in photos:
+        if isinstance(photo, list):
+            ergImgs.extend(p for p in photo if p)
+        elif photo:
+            ergImgs.append(photo)
+    if not ergImgs:
+        raise CustomError(status_code=400, message="No photos uploaded")
+    return ergImgs
+
+
+def extract_and_process_erg_images(
+    images: List[bytes],
+    photo_hashes: List[str],
+    user_id: int,
+    varInts: bool,
+    numSubs: Optional[int],
+    tenant: str,
+) -> OcrDataReturn:
+    """
+    Receives: bytes + photo_hash of every photo in one upload (in screen order)
+    OCR and process all photos concurrently, merge multi-photo workouts
+    Returns: processed workout data for the whole workout
+    """
+    # 1. Send photo to Textract (or get raw_blob from library or a re-sent photo)
+    # 2. Process raw data to get workout information and metadata
+    if len(images) == 1:
+        return get_processed_ocr_data(images[0], photo_hashes[0], varInts, tenant, user_id)
+    photo_ocr_executor = ThreadPoolExecutor(
+        max_workers=min(len(images), PHOTO_OCR_WORKERS_PER_UPLOAD), thread_name_prefix="PhotoOcr"
+    )
+    try:
+        futures = [
+            photo_ocr_executor.submit(
+                get_processed_ocr_data, image_bytes, photo_hash, varInts, tenant, user_id
+            )
+            for image_bytes, photo_hash in zip(images, photo_hashes)
+        ]
+        # returns as soon as one photo fails - photos still running finish in the background (their
+        # OCR is stored for a retry), the client isn't kept waiting for them
+        done, not_done = wait(futures, timeout=PHOTO_OCR_TIMEOUT_SECONDS, return_when=FIRST_EXCEPTION)
+    finally:
+        # drops photos that haven't started, doesn't wait for the running ones
+        photo_ocr_executor.shutdown(wait=False, cancel_futures=True)
+    for future in futures:
+        if future in done and future.exception() is not None:
+            # one photo failed -> whole upload fails
+            raise future.exception()
+    if not_done:
+        log.error("Photo OCR timed out", timeout=PHOTO_OCR_TIMEOUT_SECONDS, pending=len(not_done))
+        raise CustomError(
+            status_code=503, message="OCR timed out, try again later", retry_after=ocr_admission.retry_after()
+        )
+    # results in upload order - merge_ocr_data relies on screen order
+    unmerged_ocr_data: List[OcrDataReturn] = [future.result() for future in futures]
+    # If more than one photo was subitted, combine processed OCR data to reflect full workout
+    return merge_ocr_data(unmerged_ocr_data, numSubs, varInts)
+
+
+def run_erg_image_job(
+    images: List[bytes],
+    photo_hashes: List[str],
+    user_id: int,
+    varInts: bool,
+    numSubs: Optional[int],
+    tenant: str,
+) -> dict:
+    """Background version of /ergImage - returns the json compatible OcrDataReturn"""
+    try:
+        final_ocr_data = extract_and_process_erg_images(images, photo_hashes, user_id, varInts, numSubs, tenant)
+    except Exception as e:
+        # save images to unprocessable_erg_screens bucket - unless OCR was just unavailable (429/503)
+        if not (isinstance(e, CustomError) and e.status_code in (429, 503)):
+            upload_erg_images("unprocessable_erg_screens", images, photo_hashes)
+        raise
+    upload_erg_images("erg_memory_screen_photos", images, photo_hashes)
+    return jsonable_encoder(vars(final_ocr_data))
+
+
+def upload_erg_images(bucket_name: str, images: List[bytes], photo_hashes: List[str]) -> None:
+    """Queue images for background upload to google cloud bucket"""
+    for image_bytes, photo_hash in zip(images, photo_hashes):
+        upload_queue.submit(bucket_name, image_bytes, photo_hash)
+
+
 def upload_blob(bucket_name: str, image_bytes: bytes, image_hash: str) -> None:
     """Uploads erg_image to google cloud bucket if not already stored"""
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(image_hash)
-    if blob.exists():
-        log.info("Duplicate: blob already exists in bucket")
-    else:
-        blob.upload_from_string(image_bytes, "image/jpeg")
+    if blob_store.put_if_absent(bucket_name, image_bytes, image_hash):
         log.info(f"{image_hash} uploaded to {bucket_name}.")
+    else:
+        log.info("Duplicate: blob already exists in bucket")
+
+
+# shared bounded upload workers - upload_blob is looked up on each call so it can be patched in tests
+upload_queue = UploadQueue(lambda bucket_name, image_bytes, image_hash: upload_blob(bucket_name, image_bytes, image_hash))
 
 
 def merge_ocr_data(unmerged_data: List[OcrDataReturn], numSubs: int, varInts: bool) -> OcrDataReturn:
@@ -153,47 +298,12 @@ def process_dtm_workouts(db_resp: List[tuple]) -> List[dict]:
     """
     Reformat response retrieved by sqlAlchemy from a list of tuples to list of dicts editing date to json compatible format
     """
-    dtm_workouts = [] 
-    for wo in db_resp:
-        jsondate = wo[0].isoformat()
-        time = duration_to_seconds(wo[1]) 
-        wo_dict = {
-            'date': wo[0].isoformat(),
-            'time': time,
-            'meter': wo[2] 
-        }
-        dtm_workouts.append(wo_dict)
-    return dtm_workouts 
-
-
-def duration_to_seconds(duration: str) -> float:
-    time_components = duration.split(":")
-    time_components = [float(item) for item in time_components]
-    seconds = 0
-
-    seconds = time_components.pop()
-    if len(time_components):
-        minutes = time_components.pop()
-        seconds += minutes * 60
-
-    if len(time_components):
-        hour = time_components.pop()
-        seconds += hour * 3600
-
-    return seconds
-
-
-def calculate_watts(split: str) -> int:
-    pace = duration_to_seconds(split) / 500
-    watts = math.ceil(2.8 / pace**3)
-    return watts
-
-
-def calculate_cals(time: str, watts: float) -> int:
-    time_hour = duration_to_seconds(time) / 3600
-    # W -> kW 1 | kWh = 860 kCal | efficiency 25% | just living 300kCal/h
-    cal = math.ceil(watts / 1000 * time_hour * 860 * 4 + 300 * time_hour)
-    return cal
+    # rows are (date, time, meter, time_sec) - only rows the time_sec backfill hasn't reached are parsed here
+    parsed_times = iter(durations_to_seconds(wo[1] for wo in db_resp if wo[3] is None))
+    return [
+        {'date': wo[0].isoformat(), 'time': wo[3] if wo[3] is not None else next(parsed_times), 'meter': wo[2]}
+        for wo in db_resp
+    ]
 
 
 def insert_every_n_indices(lst, item, n):
@@ -202,18 +312,6 @@ def insert_every_n_indices(lst, item, n):
         lst.insert(index, item)
 
 
-def calculate_split_var(workout_metrics):
-    # get split for each subworkout
-    splits = []
-    for i in range(1, len(workout_metrics)):
-        split_sec = duration_to_seconds(workout_metrics[i]["split"])
-        splits.append(split_sec)
-    if not splits:
-        return 0
-    split_var = round(max(splits) - min(splits), 1)
-    return split_var
-
-
 def add_user_info_to_workout(workouts: List[dict], members: List[dict]) -> List[dict]:
     members_by_id = {}
     for athlete in members:
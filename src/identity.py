@@ -0,0 +1,104 @@
+"""
+Bounded TTL cache of the authenticated athlete's identity: auth_uid -> (user_id, team, team_admin, email).
+
+Nearly every request resolves its token's auth_uid to the athlete row. The few fields endpoints
+need are cached for ttl_seconds, so repeat requests skip that query. Endpoints that change an
+athlete's email, team or admin flag invalidate the entry after committing. A generation counter
+stops a lookup that raced with an invalidation from re-caching the old values.
+"""
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+import yaml
+
+from src.cache import TtlCache
+from src.database import AthleteTable
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+IDENTITY_CACHE_CONFIG = config_data.get("identity_cache", {})
+IDENTITY_CACHE_TTL_SECONDS = IDENTITY_CACHE_CONFIG.get("ttl_seconds", 300)
+IDENTITY_CACHE_MAX_ENTRIES = IDENTITY_CACHE_CONFIG.get("max_entries", 10000)
+
+
+class AthleteIdentity(NamedTuple):
+    auth_uid: str
+    user_id: int
+    team: Optional[int]
+    team_admin: Optional[bool]
+    email: Optional[str]
+
+
+class IdentityCache:
+    """TtlCache of identities by auth_uid, plus a user_id index and a generation counter for invalidation"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = IDENTITY_CACHE_TTL_SECONDS,
+        max_entries: int = IDENTITY_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._identities = TtlCache(max_entries, ttl_seconds, clock)
+        # user_id -> auth_uid, bounded and expiring like the identities it points at
+        self._auth_uids = TtlCache(max_entries, ttl_seconds, clock)
+        # held across generation check + put, so an invalidation can't slip in between
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, auth_uid: str) -> Optional[AthleteIdentity]:
+        identity = self._identities.get(auth_uid)
+        if identity is not None:
+            # keep the index entry as recently used as its identity, so LRU eviction drops them together
+            self._auth_uids.get(identity.user_id)
+        return identity
+
+    def put(self, identity: AthleteIdentity, generation: int) -> None:
+        """Cache identity read while the cache was at generation - dropped if anything was invalidated since"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._identities.put(identity.auth_uid, identity)
+            self._auth_uids.put(identity.user_id, identity.auth_uid)
+
+    def invalidate(self, auth_uid: Optional[str] = None, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if user_id is not None:
+                auth_uid_for_user = self._auth_uids.pop(user_id)
+                if auth_uid_for_user is not None:
+                    self._identities.pop(auth_uid_for_user)
+            if auth_uid is not None:
+                self._identities.pop(auth_uid)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._identities.stats(), "invalidations": self.invalidations}
+
+
+identity_cache = IdentityCache()
+
+
+def get_athlete(auth_uid: str, session, cache: IdentityCache = identity_cache) -> AthleteIdentity:
+    """Identity of the athlete with auth_uid - from the cache, else one narrow query"""
+    identity = cache.get(auth_uid)
+    if identity is not None:
+        return identity
+    generation = cache.generation
+    row = (
+        session.query(AthleteTable.user_id, AthleteTable.team, AthleteTable.team_admin, AthleteTable.email)
+        .filter_by(auth_uid=auth_uid)
+        .first()
+    )
+    if row is None:
+        raise LookupError("no athlete for this token")
+    identity = AthleteIdentity(auth_uid, *row)
+    cache.put(identity, generation)
+    return identity
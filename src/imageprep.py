@@ -0,0 +1,213 @@
+"""
+Normalise erg photos before sending them to Textract.
+
+Phone photos are 3-8MB / 12MP, the PM5 LCD text is legible at a fraction of that.
+Before OCR we apply EXIF orientation, downsample to a target long edge, convert to
+grayscale and recompress - see dev/optimize_resolution.py for the original exploration.
+Optionally the photo is first cropped to the monitor's LCD (bright rectangle inside the
+dark PM5 bezel) so background text never reaches Textract.
+The original bytes are still what gets hashed and uploaded to GCS.
+"""
+import threading
+import time
+from io import BytesIO
+from typing import List, Optional, Tuple
+import yaml
+import structlog
+from PIL import Image, ImageFilter, ImageOps
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+IMAGE_PREP_CONFIG = config_data.get("image_preprocessing", {})
+IMAGE_PREP_ENABLED = IMAGE_PREP_CONFIG.get("enabled", True)
+MAX_LONG_EDGE = IMAGE_PREP_CONFIG.get("max_long_edge", 2000)
+GRAYSCALE = IMAGE_PREP_CONFIG.get("grayscale", True)
+JPEG_QUALITY = IMAGE_PREP_CONFIG.get("jpeg_quality", 85)
+CROP_TO_MONITOR = IMAGE_PREP_CONFIG.get("crop_to_monitor", True)
+# fraction of the detected rectangle that must be LCD-bright, below this keep the full frame
+MIN_CROP_CONFIDENCE = IMAGE_PREP_CONFIG.get("min_crop_confidence", 0.8)
+
+# long edge (px) of the thumbnail the monitor detector works on
+DETECTION_SIZE = 160
+# padding kept around the detected LCD, fraction of the photo's long edge
+CROP_MARGIN = 0.03
+
+log = structlog.get_logger()
+
+
+class ImagePrepStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self.crop_attempts = 0
+        self.crops = 0
+        self.crop_area_removed = 0.0
+
+    def record(self, bytes_in: int, bytes_out: int, seconds: float) -> None:
+        with self._lock:
+            self.images += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += seconds
+
+    def record_crop_attempt(self, area_removed: Optional[float]) -> None:
+        """area_removed: fraction of the frame cropped away, None if detection fell back to the full frame"""
+        with self._lock:
+            self.crop_attempts += 1
+            if area_removed is not None:
+                self.crops += 1
+                self.crop_area_removed += area_removed
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "images": self.images,
+                "failures": self.failures,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "avg_ms": round(self.seconds / self.images * 1000, 1) if self.images else 0,
+                "crop_attempts": self.crop_attempts,
+                "crops": self.crops,
+                "avg_crop_area_removed": round(self.crop_area_removed / self.crops, 3) if self.crops else 0,
+            }
+
+
+image_prep_stats = ImagePrepStats()
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """Grey level that best separates the histogram into dark and bright classes"""
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    dark_count, dark_weighted = 0, 0
+    best_variance, threshold = 0.0, 0
+    for level, count in enumerate(histogram):
+        dark_count += count
+        if not dark_count:
+            continue
+        bright_count = total - dark_count
+        if not bright_count:
+            break
+        dark_weighted += level * count
+        dark_mean = dark_weighted / dark_count
+        bright_mean = (weighted_total - dark_weighted) / bright_count
+        variance = dark_count * bright_count * (dark_mean - bright_mean) ** 2
+        if variance > best_variance:
+            best_variance, threshold = variance, level
+    return threshold
+
+
+def locate_monitor(img: Image.Image) -> Tuple[Optional[Tuple[int, int, int, int]], float]:
+    """
+    Find the PM5 LCD: the largest bright, near-rectangular region not touching the photo's border
+    Returns (box in img coordinates, confidence) - box is None if nothing plausible was found
+    """
+    small = img.convert("L")
+    small.thumbnail((DETECTION_SIZE, DETECTION_SIZE))
+    width, height = small.size
+    threshold = _otsu_threshold(small.histogram())
+    # bright mask, opened to cut thin bright bridges (logo text, reflections) between LCD and background
+    mask = small.point(lambda p: 255 if p > threshold else 0)
+    mask = mask.filter(ImageFilter.MinFilter(3)).filter(ImageFilter.MaxFilter(3))
+    pixels = mask.load()
+    seen = bytearray(width * height)
+    best_box, best_fill, best_area = None, 0.0, 0
+    # flood fill each bright component
+    for y0 in range(height):
+        for x0 in range(width):
+            if seen[y0 * width + x0] or not pixels[x0, y0]:
+                continue
+            seen[y0 * width + x0] = 1
+            stack = [(x0, y0)]
+            size, left, right, top, bottom = 0, x0, x0, y0, y0
+            touches_border = False
+            while stack:
+                x, y = stack.pop()
+                size += 1
+                left, right = min(left, x), max(right, x)
+                top, bottom = min(top, y), max(bottom, y)
+                if x == 0 or y == 0 or x == width - 1 or y == height - 1:
+                    touches_border = True
+                for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                    if 0 <= nx < width and 0 <= ny < height and not seen[ny * width + nx] and pixels[nx, ny]:
+                        seen[ny * width + nx] = 1
+                        stack.append((nx, ny))
+            # the LCD is framed by the bezel - anything reaching the edge is background
+            if touches_border:
+                continue
+            box_width, box_height = right - left + 1, bottom - top + 1
+            area = box_width * box_height
+            if not (0.04 < area / (width * height) < 0.8 and 0.7 < box_width / box_height < 2.2):
+                continue
+            fill = size / area
+            if fill * area > best_fill * best_area:
+                best_box, best_fill, best_area = (left, top, right + 1, bottom + 1), fill, area
+    if best_box is None:
+        return None, 0.0
+    scale = img.width / width
+    return tuple(int(coord * scale) for coord in best_box), best_fill
+
+
+def crop_to_monitor(img: Image.Image) -> Image.Image:
+    """Crop to the detected LCD (plus margin), or return the full frame if detection isn't confident"""
+    box, confidence = locate_monitor(img)
+    if box is None or confidence < MIN_CROP_CONFIDENCE:
+        image_prep_stats.record_crop_attempt(None)
+        log.debug("Monitor not detected, using full frame", confidence=confidence)
+        return img
+    margin = int(CROP_MARGIN * max(img.size))
+    left, top, right, bottom = box
+    box = (max(0, left - margin), max(0, top - margin), min(img.width, right + margin), min(img.height, bottom + margin))
+    area_removed = 1 - (box[2] - box[0]) * (box[3] - box[1]) / (img.width * img.height)
+    image_prep_stats.record_crop_attempt(area_removed)
+    log.debug("Cropped to monitor", confidence=confidence, area_removed=area_removed)
+    return img.crop(box)
+
+
+def prepare_for_ocr(image_bytes: bytes) -> bytes:
+    """
+    Returns the image bytes to send to Textract - falls back to the original on any failure,
+    or when the prepared image isn't smaller (already small / heavily compressed photos)
+    """
+    if not IMAGE_PREP_ENABLED:
+        return image_bytes
+    t1 = time.perf_counter()
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        # JPEG only: decode straight at a reduced scale (never below the target size)
+        img.draft("L" if GRAYSCALE else "RGB", (MAX_LONG_EDGE, MAX_LONG_EDGE))
+        img = ImageOps.exif_transpose(img)
+        if CROP_TO_MONITOR:
+            img = crop_to_monitor(img)
+        img = img.convert("L" if GRAYSCALE else "RGB")
+        img.thumbnail((MAX_LONG_EDGE, MAX_LONG_EDGE), Image.Resampling.LANCZOS)
+        out = BytesIO()
+        img.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        prepared_bytes = out.getvalue()
+    except Exception as e:
+        image_prep_stats.record_failure()
+        log.warning("Image preprocessing failed, sending original", error_message=str(e))
+        return image_bytes
+    duration = time.perf_counter() - t1
+    if len(prepared_bytes) >= len(image_bytes):
+        image_prep_stats.record(len(image_bytes), len(image_bytes), duration)
+        log.info("Preprocessed image not smaller, sending original", original_bytes=len(image_bytes), prep_dur=duration)
+        return image_bytes
+    image_prep_stats.record(len(image_bytes), len(prepared_bytes), duration)
+    log.info(
+        "Image preprocessed for OCR",
+        original_bytes=len(image_bytes),
+        prepared_bytes=len(prepared_bytes),
+        bytes_saved=len(image_bytes) - len(prepared_bytes),
+        prep_dur=duration,
+    )
+    return prepared_bytes
@@ -0,0 +1,200 @@
+"""
+Background OCR jobs for the polling variant of /ergImage.
+
+The upload returns a job id straight away, OCR + parsing run on a worker pool and the
+client polls for the result. Each job belongs to the user who submitted it - only they can
+read it. A user's jobs for the same photos are deduplicated, finished jobs are kept for
+result_ttl_seconds.
+
+Each queued job holds its photos in memory, so the number of queued + running jobs is capped
+per user and overall - over the cap, uploads get a 429 + Retry-After.
+"""
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+import yaml
+import structlog
+
+from src.schemas import CustomError
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+OCR_JOBS_CONFIG = config_data.get("ocr_jobs", {})
+OCR_JOB_WORKERS = OCR_JOBS_CONFIG.get("max_workers", 4)
+OCR_JOB_RESULT_TTL_SECONDS = OCR_JOBS_CONFIG.get("result_ttl_seconds", 600)
+OCR_JOB_MAX_PENDING = OCR_JOBS_CONFIG.get("max_pending", 64)
+OCR_JOB_MAX_PENDING_PER_OWNER = OCR_JOBS_CONFIG.get("max_pending_per_owner", 8)
+
+log = structlog.get_logger()
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class OcrJob:
+    def __init__(self, job_id: str, key: Hashable, owner: Hashable):
+        self.job_id = job_id
+        self.key = key
+        self.owner = owner
+        self.status = PENDING
+        self.result: Optional[dict] = None
+        self.status_code: Optional[int] = None
+        self.error_message: Optional[str] = None
+        self.retry_after: Optional[int] = None
+        self.finished: Optional[float] = None
+
+    def todict(self) -> dict:
+        job_info = {"job_id": self.job_id, "status": self.status}
+        if self.status == DONE:
+            job_info["result"] = self.result
+        elif self.status == FAILED:
+            job_info["error_message"] = self.error_message
+        return job_info
+
+
+class OcrJobManager:
+    def __init__(
+        self,
+        max_workers: int = OCR_JOB_WORKERS,
+        result_ttl_seconds: float = OCR_JOB_RESULT_TTL_SECONDS,
+        max_pending: int = OCR_JOB_MAX_PENDING,
+        max_pending_per_owner: int = OCR_JOB_MAX_PENDING_PER_OWNER,
+    ):
+        self.max_workers = max_workers
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_pending = max_pending
+        self.max_pending_per_owner = max_pending_per_owner
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="OcrJob")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, OcrJob] = {}
+        # (owner, dedup key) -> job_id for jobs that are queued, running or finished successfully
+        self._job_ids_by_key: Dict[Hashable, str] = {}
+        # queued + running jobs, overall and per owner (owners without any are removed)
+        self._pending = 0
+        self._pending_by_owner: Dict[Hashable, int] = {}
+        # smoothed job run time, used for the Retry-After estimate
+        self._avg_job_seconds = 1.0
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+
+    def submit(self, key: Hashable, owner: Hashable, fn: Callable[..., dict], *args) -> OcrJob:
+        """Queue fn(*args) for owner unless their job with the same key is in progress or has a live result"""
+        key = (owner, key)
+        with self._lock:
+            self._purge_expired()
+            job_id = self._job_ids_by_key.get(key)
+            if job_id is not None:
+                self.deduplicated += 1
+                return self._jobs[job_id]
+            if self._pending >= self.max_pending:
+                raise self._reject(owner, "job queue full")
+            if self._pending_by_owner.get(owner, 0) >= self.max_pending_per_owner:
+                raise self._reject(owner, "too many queued jobs for this user")
+            job = OcrJob(str(uuid.uuid4()), key, owner)
+            self._jobs[job.job_id] = job
+            self._job_ids_by_key[key] = job.job_id
+            self._pending += 1
+            self._pending_by_owner[owner] = self._pending_by_owner.get(owner, 0) + 1
+            self.submitted += 1
+        try:
+            self._executor.submit(self._run, job, fn, *args)
+        except RuntimeError as e:
+            # shutting down - don't leave a job that never runs for later uploads to dedup onto
+            log.error("OCR job not queued", job_id=job.job_id, error_message=str(e))
+            with self._lock:
+                del self._jobs[job.job_id]
+                if self._job_ids_by_key.get(key) == job.job_id:
+                    del self._job_ids_by_key[key]
+                self._finish(job, 0)
+            raise CustomError(status_code=503, message="OCR jobs unavailable, try again later", retry_after=1)
+        return job
+
+    def get(self, job_id: str, owner: Hashable) -> Optional[OcrJob]:
+        """None if the job doesn't exist, expired or belongs to someone else"""
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+            return job if job is not None and job.owner == owner else None
+
+    def _retry_after(self) -> int:
+        # time for the queued + running jobs to drain through the workers
+        return max(1, math.ceil(self._avg_job_seconds * self._pending / self.max_workers))
+
+    def _reject(self, owner: Hashable, reason: str) -> CustomError:
+        self.rejected += 1
+        log.warning("OCR job rejected", owner=owner, reason=reason, pending=self._pending)
+        return CustomError(status_code=429, message=f"Too many OCR jobs, {reason}", retry_after=self._retry_after())
+
+    def _finish(self, job: OcrJob, run_seconds: float) -> None:
+        # called with the lock held, once per job that counted as pending
+        self._pending -= 1
+        owner_pending = self._pending_by_owner[job.owner] - 1
+        if owner_pending:
+            self._pending_by_owner[job.owner] = owner_pending
+        else:
+            del self._pending_by_owner[job.owner]
+        if run_seconds:
+            self._avg_job_seconds = 0.9 * self._avg_job_seconds + 0.1 * run_seconds
+
+    def _run(self, job: OcrJob, fn: Callable[..., dict], *args) -> None:
+        with self._lock:
+            job.status = RUNNING
+        t1 = time.monotonic()
+        try:
+            result = fn(*args)
+            with self._lock:
+                job.result = result
+                job.status = DONE
+                job.finished = time.monotonic()
+                self._finish(job, job.finished - t1)
+        except Exception as e:
+            log.error("OCR job failed", job_id=job.job_id, error_message=str(e))
+            with self._lock:
+                job.status_code = e.status_code if isinstance(e, CustomError) else 500
+                job.error_message = e.message if isinstance(e, CustomError) else str(e)
+                job.retry_after = e.retry_after if isinstance(e, CustomError) else None
+                job.status = FAILED
+                job.finished = time.monotonic()
+                self._finish(job, job.finished - t1)
+                # failures aren't reused - resubmitting the same photos starts a new job
+                if self._job_ids_by_key.get(job.key) == job.job_id:
+                    del self._job_ids_by_key[job.key]
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        expired = [
+            job for job in self._jobs.values()
+            if job.finished is not None and now - job.finished > self.result_ttl_seconds
+        ]
+        for job in expired:
+            del self._jobs[job.job_id]
+            if self._job_ids_by_key.get(job.key) == job.job_id:
+                del self._job_ids_by_key[job.key]
+
+    def shutdown(self) -> None:
+        """Finish queued and running jobs, refuse new ones"""
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+                "pending": statuses.count(PENDING),
+                "running": statuses.count(RUNNING),
+                "done": statuses.count(DONE),
+                "failed": statuses.count(FAILED),
+            }
+
+
+ocr_job_manager = OcrJobManager()
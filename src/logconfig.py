@@ -0,0 +1,19 @@
+"""
+Log level shared by the structlog configuration and code that builds expensive debug output.
+
+structlog's filtering bound logger turns calls below the level into no-ops, but arguments are still
+evaluated - anything costly to build (pretty printed tables etc.) should be guarded by DEBUG_LOGGING.
+Set with the LOG_LEVEL env var or log_level in config.yaml, defaults to INFO.
+"""
+import logging
+import os
+import yaml
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+_LEVELS = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARNING": logging.WARNING, "ERROR": logging.ERROR}
+
+LOG_LEVEL = _LEVELS.get(str(os.getenv("LOG_LEVEL", config_data.get("log_level", "INFO"))).upper(), logging.INFO)
+DEBUG_LOGGING = LOG_LEVEL <= logging.DEBUG
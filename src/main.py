@@ -7,11 +7,10 @@ import time
 import yaml
 from datetime import datetime, date
 import os
-import threading
 import structlog
 import uuid
 
-from fastapi import FastAPI, Request, File, UploadFile, Form, Header
+from fastapi import FastAPI, Request, File, UploadFile, Form, Header, Depends
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
@@ -43,18 +42,29 @@ from src.utils import (
 )
 from src import utils as u
 from src.database import AthleteTable, WorkoutLogTable, TeamTable, FeedbackTable
+from src.ocrstore import raw_ocr_memory_cache
+from src.neardup import near_dup_index
+from src.imageprep import image_prep_stats
+from src.jobs import ocr_job_manager, FAILED
+from src.gcs import gcs_uploader
+from src.ocr import textract_caller
+from src.admission import ocr_admission, ocr_tenant
+from src.logconfig import LOG_LEVEL
+from src.metrics import workout_summary
+from src.identity import AthleteIdentity, get_athlete, identity_cache
 from src.helper import (
     convert_class_instances_to_dicts,
-    upload_blob,
-    get_processed_ocr_data,
-    calculate_watts,
-    calculate_cals,
-    calculate_split_var,
+    upload_erg_images,
+    extract_and_process_erg_images,
+    collect_uploaded_photos,
+    run_erg_image_job,
     add_user_info_to_workout,
-    merge_ocr_data,
     datetime_encoder,
     create_photo_hash,
+    record_photo_owner,
     process_dtm_workouts,
+    textract_single_flight,
+    upload_queue,
 )
 
 app = FastAPI()
@@ -72,7 +82,8 @@ app.add_middleware(
 # Use FastAPI's exception handling middleware to catch CustomError
 @app.exception_handler(CustomError)
 async def custom_error_handler(request, exc):
-    return JSONResponse(status_code=exc.status_code, content={"error_message": exc.message})
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after is not None else None
+    return JSONResponse(status_code=exc.status_code, content={"error_message": exc.message}, headers=headers)
 
 # Load config file values
 with open("config/config.yaml", "r") as f:
@@ -107,11 +118,32 @@ structlog.configure(
     processors=[
         structlog.processors.TimeStamper(fmt="iso"),
         structlog.processors.add_log_level,
-        ] + extra_processors
+        ] + extra_processors,
+    # calls below LOG_LEVEL are no-ops - nothing is rendered for filtered debug logs
+    wrapper_class=structlog.make_filtering_bound_logger(LOG_LEVEL),
+    cache_logger_on_first_use=True,
 )
 log = structlog.get_logger()
 log.info("API Running")
 
+
+def current_athlete(authorization: str = Header(...)) -> AthleteIdentity:
+    """Dependency: the caller's athlete, resolved once per request (and cached across requests)"""
+    try:
+        auth_uid = validate_user_token(authorization)
+    except InvalidTokenError as e:
+        log.error("Invalid Token Error", error_message=str(e))
+        raise CustomError(status_code=401, message=str(e))
+    with Session() as session:
+        return get_athlete(auth_uid, session)
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    # let queued OCR jobs finish, then drain the uploads they queued before the worker exits
+    ocr_job_manager.shutdown()
+    upload_queue.shutdown()
+
 ######  END POINTS ######
 
 
@@ -120,6 +152,24 @@ def read_health():
     return {"API status": HTTPStatus.OK}
 
 
+@app.get("/stats")
+def read_stats():
+    """Process-local cache and pipeline counters"""
+    return {
+        "raw_ocr_memory_cache": raw_ocr_memory_cache.stats(),
+        "textract_single_flight": textract_single_flight.stats(),
+        "near_dup_index": near_dup_index.stats(),
+        "image_preprocessing": image_prep_stats.stats(),
+        "ocr_jobs": ocr_job_manager.stats(),
+        "upload_queue": upload_queue.stats(),
+        "gcs": gcs_uploader.stats(),
+        "textract": textract_caller.stats(),
+        "ocr_admission": ocr_admission.stats(),
+        "identity_cache": identity_cache.stats(),
+        "verified_token_cache": u.verified_token_cache.stats(),
+    }
+
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
@@ -243,6 +293,7 @@ async def update_user(new_user_info: PutUserSchema, authorization: str = Header(
                 setattr(user, key, value)
             # AthleteTable[user] = new_user_info.dict()
             session.commit()
+            identity_cache.invalidate(auth_uid)
             return JSONResponse(content={"message": "user update successful"})
     except InvalidTokenError as e:
         log.error("Invalid Token Error", error_message=str(e))
@@ -277,6 +328,7 @@ async def patch_user(
                 setattr(user, key, filtered_new_user_info[key])
             # AthleteTable[user] = new_user_info.dict()
             session.commit()
+            identity_cache.invalidate(user_id=user_id)
             return JSONResponse(content={"message": "user update succeessful"})
     except InvalidTokenError as e:
         log.error("Invalid Token Error", error_message=str(e))
@@ -288,82 +340,108 @@ async def patch_user(
 
 @app.post("/ergImage")
 def create_extract_and_process_ergImage(
-    photo1: UploadFile,
+    photo1: Union[UploadFile, None] = None,
     photo2: Union[UploadFile, None] = None,
     photo3: Union[UploadFile, None] = None,
+    photos: Union[List[UploadFile], None] = File(None),
     varInts: bool = False,
     numSubs: Union[int, None] = None,
-    authorization: str = Header(...),
+    athlete: AthleteIdentity = Depends(current_athlete),
 ):
     """
-    Receives UploadFile containing photo of erg screen,
-    sends image to Textract for OCR, attempt to process raw result
+    Receives UploadFiles containing photos of erg screen (photo1-3 and/or any number of photos, in screen order),
+    sends images to Textract for OCR concurrently, attempt to process raw result
     if processing Fails: save image in unprocessable_erg_screens gcs bucket and return error else...
     Returns save img in gcs bucket and return processed data
     """
     log.info("Started", endpoint="ergImage", method="post")
+    images, photo_hashes = [], []
+    # token already validated and athlete resolved by current_athlete
+    user_id = athlete.user_id
+    tenant = ocr_tenant(athlete.auth_uid, athlete.team)
     try:
-        # Validate user token to ensure request is authenticated
-        auth_uid = validate_user_token(authorization)
-        # Update the athlete's last post date to today
         with Session() as session:
-            athlete = session.query(AthleteTable).filter_by(auth_uid=auth_uid).first()
-            athlete.last_post = date.today().strftime('%Y-%m-%d')
-            session.commit() 
-        # Initialize variable and process each uploaded photo
-        with Session() as session: 
             tinit = datetime.now()
-            user_id = get_user_id(auth_uid, session)
-            unmerged_ocr_data = []
-            ergImgs = [photo for photo in (photo1, photo2, photo3) if photo]
-            # Process each image
-            for img in ergImgs:
-                filename = img.filename
-                image_bytes = img.file.read()
-                # create a unique id for the photo: user_name + sha256 hash
-                photo_hash = create_photo_hash(image_bytes, auth_uid, session)
-                # 1. Send photo to Textract (or get raw_blob from library) 
-                # 2. Process raw data to get workout information and metadata 
-                ocr_data: OcrDataReturn = get_processed_ocr_data(image_bytes, photo_hash, varInts)
-                unmerged_ocr_data.append(ocr_data)
-                # Asyncrenously upload image to google cloud bucket
-                upload_blob_thread = threading.Thread(
-                    target=upload_blob,
-                    args=("erg_memory_screen_photos", image_bytes, photo_hash),
-                    name=f"UploadBlobThread_{filename}",
-                )
-                upload_blob_thread.start()
-            # If only one photo was submitted, return processed OCR data
-            if len(unmerged_ocr_data) == 1: #only one photo
-                tf = datetime.now()
-                dtot = tf - tinit
-                log.info("TOTAL TIME", total_dur=dtot)
-                json_compatable_ocr_data = jsonable_encoder(vars(unmerged_ocr_data[0]))
-                return JSONResponse(content=json_compatable_ocr_data)
-            # If more than one photo was subitted, combine processed OCR data to reflect full workout 
-            final_ocr_data = merge_ocr_data(unmerged_ocr_data, numSubs, varInts)
+            # Update the athlete's last post date to today
+            session.query(AthleteTable).filter_by(user_id=user_id).update({"last_post": date.today()})
+            ergImgs = collect_uploaded_photos(photo1, photo2, photo3, photos)
+            images = [img.file.read() for img in ergImgs]
+            # content hash of each photo - shared OCR cache + blob key across all users
+            photo_hashes = [create_photo_hash(image_bytes) for image_bytes in images]
+            for photo_hash in photo_hashes:
+                record_photo_owner(session, photo_hash, user_id)
+            # OCR + process each photo, merge if more than one photo was submitted
+            final_ocr_data: OcrDataReturn = extract_and_process_erg_images(
+                images, photo_hashes, user_id, varInts, numSubs, tenant
+            )
+            upload_erg_images("erg_memory_screen_photos", images, photo_hashes)
             dtot = datetime.now() - tinit
             log.info("TOTAL TIME", total_dur=dtot)
             json_compatable_ocr_data = jsonable_encoder(vars(final_ocr_data))
             return JSONResponse(content=json_compatable_ocr_data)
-    # Handle invalid token errors
-    except InvalidTokenError as e:
-        log.error("Invalid Token Error", error_message=str(e))
-        return JSONResponse(status_code=401, content={"error_message":str(e)})
-    # Handle other exceptions
     except Exception as e:
-        # save image to unprocessable_erg_screens bucket
-        upload_blob_thread = threading.Thread(
-            target=upload_blob,
-            args=("unprocessable_erg_screens", image_bytes, photo_hash),
-            name=f"UploadBlobThread_{filename}",
-        )
-        upload_blob_thread.start()
-
+        # save images to unprocessable_erg_screens bucket - unless OCR was just unavailable (429/503), the photo may be fine
+        if not (isinstance(e, CustomError) and e.status_code in (429, 503)):
+            upload_erg_images("unprocessable_erg_screens", images, photo_hashes)
         log.error(f"/ergImage exception, uid={user_id}", error_message=str(e))
         raise e
 
 
+@app.post("/ergImageJob")
+def create_ergImage_job(
+    photo1: Union[UploadFile, None] = None,
+    photo2: Union[UploadFile, None] = None,
+    photo3: Union[UploadFile, None] = None,
+    photos: Union[List[UploadFile], None] = File(None),
+    varInts: bool = False,
+    numSubs: Union[int, None] = None,
+    athlete: AthleteIdentity = Depends(current_athlete),
+):
+    """
+    Receives same data as /ergImage
+    Queues OCR + processing on a background worker (photos already queued or recently processed reuse that job)
+    Returns job_id immediately - poll GET /ergImageJob/{job_id} for the processed data
+    """
+    log.info("Started", endpoint="ergImageJob", method="post")
+    user_id = athlete.user_id
+    tenant = ocr_tenant(athlete.auth_uid, athlete.team)
+    try:
+        with Session() as session:
+            session.query(AthleteTable).filter_by(user_id=user_id).update({"last_post": date.today()})
+            ergImgs = collect_uploaded_photos(photo1, photo2, photo3, photos)
+            images = [img.file.read() for img in ergImgs]
+            photo_hashes = [create_photo_hash(image_bytes) for image_bytes in images]
+            for photo_hash in photo_hashes:
+                record_photo_owner(session, photo_hash, user_id)
+        job = ocr_job_manager.submit(
+            (tuple(photo_hashes), varInts, numSubs), user_id,
+            run_erg_image_job, images, photo_hashes, user_id, varInts, numSubs, tenant,
+        )
+        return JSONResponse(status_code=202, content=job.todict())
+    except CustomError as e:
+        raise e
+    except Exception as e:
+        log.error(f"POST ergImageJob Error, uid={user_id}", error_message=str(e))
+        return JSONResponse(status_code=500, content={"error_message":str(e)})
+
+
+@app.get("/ergImageJob/{job_id}")
+def read_ergImage_job(job_id: str, athlete: AthleteIdentity = Depends(current_athlete)):
+    """
+    Receives job_id from POST /ergImageJob
+    Returns job status, plus processed OCR data once done (or error_message if it failed)
+    Jobs submitted by other users are reported as not found
+    """
+    log.info("Started", endpoint="ergImageJob", method="get")
+    job = ocr_job_manager.get(job_id, athlete.user_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error_message": "job not found or expired"})
+    if job.status == FAILED:
+        headers = {"Retry-After": str(job.retry_after)} if job.retry_after is not None else None
+        return JSONResponse(status_code=job.status_code, content=job.todict(), headers=headers)
+    return JSONResponse(content=job.todict())
+
+
 @app.get("/workout")
 async def read_workout(authorization: str = Header(...)):
     """Get all workout data for user"""
@@ -397,9 +475,7 @@ async def create_workout(
     with Session() as session:
         try:
             auth_uid = validate_user_token(authorization)
-            split_var = calculate_split_var(workoutData.tableMetrics)
-            watts = calculate_watts(workoutData.tableMetrics[0]["split"])
-            calories = calculate_cals(workoutData.tableMetrics[0]["time"], watts)
+            summary = workout_summary(workoutData.tableMetrics)
             # get user_id
             user_id = get_user_id(auth_uid, session)
             # create data entry (WorkoutLogTable  instance)
@@ -415,9 +491,11 @@ async def create_workout(
                 split=workoutData.tableMetrics[0]["split"],
                 stroke_rate=workoutData.tableMetrics[0]["strokeRate"],
                 heart_rate=workoutData.tableMetrics[0]["heartRate"],
-                split_variance=split_var,
-                watts=watts,
-                cal=calories,
+                split_variance=summary.split_var,
+                watts=summary.watts,
+                cal=summary.cal,
+                time_sec=summary.time_sec,
+                split_sec=summary.split_sec,
                 image_hash=photo_hash_joined,
                 subworkouts=subworkouts_json,
                 comment=workoutData.woMetaData["comment"],
@@ -478,16 +556,16 @@ async def read_team(authorization: str = Header(...)):
     try:
         auth_uid = validate_user_token(authorization)
         with Session() as session:
-            user_id = get_user_id(auth_uid, session)
-            user_info = session.query(AthleteTable).get(user_id).__dict__
-            if user_info["team"]:
+            athlete = get_athlete(auth_uid, session)
+            user_id = athlete.user_id
+            if athlete.team:
                 # Get user_team_info
-                team = session.query(TeamTable).get(user_info["team"])
+                team = session.query(TeamTable).get(athlete.team)
                 team_info = {
                     column.name: getattr(team, column.name)
                     for column in TeamTable.__table__.columns
                 }
-                admin = user_info["team_admin"]
+                admin = athlete.team_admin
                 user_team_info = {
                         "team_member": True,
                         "team_info": team_info,
@@ -503,7 +581,8 @@ async def read_team(authorization: str = Header(...)):
                     session.query(
                         WorkoutLogTable.date,
                         WorkoutLogTable.time,
-                        WorkoutLogTable.meter)
+                        WorkoutLogTable.meter,
+                        WorkoutLogTable.time_sec)
                     .filter(
                         WorkoutLogTable.user_id.in_(
                             [athlete.user_id for athlete in team_members]
@@ -512,7 +591,7 @@ async def read_team(authorization: str = Header(...)):
                     )
                     .all()
                 )
-                #[(datetime.date(2022, 7, 1), '8:52.9', 2000), (datetime.date(2023, 2, 14), '52:59.8', 12000)]
+                #[(datetime.date(2022, 7, 1), '8:52.9', 2000, 532.9), (datetime.date(2023, 2, 14), '52:59.8', 12000, 3179.8)]
                 workouts_dtm: List[
                     WorkoutsDTMSchema
                 ] = process_dtm_workouts(team_workouts_dtm)
@@ -574,6 +653,7 @@ async def write_team(teamData: PostTeamDataSchema, authorization: str = Header(.
             for key in user_patch:
                 setattr(user, key, user_patch[key])
             session.commit()
+            identity_cache.invalidate(auth_uid)
             return JSONResponse(
                 content={"team_id": new_team_id, "team_name": teamData.teamName}
             )
@@ -658,6 +738,7 @@ async def write_join_team(
             setattr(user, "team", team_id)
             # AthleteTable[user] = new_user_info.dict()
             session.commit()
+            identity_cache.invalidate(auth_uid)
             return JSONResponse(
                 content={
                     "message": "user update successful - team joined",
@@ -687,10 +768,9 @@ async def read_teamlog(authorization: str = Header(...)):
         auth_uid = validate_user_token(authorization)
         # get user_ids for team members
         with Session() as session:
-            user_id = get_user_id(auth_uid, session)
-            team_id = (
-                session.query(AthleteTable.team).filter_by(user_id=user_id).first()[0]
-            )
+            athlete = get_athlete(auth_uid, session)
+            user_id = athlete.user_id
+            team_id = athlete.team
             team_members = (
                 session.query(AthleteTable).filter(AthleteTable.team == team_id).all()
             )
@@ -734,10 +814,9 @@ async def read_team_info(authorization: str = Header(...)):
         # check authorized request
         auth_uid = validate_user_token(authorization)
         with Session() as session:
-            user_id = get_user_id(auth_uid, session)
-            team_id = (
-                session.query(AthleteTable.team).filter_by(user_id=user_id).first()[0]
-            )
+            athlete = get_athlete(auth_uid, session)
+            user_id = athlete.user_id
+            team_id = athlete.team
             team_info_inst = session.query(TeamTable).filter_by(team_id=team_id).first()
             team_info_dict = {
                 k: v
@@ -787,6 +866,7 @@ async def update_admin(new_admin_id: int, authorization: str = Header(...)):
             setattr(old_admin, "team_admin", False)
             setattr(new_admin, "team_admin", True)
             session.commit()
+            identity_cache.invalidate(auth_uid, user_id=new_admin_id)
             return JSONResponse(content={"message": "Update successful"})
     except InvalidTokenError as e:
         log.error("Invalid Token Error", error_message=str(e))
@@ -0,0 +1,93 @@
+"""
+Batched workout metrics.
+
+Duration columns ("8:52.9", "1:02:13.4") are parsed in one pass and watts, calories, pace and
+split variance are computed for whole columns at once. Every value goes through the same float
+operations, in the same order, as the original one-row-at-a-time helpers, so results are
+identical - including where math.ceil / round sit on a boundary.
+"""
+import math
+from typing import Iterable, List, NamedTuple, Sequence
+
+
+class WorkoutSummary(NamedTuple):
+    time_sec: float
+    split_sec: float
+    split_var: float
+    watts: int
+    cal: int
+
+
+def _parse_duration(components: List[str]) -> float:
+    # same order of conversion and accumulation as the fast paths below
+    values = [float(component) for component in components]
+    seconds = values.pop()
+    if values:
+        seconds += values.pop() * 60
+    if values:
+        seconds += values.pop() * 3600
+    return seconds
+
+
+def durations_to_seconds(durations: Iterable[str]) -> List[float]:
+    """[h:]m:s.f strings -> seconds"""
+    seconds = []
+    append = seconds.append
+    for duration in durations:
+        components = duration.split(":")
+        num_components = len(components)
+        if num_components == 2:
+            minutes = float(components[0])
+            append(float(components[1]) + minutes * 60)
+        elif num_components == 3:
+            hours = float(components[0])
+            minutes = float(components[1])
+            append(float(components[2]) + minutes * 60 + hours * 3600)
+        else:
+            append(_parse_duration(components))
+    return seconds
+
+
+def paces(split_seconds: Iterable[float]) -> List[float]:
+    """500m split seconds -> seconds per meter"""
+    return [split / 500 for split in split_seconds]
+
+
+def watts(split_seconds: Iterable[float]) -> List[int]:
+    """Concept2 watts for each 500m split"""
+    ceil = math.ceil
+    return [ceil(2.8 / pace**3) for pace in paces(split_seconds)]
+
+
+def calories(time_seconds: Iterable[float], watts_column: Iterable[int]) -> List[int]:
+    cals = []
+    for seconds, row_watts in zip(time_seconds, watts_column):
+        time_hour = seconds / 3600
+        # W -> kW 1 | kWh = 860 kCal | efficiency 25% | just living 300kCal/h
+        cals.append(math.ceil(row_watts / 1000 * time_hour * 860 * 4 + 300 * time_hour))
+    return cals
+
+
+def split_variance(split_seconds: Sequence[float]) -> float:
+    """Spread between slowest and fastest split, 0 if there are none"""
+    if not split_seconds:
+        return 0
+    return round(max(split_seconds) - min(split_seconds), 1)
+
+
+def workout_summary(table_metrics: Sequence[dict]) -> WorkoutSummary:
+    """
+    Metrics stored with a workout. table_metrics[0] is the whole workout, the rest are
+    subworkouts - each time / split string is parsed once.
+    """
+    split_seconds = durations_to_seconds(row["split"] for row in table_metrics)
+    time_seconds = durations_to_seconds([table_metrics[0]["time"]])
+    workout_watts = watts(split_seconds[:1])
+    workout_cals = calories(time_seconds, workout_watts)
+    return WorkoutSummary(
+        time_sec=time_seconds[0],
+        split_sec=split_seconds[0],
+        split_var=split_variance(split_seconds[1:]),
+        watts=workout_watts[0],
+        cal=workout_cals[0],
+    )
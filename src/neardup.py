@@ -0,0 +1,116 @@
+"""
+Reuse OCR for erg photos re-sent with different bytes but the same image.
+
+Athletes often send the same photo more than once - forwarded through a messaging app, exported
+from the gallery, with metadata rewritten or bytes appended after the JPEG end marker. The file
+sha256 differs so the OCR library never hits. Instead each recent upload is indexed per user by a
+content key: a sha256 of the JPEG's image data only (quantization / huffman tables, frame + scan
+headers, entropy-coded data through EOI) plus its EXIF orientation, skipping the metadata segments
+(APP0 JFIF, APP1 EXIF / XMP, APP13 IPTC, COM) and anything after EOI. Equal keys decode to the
+same pixels, so the stored OCR is reused as is.
+
+The key is computed by walking the JPEG segment headers - nothing is decoded. Recompressed or
+re-shot photos get a different key and go to Textract: perceptual matching (dHash + LCD text
+signature) couldn't tell a re-shot from a different workout on the same screen layout.
+"""
+import hashlib
+import threading
+from io import BytesIO
+from typing import Optional
+import yaml
+from PIL import Image
+
+from src.cache import TtlCache
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+NEAR_DUP_CONFIG = config_data.get("near_dup", {})
+NEAR_DUP_ENABLED = NEAR_DUP_CONFIG.get("enabled", True)
+NEAR_DUP_WINDOW_SECONDS = NEAR_DUP_CONFIG.get("window_seconds", 120)
+NEAR_DUP_MAX_ENTRIES = NEAR_DUP_CONFIG.get("max_entries", 10000)
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+SOS = 0xDA
+# metadata segments that don't change the decoded pixels - orientation is read from EXIF separately
+METADATA_MARKERS = {0xE0, 0xE1, 0xED, 0xFE}
+# segments without a length field
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+EXIF_ORIENTATION = 0x0112
+
+
+def image_content_key(image_bytes: bytes) -> Optional[str]:
+    """sha256 of the JPEG's image data + EXIF orientation, None for anything that isn't a well-formed JPEG"""
+    if not image_bytes.startswith(SOI):
+        return None
+    content = hashlib.sha256()
+    pos = len(SOI)
+    while pos + 4 <= len(image_bytes):
+        if image_bytes[pos] != 0xFF:
+            return None
+        marker = image_bytes[pos + 1]
+        if marker == 0xFF:
+            # fill byte before a marker
+            pos += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            pos += 2
+            continue
+        segment_end = pos + 2 + int.from_bytes(image_bytes[pos + 2:pos + 4], "big")
+        if marker == SOS:
+            # entropy-coded data can't contain EOI (0xFF is stuffed), the first one ends the image
+            eoi = image_bytes.find(EOI, segment_end)
+            if eoi == -1:
+                return None
+            content.update(image_bytes[pos:eoi])
+            break
+        if marker not in METADATA_MARKERS:
+            content.update(image_bytes[pos:segment_end])
+        pos = segment_end
+    else:
+        return None
+    try:
+        # parses the headers only
+        orientation = Image.open(BytesIO(image_bytes)).getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return None
+    content.update(str(orientation).encode())
+    return content.hexdigest()
+
+
+class NearDupIndex:
+    """(user_id, content key) -> photo_hash of that user's recent uploads, expiring after window_seconds"""
+
+    def __init__(self, window_seconds: float = NEAR_DUP_WINDOW_SECONDS, max_entries: int = NEAR_DUP_MAX_ENTRIES):
+        self.window_seconds = window_seconds
+        self._recent = TtlCache(max_entries, window_seconds)
+        self._lock = threading.Lock()
+        self.textract_calls_avoided = 0
+
+    def find(self, user_id: int, content_key: str) -> Optional[str]:
+        """photo_hash of a recent upload from this user with the same image, None if there isn't one"""
+        return self._recent.get((user_id, content_key))
+
+    def add(self, user_id: int, content_key: str, photo_hash: str) -> None:
+        self._recent.put((user_id, content_key), photo_hash)
+
+    def record_reuse(self) -> None:
+        """Called when a match's stored OCR was reused instead of calling Textract"""
+        with self._lock:
+            self.textract_calls_avoided += 1
+
+    def stats(self) -> dict:
+        recent = self._recent.stats()
+        return {
+            "entries": recent["entries"],
+            "lookups": recent["hits"] + recent["misses"],
+            "matches": recent["hits"],
+            "evictions": recent["evictions"],
+            "textract_calls_avoided": self.textract_calls_avoided,
+            "window_seconds": self.window_seconds,
+        }
+
+
+near_dup_index = NearDupIndex()
@@ -1,86 +1,199 @@
-from typing import List, Dict, Union
-import pandas as pd
+from typing import List, Dict, Optional, Tuple, Union
 import boto3
+from botocore.config import Config as BotoConfig
 import pdb
+import threading
+import time
 import yaml
 import structlog
 from src.schemas import OcrDataReturn, CleanMetaReturn, WorkoutDataReturn
-from src.schemas import CustomError, CellData
+from src.schemas import CustomError
+from src.resilience import ResilientCaller
+from src.logconfig import DEBUG_LOGGING
 
 # Load config file values
 with open("config/config.yaml", "r") as f:
     config_data = yaml.load(f, Loader=yaml.FullLoader)
 
-ACCESS_KEY = config_data["AWS_ACCESS_KEY_ID"]
-SECRET_KEY = config_data["AWS_SECRET_ACCESS_KEY"]
-
-client = boto3.client(
-    "textract",
-    aws_access_key_id=ACCESS_KEY,
-    aws_secret_access_key=SECRET_KEY,
-    region_name="us-east-1",
-)
+ACCESS_KEY = config_data.get("AWS_ACCESS_KEY_ID")
+SECRET_KEY = config_data.get("AWS_SECRET_ACCESS_KEY")
 
 log = structlog.get_logger()
 
+TEXTRACT_CONNECT_TIMEOUT_SECONDS = config_data.get("textract_resilience", {}).get("connect_timeout_seconds", 5)
+TEXTRACT_READ_TIMEOUT_SECONDS = config_data.get("textract_resilience", {}).get("read_timeout_seconds", 15)
+
+_textract_client = None
+_textract_client_lock = threading.Lock()
+# retries / adaptive concurrency / circuit breaker shared by every Textract call in the process
+textract_caller = ResilientCaller("hit_textract_api")
+
+
+def get_textract_client():
+    """boto3 client, created on first use so importing the parser doesn't need AWS"""
+    global _textract_client
+    with _textract_client_lock:
+        if _textract_client is None:
+            _textract_client = boto3.client(
+                "textract",
+                aws_access_key_id=ACCESS_KEY,
+                aws_secret_access_key=SECRET_KEY,
+                region_name="us-east-1",
+                # retries are done by textract_caller, which knows the request's deadline
+                config=BotoConfig(
+                    retries={"max_attempts": 1, "mode": "standard"},
+                    connect_timeout=TEXTRACT_CONNECT_TIMEOUT_SECONDS,
+                    read_timeout=TEXTRACT_READ_TIMEOUT_SECONDS,
+                ),
+            )
+        return _textract_client
+
+
+def analyze_document(erg_image_bytearray):
+    return get_textract_client().analyze_document(
+        Document={"Bytes": erg_image_bytearray}, FeatureTypes=["TABLES"]
+    )
+
 
 def hit_textract_api(erg_image_bytearray):
-    try:
-        return client.analyze_document(
-            Document={"Bytes": erg_image_bytearray}, FeatureTypes=["TABLES"]
-        )
-    except Exception as e:
-        raise CustomError(status_code=500, message=f"hit_textract_api failed, {e}")
-        
+    return textract_caller.call(analyze_document, erg_image_bytearray)
+
+
+class OcrDocumentIndex:
+    """
+    Everything the parser stages look up in a Textract response, built in a single pass over its blocks:
+    word text by id, CELL and LINE blocks in reading order and where the "time" header word sits
+    """
+
+    def __init__(self, raw_response: dict):
+        self.blocks_by_type: Dict[str, List[dict]] = {}
+        for block in raw_response["Blocks"]:
+            block_type = block["BlockType"]
+            blocks = self.blocks_by_type.get(block_type)
+            if blocks is None:
+                blocks = self.blocks_by_type[block_type] = []
+            blocks.append(block)
+        # {word_id : word_text}
+        self.word_index: Dict[str, str] = {block["Id"]: block["Text"] for block in self.blocks_by_type.get("WORD", ())}
+        self.cell_blocks: List[dict] = self.blocks_by_type.get("CELL", [])
+        self.line_blocks: List[dict] = self.blocks_by_type.get("LINE", [])
+        # first word reading "time" - start of the table's header row, end of the metadata
+        self.time_id: Optional[str] = None
+        for word_id, text in self.word_index.items():
+            if text == "time":
+                self.time_id = word_id
+                break
+        # the header sits near the top of the table / end of the metadata lines, scans stop early
+        self.time_cell_position = self._find_time(self.cell_blocks)
+        self.time_line_position = self._find_time(self.line_blocks)
+
+    def _find_time(self, blocks: List[dict]) -> Optional[int]:
+        """Position of the first block whose child words include the "time" word"""
+        if self.time_id is None:
+            return None
+        for position, block in enumerate(blocks):
+            if "Relationships" in block and self.time_id in block["Relationships"][0]["Ids"]:
+                return position
+        return None
+
+    @property
+    def time_row_index(self) -> Optional[int]:
+        """RowIndex of the table's header row"""
+        if self.time_cell_position is None:
+            return None
+        return self.cell_blocks[self.time_cell_position]["RowIndex"]
 
 
 # Extract Workout Data - Create List[dict] with table data: row, column, text, text_id
-def create_word_index(image_raw_response: dict) -> dict:
-    # pdb.set_trace()
+def build_document_index(image_raw_response: dict) -> OcrDocumentIndex:
     try:
-        # create dict {word_id : word_text}
-        word_blocks: List[dict] = [
-            block
-            for block in image_raw_response["Blocks"]
-            if block["BlockType"] == "WORD"
-        ]
-        word_index = {}
-        for block in word_blocks:
-            word_index[block["Id"]] = block["Text"]
-        return word_index
+        return OcrDocumentIndex(image_raw_response)
     except Exception as e:
-        raise CustomError(status_code=500, message=f"create_word_index failed, {e}")
+        raise CustomError(status_code=500, message=f"build_document_index failed, {e}")
 
 
-def remove_blocks_before_time(word_index, cell_blocks) -> dict:
+def remove_blocks_before_time(doc_index: OcrDocumentIndex) -> Tuple[List[dict], int]:
     # DELETE cells before 'time'
-    # get time_id
-    for key, value in word_index.items():
-        if value == "time":
-            time_id = key
-            break
-    # find index of block in cell_blocks with text == 'time'
-    time_index = 0
-    time_row_index = 0
-    for block in cell_blocks:
-        # if cell empty and before "time" or populated and before 'time'
-        if (not "Relationships" in block.keys()) or (
-            not time_id in block["Relationships"][0]["Ids"]
-        ):
-            log.debug("remove", row=block["RowIndex"], col=block["ColumnIndex"])
-            time_index += 1
-        else:
-            time_row_index = block["RowIndex"]
-            break
+    cell_blocks = doc_index.cell_blocks
+    if doc_index.time_id is None and any("Relationships" in block for block in cell_blocks):
+        raise ValueError("no 'time' word in OCR response")
     # if time not in any cells
-    if not time_row_index:
+    if not doc_index.time_row_index:
         return cell_blocks, 1
     # remove  all blocks before 'time' block
-    return cell_blocks[time_index:], time_row_index
+    return cell_blocks[doc_index.time_cell_position:], doc_index.time_row_index
+
+
+class CellTable:
+    """
+    Table cells in reading order, stored column-wise: parallel row / col / text / text_ids lists
+    instead of a dict per cell. Cells are addressed by position (-1 is the most recently added cell)
+    like the list of cell dicts this replaces - the merged-column fixes rely on that order.
+    """
 
+    __slots__ = ("rows", "cols", "texts", "text_ids")
 
-def process_merged_cols(cell_blocks, time_row_index, word_index):
-    table_data = []
+    def __init__(self):
+        self.rows: List[int] = []
+        self.cols: List[int] = []
+        # words in the cell - usually one, two for merged rows (variable intervals)
+        self.texts: List[List[str]] = []
+        # Textract word ids, or a note on how the cell was altered - for debugging only
+        self.text_ids: List[list] = []
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __repr__(self) -> str:
+        return " | ".join(
+            f"r{row}c{col} {' '.join(str(word) for word in text)}"
+            for row, col, text in zip(self.rows, self.cols, self.texts)
+        )
+
+    def append(self, row: int, col: int, text: List[str], text_ids: list) -> None:
+        self.rows.append(row)
+        self.cols.append(col)
+        self.texts.append(text)
+        self.text_ids.append(text_ids)
+
+    def insert(self, position: int, row: int, col: int, text: List[str], text_ids: list) -> None:
+        self.rows.insert(position, row)
+        self.cols.insert(position, col)
+        self.texts.insert(position, text)
+        self.text_ids.insert(position, text_ids)
+
+    def pop(self) -> None:
+        """Remove the most recently added cell"""
+        del self.rows[-1], self.cols[-1], self.texts[-1], self.text_ids[-1]
+
+    def drop_before(self, position: int) -> None:
+        if position:
+            del self.rows[:position], self.cols[:position], self.texts[:position], self.text_ids[:position]
+
+    def add_empty_column_after_every(self, group_size: int, col: int) -> None:
+        """
+        Insert an empty cell in column col after every complete group of group_size cells, in one pass
+        (the i-th inserted cell gets row first row + i)
+        """
+        num_groups = len(self.rows) // group_size
+        first_row = self.rows[0]
+        columns = [self.rows, self.cols, self.texts, self.text_ids]
+        rebuilt = [[], [], [], []]
+        for i in range(num_groups):
+            start = i * group_size
+            for old, new in zip(columns, rebuilt):
+                new.extend(old[start:start + group_size])
+            rebuilt[0].append(first_row + i)
+            rebuilt[1].append(col)
+            rebuilt[2].append([""])
+            rebuilt[3].append([])
+        for old, new in zip(columns, rebuilt):
+            new.extend(old[num_groups * group_size:])
+        self.rows, self.cols, self.texts, self.text_ids = rebuilt
+
+
+def process_merged_cols(cell_blocks, time_row_index, word_index) -> CellTable:
+    cells = CellTable()
     # create a list of all the ids for words corresponding to workout data (no col heads)
     block_text_ids = []
     for block in cell_blocks:
@@ -93,13 +206,7 @@ def process_merged_cols(cell_blocks, time_row_index, word_index):
                 continue
     # Create first row - will become column headings in future function
     for c in range(6):
-        cell_data = {
-            "row": 1,
-            "col": c + 1,
-            "text": ["time"],
-            "text_id": [""],
-        }
-        table_data.append(cell_data)
+        cells.append(1, c + 1, ["time"], [""])
     # find num rows (last rowindex - 'time' rowIndex)
     num_rows = cell_blocks[-1]["RowIndex"] - time_row_index
     # determin if HR is in data by checking if 5th word is int (i.e. HR) or str(time row2)
@@ -114,59 +221,26 @@ def process_merged_cols(cell_blocks, time_row_index, word_index):
         for c in range(1, 6):  # cols 1-5
             # add empty HR cell - no HR data
             if not hr_present and c == 5:
-                cell_data = {
-                    "row": r,
-                    "col": 5,
-                    "text": [""],
-                }
+                cells.append(r, 5, [""], [])
             else:
-                cell_data = {
-                    "row": r,
-                    "col": c,
-                    "text": [word_index[block_text_ids[i]]],
-                    "text_id": [block_text_ids[i]],
-                }
+                cells.append(r, c, [word_index[block_text_ids[i]]], [block_text_ids[i]])
                 i += 1
-            table_data.append(cell_data)
-    return table_data
-
-
-def add_empty_cell_if_needed(table_data, block) -> Union[dict, bool]:
-    # if previous block didn't correct empty cell, add empty entry - see FIX  below
-    # fix (i.e. not needed) would apply if SR had been lumped in with split or HR lumped in with SR
-    # if fixed: when processing split/SR, unmerged SR/HR cell would have been added 
-    if not (
-        table_data[-1]["row"] == block["RowIndex"]
-        and table_data[-1]["col"] == block["ColumnIndex"]
-    ):
-        cell_data = {
-            "row": block["RowIndex"],
-            "col": block["ColumnIndex"],
-            "text": [""],
-        }
-        return cell_data
-    return False
+    return cells
 
 
-def extract_table_data(image_raw_response: dict, word_index: dict) -> Union[List[CellData], bool]:
+def extract_table_data(doc_index: OcrDocumentIndex) -> Union[CellTable, bool]:
     try:
-        # create list of cell  blocks
-        cell_blocks: List[dict] = [
-            block
-            for block in image_raw_response["Blocks"]
-            if block["BlockType"] == "CELL"
-        ]
-
+        word_index = doc_index.word_index
         # No table detected in photo
-        if not cell_blocks:
+        if not doc_index.cell_blocks:
             return False
 
-        cell_blocks, time_row_index = remove_blocks_before_time(word_index, cell_blocks)
-        log.debug(f"cell blocks len: {len(cell_blocks)}")
+        cell_blocks, time_row_index = remove_blocks_before_time(doc_index)
+        log.debug("cell blocks", count=len(cell_blocks))
 
         # CHECK number of columns
         num_cols = cell_blocks[-1]["ColumnIndex"]
-        log.debug(f"num cols: {num_cols}")
+        log.debug("num cols", num_cols=num_cols)
 
         if not 1 < num_cols < 7:
             raise CustomError(status_code=500, message="extract_table_data failed, invalid column count")
@@ -188,182 +262,135 @@ def extract_table_data(image_raw_response: dict, word_index: dict) -> Union[List
         # if num cols is 2 or three seperate merged cols:
         if num_cols < 4:
             log.info("Merged cols detected")
-            table_data = process_merged_cols(
+            cells = process_merged_cols(
                 cell_blocks, time_row_index, word_index
             )  # TODO: come back to add HR
         else: #Num cols = 4 or 5 => most common case
-            table_data = []
+            cells = CellTable()
+            rows, cols, texts, text_ids = cells.rows, cells.cols, cells.texts, cells.text_ids
             for block in cell_blocks:
+                row = block["RowIndex"]
+                col = block["ColumnIndex"]
                 #  if cell is empty, add empty entry.
-                if not "Relationships" in block.keys():
-                    cell_data = add_empty_cell_if_needed(table_data, block)
-                    if cell_data:
-                        table_data.append(cell_data)
+                if not "Relationships" in block:
+                    # unless the previous block already filled this cell - see FIX below
+                    # fix would apply if SR had been lumped in with split or HR lumped in with SR
+                    # if fixed: when processing split/SR, unmerged SR/HR cell would have been added
+                    if not (rows[-1] == row and cols[-1] == col):
+                        cells.append(row, col, [""], [])
+                    continue
                 # deal with cells in columns 1-5 that have content
-                elif "Relationships" in block.keys():
-                    cell_data = {"row": None, "col": None, "text": [], "text_ids": []}
-                    cell_data["row"] = block["RowIndex"]
-                    cell_data["col"] = block["ColumnIndex"]
-                    for word_id in block["Relationships"][0]["Ids"]:
-                        cell_data["text_ids"].append(word_id)
-                    for word_id in cell_data["text_ids"]:
-                        cell_data["text"].append(word_index[word_id])
-                    table_data.append(cell_data)
-                    # FIX for when stroke rate gets lumped in with split in Col3 but still recognized as two words
-                    if block["ColumnIndex"] == 3 and len(cell_data["text_ids"]) > 1:
-                        table_data.append(
-                            {
-                                "row": block["RowIndex"],
-                                "col": 4,
-                                "text": [word_index[cell_data["text_ids"][-1]]],
-                                "text_id": [cell_data["text_ids"][-1]],
-                            }
-                        )
-
-                    # FIX HR gets lumped in with SR in col4 either as two words or as one
-                    if block["ColumnIndex"] == 4 and (
-                        len(cell_data["text_ids"]) > 1
-                        or 4 < len(cell_data["text"][0])
-                    ):
-                        # delete most recent cell entry in table_data - it contains the merged SR/HR data
-                        del table_data[-1]
-                        # SubFix: Split, SR and HR all lumped together as seperate words *rare
-                        # pdb.set_trace()
-                        if len(cell_data["text"]) == 3 and not table_data[-1]['text']:
-                            # split cell currently an empty cell. Fill content
-                            table_data[-1]['text_ids'] = [cell_data['text_ids'][0]]
-                            table_data[-1]['text'] = [cell_data['text'][0]]
-                            del cell_data['text_ids'][0]
-                            del cell_data['text'][0]
-                        #Subfix: Split, SR, HR lumped together as one word with spaces *rare
-                        if len(cell_data['text'][0]) > 7 and not table_data[-1]['text'][0]:
-                            text = cell_data['text'][0].strip() 
-                            table_data[-1]['text_ids'] = ['fm SR']
-                            table_data[-1]['text'] = [text[:6]]
-                            cell_data['text'][0] = text[6:]
-                        # isolate SR and HR data
-                        if len(cell_data["text_ids"]) > 1:
-                            sr = cell_data["text"][0]
-                            hr = cell_data["text"][1]
-                            sr_text_id = cell_data["text_ids"][0]
-                            hr_text_id = ["from SR"]  # for debugging
-                        else:
-                            sr = cell_data["text"][0][:2]
-                            hr = cell_data["text"][0][2:].strip()
-                            sr_text_id = ["altered - SRHR split"]  # for debugging
-                            hr_text_id = ["from SR"]  # for debugging
-                        table_data.append(
-                            {
-                                "row": block["RowIndex"],
-                                "col": 4,
-                                "text": [sr],
-                                "text_id": sr_text_id,
-                            }
-                        )
-                        table_data.append(
-                            {
-                                "row": block["RowIndex"],
-                                "col": 5,
-                                "text": [hr],
-                                "text_id": hr_text_id,
-                            }
-                        )
-                        # add HR column heading if missing
-                        if table_data[4]["row"] == 2:
-                            hr_head = {
-                                "row": table_data[0]["row"],
-                                "col": 5,
-                                "text": ["hr"],
-                                "text_id": ["text hard coded"],
-                            }
-
-                            table_data.insert(4, hr_head)
-                    # FIX SR gets lumped in with HR in col5 either as two words or as one (* assumes len(sr)==2, len(hr)==3)
-                    if block["ColumnIndex"] == 5 and (
-                        len(cell_data["text_ids"]) > 1
-                        or 4 < len(cell_data["text"][0]) < 7
-                    ):
-                        # cell most recently added to table_data will be missing text - populate it from this HR cell
-                        if len(cell_data["text_ids"]) > 1:
-                            table_data[-2]["text"][0] = cell_data["text"][0]
-                            table_data[-2]["text_ids"] = [
-                                "from HR"
-                            ]  # not neccessary but helpful for debugging
-                            del table_data[-1]["text"][0]
-                            del table_data[-1]["text_ids"][
-                                0
-                            ]  # not neccessary but cleaner
-                        else:
-                            sr = cell_data["text"][0][:2]
-                            hr = cell_data["text"][0][2:].strip()
-                            table_data[-2]["text"][0] = sr
-                            table_data[-2]["text_ids"] = [
-                                "from HR"
-                            ]  # not neccessary - helpful for debugging
-                            table_data[-1]["text"][0] = hr
-                            table_data[-1]["text_ids"] = [
-                                "altered - SRHR split"
-                            ]  # not neccessary - helpful for debugging
+                cell_text_ids = list(block["Relationships"][0]["Ids"])
+                cell_text = [word_index[word_id] for word_id in cell_text_ids]
+                cells.append(row, col, cell_text, cell_text_ids)
+                # FIX for when stroke rate gets lumped in with split in Col3 but still recognized as two words
+                if col == 3 and len(cell_text_ids) > 1:
+                    cells.append(row, 4, [word_index[cell_text_ids[-1]]], [cell_text_ids[-1]])
+
+                # FIX HR gets lumped in with SR in col4 either as two words or as one
+                if col == 4 and (len(cell_text_ids) > 1 or 4 < len(cell_text[0])):
+                    # delete most recent cell entry - it contains the merged SR/HR data
+                    cells.pop()
+                    # SubFix: Split, SR and HR all lumped together as seperate words *rare
+                    if len(cell_text) == 3 and not texts[-1]:
+                        # split cell currently an empty cell. Fill content
+                        text_ids[-1] = [cell_text_ids[0]]
+                        texts[-1] = [cell_text[0]]
+                        del cell_text_ids[0]
+                        del cell_text[0]
+                    #Subfix: Split, SR, HR lumped together as one word with spaces *rare
+                    if len(cell_text[0]) > 7 and not texts[-1][0]:
+                        text = cell_text[0].strip()
+                        text_ids[-1] = ['fm SR']
+                        texts[-1] = [text[:6]]
+                        cell_text[0] = text[6:]
+                    # isolate SR and HR data
+                    if len(cell_text_ids) > 1:
+                        sr = cell_text[0]
+                        hr = cell_text[1]
+                        sr_text_id = cell_text_ids[0]
+                        hr_text_id = ["from SR"]  # for debugging
+                    else:
+                        sr = cell_text[0][:2]
+                        hr = cell_text[0][2:].strip()
+                        sr_text_id = ["altered - SRHR split"]  # for debugging
+                        hr_text_id = ["from SR"]  # for debugging
+                    cells.append(row, 4, [sr], sr_text_id)
+                    cells.append(row, 5, [hr], hr_text_id)
+                    # add HR column heading if missing
+                    if rows[4] == 2:
+                        cells.insert(4, rows[0], 5, ["hr"], ["text hard coded"])
+                # FIX SR gets lumped in with HR in col5 either as two words or as one (* assumes len(sr)==2, len(hr)==3)
+                if col == 5 and (len(cell_text_ids) > 1 or 4 < len(cell_text[0]) < 7):
+                    # cell added before this HR cell will be missing text - populate it from this HR cell
+                    if len(cell_text_ids) > 1:
+                        texts[-2][0] = cell_text[0]
+                        text_ids[-2] = ["from HR"]  # not neccessary but helpful for debugging
+                        del texts[-1][0]
+                        del text_ids[-1][0]  # not neccessary but cleaner
+                    else:
+                        sr = cell_text[0][:2]
+                        hr = cell_text[0][2:].strip()
+                        texts[-2][0] = sr
+                        text_ids[-2] = ["from HR"]  # not neccessary - helpful for debugging
+                        texts[-1][0] = hr
+                        text_ids[-1] = ["altered - SRHR split"]  # not neccessary - helpful for debugging
             # Add HR col - all empty
-            if num_cols == 4 and table_data[-1]["col"] == 4:
-                for i in range(len(table_data) // 4):
-                    hr_index = (i + 1) * 5 - 1
-                    first_data_row = table_data[0]["row"]
-                    cell_data = {
-                        "row": first_data_row + i,
-                        "col": 5,
-                        "text": [""],
-                    }
-                    table_data.insert(hr_index, cell_data)
-        return table_data
+            if num_cols == 4 and cols[-1] == 4:
+                cells.add_empty_column_after_every(4, col=5)
+        return cells
     except Exception as e:
         raise CustomError(status_code=500, message=f"extract_table_data failed, {e}")
 
 
-def clean_table_data(table_data: List[dict]):
+def clean_table_data(cells: CellTable) -> CellTable:
     """clean workout data - replace column labels & change "," for "."""
     try:
         # remove all cells before 'time'
-        while "time" not in table_data[0]["text"]:
-            del table_data[0]
+        for position, text in enumerate(cells.texts):
+            if "time" in text:
+                cells.drop_before(position)
+                break
+        else:
+            raise ValueError("no 'time' cell in table")
         # add col headings
-        table_data[0]["text"] = ["time"]
-        table_data[1]["text"] = ["meter"]
-        table_data[2]["text"] = ["split"]
-        table_data[3]["text"] = ["sr"]
-        table_data[4]["text"] = ["hr"]
-        for cell in table_data:
-            for word in cell["text"]:
+        texts = cells.texts
+        texts[0] = ["time"]
+        texts[1] = ["meter"]
+        texts[2] = ["split"]
+        texts[3] = ["sr"]
+        texts[4] = ["hr"]
+        for text in texts:
+            for i, word in enumerate(text):
                 if "," in word:
-                    word_index = cell["text"].index(word)
-                    cell["text"][word_index] = word.replace(",", ".")
-        return table_data
+                    text[i] = word.replace(",", ".")
+        return cells
     except Exception as e:
         raise CustomError(status_code=500, message=f"clean_table_data failed, {e}")
 
 
 # view workout data - visual only
-def compile_workout_data(wo_clean: List[dict], ints_var:bool) -> WorkoutDataReturn:
+def compile_workout_data(wo_clean: CellTable, ints_var:bool) -> WorkoutDataReturn:
     try:
-        col_head_row = wo_clean[0]["row"]
+        col_head_row = wo_clean.rows[0]
         wo_dict = {"time": [], "meter": [], "split": [], "sr": [], "hr": []}
         rest_info = {"time": [], "meter":[]}
-        for cell in wo_clean:
-            if cell["row"] > col_head_row:
-                if cell["col"] == 1:
-                    wo_dict["time"].append(cell["text"][0])
-                    if ints_var and len(cell['text']) == 2:
-                        rest_info['time'].append(cell["text"][1])
-                elif cell["col"] == 2:
-                    wo_dict["meter"].append(cell["text"][0])
-                    if ints_var and len(cell['text']) == 2:
-                        rest_info['meter'].append(cell["text"][1])
-                elif cell["col"] == 3:
-                    wo_dict["split"].append(cell["text"][0])
-                elif cell["col"] == 4:
-                    wo_dict["sr"].append(cell["text"][0])
-                elif cell["col"] == 5:
-                    wo_dict["hr"].append(cell["text"][0])
+        for row, col, text in zip(wo_clean.rows, wo_clean.cols, wo_clean.texts):
+            if row > col_head_row:
+                if col == 1:
+                    wo_dict["time"].append(text[0])
+                    if ints_var and len(text) == 2:
+                        rest_info['time'].append(text[1])
+                elif col == 2:
+                    wo_dict["meter"].append(text[0])
+                    if ints_var and len(text) == 2:
+                        rest_info['meter'].append(text[1])
+                elif col == 3:
+                    wo_dict["split"].append(text[0])
+                elif col == 4:
+                    wo_dict["sr"].append(text[0])
+                elif col == 5:
+                    wo_dict["hr"].append(text[0])
         # delete rest row - interval  workouts show # meters rowed during rest time
         if wo_dict["meter"][-1] and not wo_dict["time"][-1]:
             for lst in wo_dict.values():
@@ -374,22 +401,14 @@ def compile_workout_data(wo_clean: List[dict], ints_var:bool) -> WorkoutDataRetu
 
 
 # extract raw metadata
-def extract_metadata(word_index: dict, image_raw_response: dict) -> List[str]:
-    raw_meta = []
-    line_blocks: List[dict] = [
-        block for block in image_raw_response["Blocks"] if block["BlockType"] == "LINE"
-    ]
-    # find id for word 'time' - beginning of table
-    for id, word in word_index.items():
-        if word == "time":
-            time_id = id
-            break
-    for block in line_blocks:
-        if time_id in block["Relationships"][0]["Ids"]:
-            break
-        else:
-            raw_meta.append(block["Text"])
-    return raw_meta
+def extract_metadata(doc_index: OcrDocumentIndex) -> List[str]:
+    # metadata is every line before the one containing 'time' - beginning of table
+    if doc_index.time_id is None:
+        raise ValueError("no 'time' word in OCR response")
+    line_blocks = doc_index.line_blocks
+    if doc_index.time_line_position is not None:
+        line_blocks = line_blocks[:doc_index.time_line_position]
+    return [block["Text"] for block in line_blocks]
 
 
 # clean metadata
@@ -430,21 +449,49 @@ def clean_metadata(
     return meta_dict
 
 
-def process_raw_ocr(raw_response: dict, photo_hash: str, ints_var:bool) -> OcrDataReturn:
+def format_columns(columns: Dict[str, list]) -> str:
+    """Plain text table of {column heading: values} for debug logs"""
+    columns = {heading: [str(v) for v in (values or [])] for heading, values in columns.items()}
+    num_rows = max((len(values) for values in columns.values()), default=0)
+    widths = {heading: max([len(heading)] + [len(v) for v in values]) for heading, values in columns.items()}
+    lines = ["  ".join(heading.ljust(widths[heading]) for heading in columns)]
+    for i in range(num_rows):
+        lines.append("  ".join(
+            (values[i] if i < len(values) else "").ljust(widths[heading]) for heading, values in columns.items()
+        ))
+    return "\n" + "\n".join(lines)
+
+
+def _lap(timings: Optional[Dict[str, float]], stage: str, t1: float) -> float:
+    """Add time since t1 to timings[stage] (if timings are being recorded), returns now"""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - t1
+    return now
+
+
+def process_raw_ocr(
+    raw_response: dict, photo_hash: str, ints_var:bool, timings: Optional[Dict[str, float]] = None
+) -> OcrDataReturn:
     """
     Receives raw OCR, photo_hash & whether workout is a variable interval workout
+    Optionally timings dict - filled with seconds spent per stage (index, table, workout, metadata, output)
     Attempt to process raw OCR data into desired format 
     Return processed data
     """
-    word_index = create_word_index(raw_response)
+    t1 = time.perf_counter()
+    doc_index = build_document_index(raw_response)
+    t1 = _lap(timings, "index", t1)
+    word_index = doc_index.word_index
     if not word_index:
         raise CustomError(status_code=400, message=f'No words detected in image')
-    table_data = extract_table_data(raw_response, word_index)
+    table_data = extract_table_data(doc_index)
+    t1 = _lap(timings, "table", t1)
     log.debug("Table data: ", data=table_data)
     rest_info = {'time': [], 'meter': []}
     # No table detected in photo or only summary data extracted 
     use_shortcut_for_all = False 
-    if not table_data or (table_data[0]['text']==['time'] and table_data[-1]['row']==2) or use_shortcut_for_all:
+    if not table_data or (table_data.texts[0]==['time'] and table_data.rows[-1]==2) or use_shortcut_for_all:
         relevant_data = non_table_processing(word_index)
         log.debug("Relevant Data", data=relevant_data)
         workout_data = compile_workoutdata_from_non_table_data(relevant_data)
@@ -472,37 +519,39 @@ def process_raw_ocr(raw_response: dict, photo_hash: str, ints_var:bool) -> OcrDa
             workout_data.hr.insert(0,av_hr) 
 
     log.debug("workout_data: ", data=workout_data)
+    t1 = _lap(timings, "workout", t1)
 
-    raw_meta = extract_metadata(word_index, raw_response)
+    raw_meta = extract_metadata(doc_index)
     log.debug("raw_meta: ", data=raw_meta)
     clean_meta = clean_metadata(raw_meta)
     log.debug("Variable Intervals rest info", data=rest_info)
-    try: 
-        workout_df = pd.DataFrame(workout_data)
-        meta_df = pd.DataFrame([clean_meta])
-        # Print Pretty
-        log.debug("Metadata Pretty Print", data=meta_df)
-        log.debug("Workout Data Pretty Print", data=workout_df)
-    except:
-        pass
+    t1 = _lap(timings, "metadata", t1)
+    # Print Pretty - only built when debug logs are actually emitted
+    if DEBUG_LOGGING:
+        try:
+            log.debug("Metadata Pretty Print", data=format_columns({key: [value] for key, value in clean_meta.items()}))
+            log.debug("Workout Data Pretty Print", data=format_columns(dict(workout_data)))
+        except Exception:
+            pass
 
     processed_data = OcrDataReturn(
         workout_meta=clean_meta, workout_data=workout_data, photo_hash=[photo_hash], rest_info=rest_info
     )
+    _lap(timings, "output", t1)
     return processed_data
 
-def get_rest_info_fm_merged_rows(wo_clean) -> dict:
+def get_rest_info_fm_merged_rows(wo_clean: CellTable) -> dict:
     try:
         merged_rows = False
         rest_info = {'time': [], 'meter': []}
-        col_head_row = wo_clean[0]["row"]
-        for cell in wo_clean:
-            if cell["row"] > col_head_row:
-                if cell["col"] == 1 and len(cell['text']) == 2:
+        col_head_row = wo_clean.rows[0]
+        for row, col, text in zip(wo_clean.rows, wo_clean.cols, wo_clean.texts):
+            if row > col_head_row:
+                if col == 1 and len(text) == 2:
                     merged_rows = True 
-                    rest_info['time'].append(cell["text"][1])
-                elif cell["col"] == 2 and len(cell['text']) == 2:
-                    rest_info['meter'].append(cell["text"][1])
+                    rest_info['time'].append(text[1])
+                elif col == 2 and len(text) == 2:
+                    rest_info['meter'].append(text[1])
         return rest_info, merged_rows 
     except Exception as e:
         raise CustomError(status_code=500, message=f"get_rest_info_fm_merged_rows failed, {e}")
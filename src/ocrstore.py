@@ -0,0 +1,290 @@
+"""
+Keyed store for raw Textract responses - replaces the whole-file src/rawocr.json library.
+
+Backed by sqlite in WAL mode:
+ - O(1) lookup by photo_hash (primary key)
+ - appends are INSERT OR IGNORE, existing entries are never rewritten
+ - every write is a single atomic transaction, so a crash can't corrupt the library
+ - readers don't block the writer (and vice versa) across Starlette threadpool workers
+An optional in-memory LRU tier (bounded by bytes) sits in front of sqlite so hot
+re-submissions skip disk I/O and json parsing entirely.
+
+Responses are stored in a compact, versioned format: only the block fields process_raw_ocr
+reads, zlib compressed (~15x smaller than the raw response). Set keep_original_ocr in
+config.yaml to also keep the full response (compressed) in raw_ocr_original.
+
+Entries are keyed on the image's sha256 alone. Legacy "<user_name>_<sha256>" keys are
+normalised on every lookup/insert so they keep resolving to the shared entry.
+
+Import an existing JSON library with:
+    python -m src.ocrstore import src/ocrlibrary.json src/rawocr.json
+Re-key entries stored under legacy user-prefixed keys with:
+    python -m src.ocrstore rekey
+Convert entries stored as plain json (before the compact format) with:
+    python -m src.ocrstore compact
+"""
+import re
+import sys
+import json
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import yaml
+import structlog
+
+from src.cache import ByteBoundedLRU
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+RAW_OCR_DB_PATH = config_data.get("raw_ocr_db_path", "src/rawocr.db")
+RAW_OCR_MEMORY_CACHE_MB = config_data.get("raw_ocr_memory_cache_mb", 64)
+KEEP_ORIGINAL_OCR = config_data.get("keep_original_ocr", False)
+
+log = structlog.get_logger()
+
+_LEGACY_KEY = re.compile(r"^.+_([0-9a-f]{64})$")
+
+_SCHEMAS = (
+    """
+    CREATE TABLE IF NOT EXISTS raw_ocr (
+        photo_hash TEXT PRIMARY KEY,
+        response BLOB NOT NULL,
+        created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS raw_ocr_original (
+        photo_hash TEXT PRIMARY KEY,
+        response BLOB NOT NULL
+    )
+    """,
+)
+
+# Storage format versions - first byte of the stored record
+# (plain json records from before the compact format start with "{")
+COMPACT_FORMAT_V1 = 1
+# the only block fields read by src.ocr.process_raw_ocr
+PARSER_BLOCK_FIELDS = ("BlockType", "Id", "Text", "RowIndex", "ColumnIndex", "Relationships")
+
+
+def compact_textract_response(raw_response: dict) -> dict:
+    """Strip Geometry, Confidence etc. - keep only what process_raw_ocr needs"""
+    return {
+        "Blocks": [
+            {field: block[field] for field in PARSER_BLOCK_FIELDS if field in block}
+            for block in raw_response["Blocks"]
+        ]
+    }
+
+
+def encode_ocr_record(raw_response: dict) -> Tuple[bytes, int]:
+    """Returns compact compressed record + size of the compact json (used for memory accounting)"""
+    compact_json = json.dumps(compact_textract_response(raw_response), separators=(",", ":")).encode()
+    return bytes([COMPACT_FORMAT_V1]) + zlib.compress(compact_json), len(compact_json)
+
+
+def decode_ocr_record(record: Union[bytes, str]) -> Tuple[dict, int]:
+    """Returns response + size of its json - reads compact records and legacy plain json records"""
+    if isinstance(record, str):
+        return json.loads(record), len(record)
+    if record[0] == COMPACT_FORMAT_V1:
+        record = zlib.decompress(record[1:])
+    elif record[:1] != b"{":
+        raise ValueError(f"unknown raw OCR record format {record[0]}")
+    return json.loads(record), len(record)
+
+
+def normalize_photo_hash(photo_hash: str) -> str:
+    """Map legacy user-prefixed keys ("<user_name>_<sha256>") to the content hash"""
+    match = _LEGACY_KEY.match(photo_hash)
+    return match.group(1) if match else photo_hash
+
+
+class RawOcrStore:
+    """sqlite backed {photo_hash: raw textract response} library, safe to share between threads"""
+
+    def __init__(self, db_path: str = RAW_OCR_DB_PATH, memory_cache: Optional[ByteBoundedLRU] = None):
+        self.db_path = db_path
+        self.memory_cache = memory_cache
+        # sqlite connections can't be shared across threads - one per thread
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None -> autocommit, transactions are opened explicitly
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for schema in _SCHEMAS:
+                conn.execute(schema)
+            self._local.conn = conn
+        return conn
+
+    def get(self, photo_hash: str) -> Optional[dict]:
+        photo_hash = normalize_photo_hash(photo_hash)
+        if self.memory_cache is not None:
+            raw_response = self.memory_cache.get(photo_hash)
+            if raw_response is not None:
+                return raw_response
+        row = self._conn().execute(
+            "SELECT response FROM raw_ocr WHERE photo_hash = ?", (photo_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        raw_response, nbytes = decode_ocr_record(row[0])
+        if self.memory_cache is not None:
+            self.memory_cache.put(photo_hash, raw_response, nbytes)
+        return raw_response
+
+    def get_original(self, photo_hash: str) -> Optional[dict]:
+        """Full Textract response - only stored when keep_original_ocr is set"""
+        row = self._conn().execute(
+            "SELECT response FROM raw_ocr_original WHERE photo_hash = ?", (normalize_photo_hash(photo_hash),)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def __contains__(self, photo_hash: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM raw_ocr WHERE photo_hash = ?", (normalize_photo_hash(photo_hash),)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM raw_ocr").fetchone()[0]
+
+    def photo_hashes(self) -> List[str]:
+        """All stored photo hashes, in a stable order"""
+        rows = self._conn().execute("SELECT photo_hash FROM raw_ocr ORDER BY photo_hash").fetchall()
+        return [row[0] for row in rows]
+
+    def put(self, photo_hash: str, raw_response: dict) -> bool:
+        """Add entry if not already stored. Returns True if a new entry was written"""
+        photo_hash = normalize_photo_hash(photo_hash)
+        record, nbytes = encode_ocr_record(raw_response)
+        added = self._insert_rows([(photo_hash, record, raw_response)]) == 1
+        if added and self.memory_cache is not None:
+            # cache the compact form so memory holds exactly what a disk read would return
+            self.memory_cache.put(photo_hash, compact_textract_response(raw_response), nbytes)
+        return added
+
+    def put_many(self, entries: Iterable[Tuple[str, dict]]) -> int:
+        """Add entries in one atomic transaction, skipping hashes already stored. Returns num added"""
+        return self._insert_rows(
+            [(normalize_photo_hash(photo_hash), encode_ocr_record(resp)[0], resp) for photo_hash, resp in entries]
+        )
+
+    def _insert_rows(self, rows: List[Tuple[str, bytes, dict]], keep_original: bool = KEEP_ORIGINAL_OCR) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            added = 0
+            for photo_hash, record, raw_response in rows:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO raw_ocr (photo_hash, response) VALUES (?, ?)", (photo_hash, record)
+                )
+                added += cur.rowcount
+                if cur.rowcount and keep_original:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO raw_ocr_original (photo_hash, response) VALUES (?, ?)",
+                        (photo_hash, zlib.compress(json.dumps(raw_response).encode())),
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def import_json_library(self, json_path: str) -> int:
+        """Import a legacy {photo_hash: raw_response} JSON library (e.g. src/ocrlibrary.json)"""
+        with open(json_path, "r") as f:
+            library: Dict[str, dict] = json.load(f)
+        added = self.put_many(library.items())
+        log.info("Imported raw OCR library", path=json_path, entries=len(library), added=added)
+        return added
+
+    def compact_legacy_entries(self, batch_size: int = 500) -> int:
+        """Convert plain json records to the compact format in batches. Returns num converted"""
+        conn = self._conn()
+        converted = 0
+        while True:
+            rows = conn.execute(
+                "SELECT photo_hash, response FROM raw_ocr WHERE typeof(response) = 'text' LIMIT ?",
+                (batch_size,),
+            ).fetchall()
+            if not rows:
+                break
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for photo_hash, legacy_record in rows:
+                    raw_response = decode_ocr_record(legacy_record)[0]
+                    conn.execute(
+                        "UPDATE raw_ocr SET response = ? WHERE photo_hash = ?",
+                        (encode_ocr_record(raw_response)[0], photo_hash),
+                    )
+                    if KEEP_ORIGINAL_OCR:
+                        conn.execute(
+                            "INSERT OR IGNORE INTO raw_ocr_original (photo_hash, response) VALUES (?, ?)",
+                            (photo_hash, zlib.compress(json.dumps(raw_response).encode())),
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            converted += len(rows)
+        log.info("Converted raw OCR entries to compact format", converted=converted)
+        return converted
+
+    def rekey_legacy_entries(self) -> int:
+        """Move entries stored under user-prefixed keys to their content hash. Returns num re-keyed"""
+        conn = self._conn()
+        legacy_keys = [
+            row[0]
+            for row in conn.execute("SELECT photo_hash FROM raw_ocr WHERE photo_hash LIKE '%\\_%' ESCAPE '\\'")
+            if normalize_photo_hash(row[0]) != row[0]
+        ]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key in legacy_keys:
+                conn.execute(
+                    "INSERT OR IGNORE INTO raw_ocr (photo_hash, response, created) "
+                    "SELECT ?, response, created FROM raw_ocr WHERE photo_hash = ?",
+                    (normalize_photo_hash(key), key),
+                )
+                conn.execute("DELETE FROM raw_ocr WHERE photo_hash = ?", (key,))
+                conn.execute(
+                    "UPDATE OR IGNORE raw_ocr_original SET photo_hash = ? WHERE photo_hash = ?",
+                    (normalize_photo_hash(key), key),
+                )
+                conn.execute("DELETE FROM raw_ocr_original WHERE photo_hash = ?", (key,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        log.info("Re-keyed legacy raw OCR entries", rekeyed=len(legacy_keys))
+        return len(legacy_keys)
+
+
+raw_ocr_memory_cache = ByteBoundedLRU(max_bytes=int(RAW_OCR_MEMORY_CACHE_MB * 1024 * 1024))
+raw_ocr_store = RawOcrStore(memory_cache=raw_ocr_memory_cache)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "import":
+        for path in sys.argv[2:]:
+            raw_ocr_store.import_json_library(path)
+    elif len(sys.argv) == 2 and sys.argv[1] == "rekey":
+        raw_ocr_store.rekey_legacy_entries()
+    elif len(sys.argv) == 2 and sys.argv[1] == "compact":
+        raw_ocr_store.compact_legacy_entries()
+    else:
+        print("usage: python -m src.ocrstore import <library.json> [<library.json> ...]")
+        print("       python -m src.ocrstore rekey")
+        print("       python -m src.ocrstore compact")
+        sys.exit(1)
+    print(f"{RAW_OCR_DB_PATH}: {len(raw_ocr_store)} entries")
@@ -0,0 +1,261 @@
+"""
+Retries, adaptive concurrency and circuit breaking for calls to the OCR provider.
+
+- retries: only throttling / transient errors, full-jitter exponential backoff, never past the call's deadline
+- adaptive concurrency (AIMD): the in-flight limit grows by ~1 per limit successes and halves on throttling,
+  so it settles around what the provider actually sustains instead of a fixed pool size
+- circuit breaker: after consecutive throttling/transient failures calls fail fast with a 503 + Retry-After
+  until a trial call succeeds
+"""
+import math
+import random
+import threading
+import time
+from typing import Callable, Optional
+import yaml
+import structlog
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from src.schemas import CustomError
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+RESILIENCE_CONFIG = config_data.get("textract_resilience", {})
+DEADLINE_SECONDS = RESILIENCE_CONFIG.get("deadline_seconds", 20)
+MAX_ATTEMPTS = RESILIENCE_CONFIG.get("max_attempts", 4)
+BACKOFF_BASE_SECONDS = RESILIENCE_CONFIG.get("backoff_base_seconds", 0.25)
+BACKOFF_MAX_SECONDS = RESILIENCE_CONFIG.get("backoff_max_seconds", 4)
+INITIAL_CONCURRENCY = RESILIENCE_CONFIG.get("initial_concurrency", 8)
+MIN_CONCURRENCY = RESILIENCE_CONFIG.get("min_concurrency", 1)
+MAX_CONCURRENCY = RESILIENCE_CONFIG.get("max_concurrency", 32)
+BREAKER_FAILURE_THRESHOLD = RESILIENCE_CONFIG.get("breaker_failure_threshold", 5)
+BREAKER_RESET_SECONDS = RESILIENCE_CONFIG.get("breaker_reset_seconds", 30)
+
+log = structlog.get_logger()
+
+THROTTLE = "throttle"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+TRANSIENT_ERROR_CODES = {"InternalServerError", "ServiceUnavailable", "RequestTimeout", "RequestTimeoutException"}
+
+
+class RetryableError(Exception):
+    """Raised by stand-in providers to simulate throttling / transient provider errors"""
+
+    def __init__(self, message: str, kind: str = TRANSIENT):
+        super().__init__(message)
+        self.kind = kind
+
+
+def classify_error(e: Exception) -> str:
+    if isinstance(e, RetryableError):
+        return e.kind
+    if isinstance(e, ClientError):
+        code = e.response.get("Error", {}).get("Code", "")
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        if code in THROTTLING_ERROR_CODES or status == 429:
+            return THROTTLE
+        if code in TRANSIENT_ERROR_CODES or status >= 500:
+            return TRANSIENT
+        return PERMANENT
+    # connection resets, DNS failures, connect/read timeouts
+    if isinstance(e, (BotoConnectionError, HTTPClientError)):
+        return TRANSIENT
+    return PERMANENT
+
+
+class AdaptiveConcurrencyLimit:
+    """AIMD limit on in-flight calls"""
+
+    def __init__(self, initial: float = INITIAL_CONCURRENCY, minimum: int = MIN_CONCURRENCY, maximum: int = MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._last_decrease = 0.0
+        self.decreases = 0
+
+    def acquire(self, timeout: float) -> bool:
+        end = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome: str, latency: float) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if outcome == THROTTLE:
+                # one decrease per round trip - a burst of throttles from the same window counts once
+                if now - self._last_decrease > latency:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif outcome != TRANSIENT:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "decreases": self.decreases}
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    def retry_after(self) -> Optional[float]:
+        """None if a call may go ahead, else seconds until the provider should be tried again"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return None
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                # let exactly one trial call through
+                self.state = self.HALF_OPEN
+                return None
+            self.rejected += 1
+            return max(remaining, 1.0)
+
+    def cancel_trial(self) -> None:
+        """The trial call let through by retry_after never reached the provider - let the next call try instead"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                    log.warning("Circuit breaker opened", consecutive_failures=self.consecutive_failures)
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "opened": self.opened, "rejected": self.rejected}
+
+
+class ResilientCaller:
+    def __init__(
+        self,
+        name: str,
+        deadline_seconds: float = DEADLINE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        backoff_base_seconds: float = BACKOFF_BASE_SECONDS,
+        backoff_max_seconds: float = BACKOFF_MAX_SECONDS,
+        limiter: Optional[AdaptiveConcurrencyLimit] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.deadline_seconds = deadline_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.limiter = limiter or AdaptiveConcurrencyLimit()
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def _unavailable(self, reason: str, retry_after: float) -> CustomError:
+        with self._lock:
+            self.failures += 1
+        return CustomError(
+            status_code=503, message=f"{self.name} unavailable, {reason}", retry_after=math.ceil(retry_after)
+        )
+
+    def call(self, fn: Callable, *args, deadline: Optional[float] = None):
+        """
+        fn(*args) with retries - deadline is an absolute time.monotonic(), defaults to now + deadline_seconds
+        Raises CustomError 503 (with retry_after) if the provider is throttling/degraded, 500 on permanent errors
+        """
+        deadline = deadline or time.monotonic() + self.deadline_seconds
+        with self._lock:
+            self.calls += 1
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_attempts):
+            retry_after = self.breaker.retry_after()
+            if retry_after is not None:
+                raise self._unavailable("circuit breaker open", retry_after)
+            if not self.limiter.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self.breaker.cancel_trial()
+                raise self._unavailable("concurrency limit reached before deadline", self.backoff_max_seconds)
+            t1 = time.monotonic()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                kind = classify_error(e)
+                self.limiter.release(kind, time.monotonic() - t1)
+                if kind == PERMANENT:
+                    # the provider answered - it's healthy, the request is the problem
+                    self.breaker.record_success()
+                    with self._lock:
+                        self.failures += 1
+                    raise CustomError(status_code=500, message=f"{self.name} failed, {e}")
+                self.breaker.record_failure()
+                last_error = e
+                with self._lock:
+                    self.throttled += kind == THROTTLE
+                delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+                if attempt + 1 == self.max_attempts or time.monotonic() + delay >= deadline:
+                    break
+                log.warning(f"{self.name} {kind} error, retrying", attempt=attempt + 1, delay=delay, error_message=str(e))
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+                continue
+            self.limiter.release("success", time.monotonic() - t1)
+            self.breaker.record_success()
+            return result
+        log.error(f"{self.name} retries exhausted", error_message=str(last_error))
+        raise self._unavailable(str(last_error), self.backoff_max_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            caller_stats = {
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+            }
+        caller_stats["concurrency"] = self.limiter.stats()
+        caller_stats["circuit_breaker"] = self.breaker.stats()
+        return caller_stats
@@ -133,6 +133,8 @@ class LoginRequest(BaseModel):
 
 # Exception
 class CustomError(Exception):
-    def __init__(self, status_code, message):
+    def __init__(self, status_code, message, retry_after=None):
         self.status_code = status_code
         self.message = message
+        # seconds, sent as a Retry-After header
+        self.retry_after = retry_after
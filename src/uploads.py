@@ -0,0 +1,134 @@
+"""
+Bounded background upload queue for erg photos.
+
+A fixed set of worker threads drains a bounded queue of (bucket, image_bytes, photo_hash)
+uploads - bursts can't spawn unbounded threads each holding a full image in memory.
+When the queue is full, the backpressure policy either blocks the request for up to
+block_timeout_seconds ("block") or drops the upload straight away ("drop").
+On shutdown the queue is drained before the worker exits.
+"""
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+import yaml
+import structlog
+
+# Load config file values
+with open("config/config.yaml", "r") as f:
+    config_data = yaml.load(f, Loader=yaml.FullLoader)
+
+UPLOAD_QUEUE_CONFIG = config_data.get("upload_queue", {})
+UPLOAD_WORKERS = UPLOAD_QUEUE_CONFIG.get("workers", 4)
+UPLOAD_MAX_QUEUE = UPLOAD_QUEUE_CONFIG.get("max_queue", 32)
+UPLOAD_BACKPRESSURE = UPLOAD_QUEUE_CONFIG.get("backpressure", "block")
+UPLOAD_BLOCK_TIMEOUT_SECONDS = UPLOAD_QUEUE_CONFIG.get("block_timeout_seconds", 5)
+
+log = structlog.get_logger()
+
+_STOP = object()
+
+
+class UploadQueue:
+    def __init__(
+        self,
+        upload_fn: Callable[[str, bytes, str], None],
+        workers: int = UPLOAD_WORKERS,
+        max_queue: int = UPLOAD_MAX_QUEUE,
+        backpressure: str = UPLOAD_BACKPRESSURE,
+        block_timeout_seconds: float = UPLOAD_BLOCK_TIMEOUT_SECONDS,
+    ):
+        if backpressure not in ("block", "drop"):
+            raise ValueError(f"unknown upload backpressure policy {backpressure}")
+        self.upload_fn = upload_fn
+        self.num_workers = workers
+        self.backpressure = backpressure
+        self.block_timeout_seconds = block_timeout_seconds
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _start_workers(self) -> None:
+        # started lazily so importing the module doesn't spawn threads
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._work, name=f"UploadWorker_{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, bucket_name: str, image_bytes: bytes, photo_hash: str) -> bool:
+        """Queue an upload. Returns False if it was dropped (queue full or shutting down)"""
+        if self._closed:
+            self._record_drop(bucket_name, photo_hash, "shutting down")
+            return False
+        self._start_workers()
+        item = (bucket_name, image_bytes, photo_hash, time.monotonic())
+        try:
+            if self.backpressure == "block":
+                self._queue.put(item, timeout=self.block_timeout_seconds)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            self._record_drop(bucket_name, photo_hash, "queue full")
+            return False
+        return True
+
+    def _record_drop(self, bucket_name: str, photo_hash: str, reason: str) -> None:
+        with self._lock:
+            self.dropped += 1
+        log.error("Upload dropped", bucket=bucket_name, photo_hash=photo_hash, reason=reason)
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            bucket_name, image_bytes, photo_hash, enqueued = item
+            try:
+                self.upload_fn(bucket_name, image_bytes, photo_hash)
+                succeeded = True
+            except Exception as e:
+                succeeded = False
+                log.error("Upload failed", bucket=bucket_name, photo_hash=photo_hash, error_message=str(e))
+            latency = time.monotonic() - enqueued
+            with self._lock:
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            self._queue.task_done()
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting uploads, let workers finish everything already queued"""
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+        for _ in workers:
+            self._queue.put(_STOP)
+        for worker in workers:
+            worker.join(timeout)
+        log.info("Upload queue drained", completed=self.completed, failed=self.failed, dropped=self.dropped)
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "queue_depth": self._queue.qsize(),
+                "workers": len(self._workers),
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "avg_latency_ms": round(self.total_latency / finished * 1000, 1) if finished else 0,
+                "max_latency_ms": round(self.max_latency * 1000, 1),
+            }
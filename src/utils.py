@@ -9,6 +9,8 @@ from cryptography.fernet import Fernet
 from hashlib import sha256
 import uuid
 from src.database import AthleteTable, WorkoutLogTable
+from src.identity import get_athlete
+from src.cache import TtlCache
 
 # Load vals from config
 with open("config/config.yaml", "r") as f:
@@ -23,6 +25,13 @@ KEY = config_data["FERNET_KEY"]
 # create a Fernet instance using KEY
 fernet = Fernet(KEY)
 
+TOKEN_CACHE_CONFIG = config_data.get("token_cache", {})
+# tokens that passed decryption + secret check -> auth_uid, so repeat requests skip the Fernet crypto
+verified_token_cache = TtlCache(
+    max_entries=TOKEN_CACHE_CONFIG.get("max_entries", 10000),
+    ttl_seconds=TOKEN_CACHE_CONFIG.get("ttl_seconds", 600),
+)
+
 
 class InvalidTokenError(Exception):
     """Raised if userToken does not contain valid Secret String"""
@@ -40,18 +49,23 @@ def create_encrypted_token(auth_uid: str) -> str:
 
 
 def validate_user_token(authorization: str) -> Union[str, bool]:
-    # decrypt token
     token = authorization.split(" ")[1]
+    # keyed on a digest - the cache never holds usable bearer tokens
+    token_digest = sha256(token.encode()).digest()
+    auth_uid = verified_token_cache.get(token_digest)
+    if auth_uid is not None:
+        return auth_uid
+    # decrypt token
     decMessage_list = fernet.decrypt(token).decode().split("BREAK")
     # print(decMessage_list)
     if decMessage_list[0] == SECRET_STRING:
+        verified_token_cache.put(token_digest, decMessage_list[1])
         return decMessage_list[1]
     raise InvalidTokenError()
 
 
 def get_user_id(auth_uid: str, session) -> int:
-    user = session.query(AthleteTable).filter_by(auth_uid=auth_uid).first()
-    return user.user_id
+    return get_athlete(auth_uid, session).user_id
 
 
 # Created by Nico
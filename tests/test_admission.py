@@ -0,0 +1,90 @@
+import threading
+import time
+import pytest
+from src.admission import FairScheduler
+from src.schemas import CustomError
+
+
+def _wait_until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        time.sleep(0.005)
+    raise AssertionError("condition not reached")
+
+
+def test_slots_are_shared_round_robin_between_tenants():
+    scheduler = FairScheduler(max_concurrent=1, max_queue_per_tenant=10, max_queue=10, max_wait_seconds=5)
+    order = []
+
+    def ocr(tenant):
+        with scheduler.slot(tenant):
+            order.append(tenant)
+
+    with scheduler.slot("coach"):
+        threads = []
+        # the coach queues three photos before the athlete's single photo arrives
+        for tenant in ["coach", "coach", "coach", "athlete"]:
+            thread = threading.Thread(target=ocr, args=(tenant,))
+            thread.start()
+            threads.append(thread)
+            _wait_until(lambda: scheduler.stats()["waiting"] == len(threads))
+    for thread in threads:
+        thread.join()
+    assert order == ["coach", "athlete", "coach", "coach"]
+    stats = scheduler.stats()
+    assert stats["in_use"] == 0
+    assert scheduler.tenant_stats("coach")["admitted"] == 4
+    assert (stats["tenants"], stats["admitted"]) == (2, 5)
+
+
+def test_full_tenant_queue_is_rejected_with_retry_after():
+    scheduler = FairScheduler(max_concurrent=1, max_queue_per_tenant=1, max_queue=10, max_wait_seconds=5)
+
+    def ocr(tenant):
+        with scheduler.slot(tenant):
+            pass
+
+    with scheduler.slot("coach"):
+        waiter = threading.Thread(target=ocr, args=("coach",))
+        waiter.start()
+        _wait_until(lambda: scheduler.stats()["waiting"] == 1)
+        with pytest.raises(CustomError) as e:
+            ocr("coach")
+        assert e.value.status_code == 429
+        assert e.value.retry_after >= 1
+        # another tenant can still queue
+        athlete = threading.Thread(target=ocr, args=("athlete",))
+        athlete.start()
+        _wait_until(lambda: scheduler.stats()["waiting"] == 2)
+    waiter.join()
+    athlete.join()
+    assert scheduler.tenant_stats("coach")["rejected"] == 1
+    assert scheduler.tenant_stats("athlete")["admitted"] == 1
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_waiting_too_long_is_rejected():
+    scheduler = FairScheduler(max_concurrent=1, max_queue_per_tenant=5, max_queue=5, max_wait_seconds=0.02)
+    with scheduler.slot("coach"):
+        with pytest.raises(CustomError) as e:
+            with scheduler.slot("athlete"):
+                pass
+    assert e.value.status_code == 429
+    assert scheduler.stats()["waiting"] == 0
+    # the slot is free again once released
+    with scheduler.slot("athlete"):
+        assert scheduler.stats()["in_use"] == 1
+
+
+def test_stats_publish_no_tenant_keys_and_idle_tenants_are_dropped():
+    scheduler = FairScheduler(max_concurrent=1, tenant_stats_max_entries=2, tenant_stats_ttl_seconds=60)
+    for tenant in ["user:uid1", "user:uid2", "user:uid3"]:
+        with scheduler.slot(tenant):
+            pass
+    stats = scheduler.stats()
+    assert "user:uid1" not in str(stats)
+    # bounded - the least recently active tenant was dropped
+    assert (stats["tenants"], stats["admitted"]) == (2, 2)
+    assert scheduler.tenant_stats("user:uid1") is None
+    assert scheduler.tenant_stats("user:uid3")["admitted"] == 1
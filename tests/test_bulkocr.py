@@ -0,0 +1,93 @@
+import threading
+import pytest
+from hashlib import sha256
+from unittest.mock import patch
+from bulkocr import BulkIngest, Manifest, list_jpegs
+from src.backends import FilesystemBlobStore, OcrProvider
+from src.ocrstore import RawOcrStore
+
+
+class FakeProvider(OcrProvider):
+    def __init__(self, fail_for=()):
+        self.calls = []
+        self.fail_for = set(fail_for)
+
+    def analyze(self, image_bytes, photo_hash):
+        self.calls.append(photo_hash)
+        if photo_hash in self.fail_for:
+            raise ValueError("provider error")
+        return {"Blocks": [{"Id": photo_hash, "BlockType": "WORD", "Text": "time"}]}
+
+
+def _photos(tmp_path, n):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    for i in range(n):
+        (folder / f"erg{i}.jpeg").write_bytes(f"photo {i}".encode())
+    (folder / "notes.txt").write_text("not a photo")
+    return folder
+
+
+def _ingest(tmp_path, folder, provider, store):
+    return BulkIngest(
+        str(folder),
+        Manifest(str(tmp_path / "manifest.jsonl")),
+        store=store,
+        provider=provider,
+        blobs=FilesystemBlobStore(str(tmp_path / "blobs")),
+        bucket_name="bucket",
+        workers=3,
+        upload_workers=2,
+        batch_size=4,
+        batch_seconds=0.05,
+    )
+
+
+def test_ingest_stores_and_uploads_every_photo(tmp_path):
+    folder = _photos(tmp_path, 10)
+    store = RawOcrStore(str(tmp_path / "ocr.db"))
+    provider = FakeProvider()
+    summary = _ingest(tmp_path, folder, provider, store).run(list_jpegs(str(folder)))
+    assert summary["completed"] == 10 and summary["failed"] == 0
+    assert summary["stages"]["store"]["items"] == 10
+    for i in range(10):
+        photo_hash = sha256(f"photo {i}".encode()).hexdigest()
+        assert store.get(photo_hash)["Blocks"][0]["Id"] == photo_hash
+        assert (tmp_path / "blobs" / "bucket" / photo_hash).read_bytes() == f"photo {i}".encode()
+
+
+def test_ingest_resumes_from_manifest_and_retries_failures(tmp_path):
+    folder = _photos(tmp_path, 6)
+    store = RawOcrStore(str(tmp_path / "ocr.db"))
+    failing_hash = sha256(b"photo 2").hexdigest()
+    first = _ingest(tmp_path, folder, FakeProvider(fail_for=[failing_hash]), store)
+    summary = first.run(list_jpegs(str(folder)))
+    first.manifest.close()
+    assert summary["completed"] == 5 and summary["failed"] == 1
+
+    provider = FakeProvider()
+    summary = _ingest(tmp_path, folder, provider, store).run(list_jpegs(str(folder)))
+    # only the failed photo is picked up again
+    assert summary["photos"] == 1 and summary["completed"] == 1
+    assert provider.calls == [failing_hash]
+
+
+def test_photos_already_in_store_skip_ocr(tmp_path):
+    folder = _photos(tmp_path, 3)
+    store = RawOcrStore(str(tmp_path / "ocr.db"))
+    store.put(sha256(b"photo 0").hexdigest(), {"Blocks": []})
+    provider = FakeProvider()
+    summary = _ingest(tmp_path, folder, provider, store).run(list_jpegs(str(folder)))
+    assert summary["completed"] == 3
+    assert summary["cached"] == 1 and summary["ocr_calls"] == 2
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_unexpected_hash_stage_error_still_stops_the_pipeline(tmp_path):
+    folder = _photos(tmp_path, 3)
+    ingest = _ingest(tmp_path, folder, FakeProvider(), RawOcrStore(str(tmp_path / "ocr.db")))
+    run = threading.Thread(target=ingest.run, args=(list_jpegs(str(folder)),), daemon=True)
+    with patch("bulkocr.sha256", side_effect=RuntimeError("boom")):
+        run.start()
+        run.join(timeout=10)
+    assert not run.is_alive()
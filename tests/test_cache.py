@@ -0,0 +1,67 @@
+import threading
+import time
+import pytest
+from src.cache import SingleFlight, TtlCache
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+
+    def slow_ocr():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"Blocks": []}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(single_flight.do("hash", slow_ocr)))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [{"Blocks": []}] * 4
+    assert single_flight.stats()["coalesced"] == 3
+
+
+def test_single_flight_shares_errors_and_forgets_them():
+    single_flight = SingleFlight()
+
+    def failing_ocr():
+        raise ValueError("textract down")
+
+    with pytest.raises(ValueError):
+        single_flight.do("hash", failing_ocr)
+    # failure isn't remembered - next call runs again
+    assert single_flight.do("hash", lambda: "ok") == "ok"
+
+
+def test_ttl_cache_expires_and_evicts():
+    now = [0.0]
+    cache = TtlCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    # "b" is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["evictions"], stats["expirations"], stats["entries"]) == (1, 1, 1)
+
+
+def test_ttl_cache_pop():
+    now = [0.0]
+    cache = TtlCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.pop("a") == 1
+    assert cache.get("a") is None
+    now[0] = 11
+    # expired entries are removed but not returned
+    assert cache.pop("b") is None
+    assert len(cache) == 0
@@ -0,0 +1,52 @@
+from google.api_core.exceptions import PreconditionFailed
+from src.gcs import GcsUploader
+
+
+class FakeSession:
+    def mount(self, prefix, adapter):
+        pass
+
+
+class FakeBlob:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def upload_from_string(self, data, content_type, if_generation_match=None):
+        if if_generation_match == 0 and self.name in self.store:
+            raise PreconditionFailed("object exists")
+        self.store[self.name] = data
+
+
+class FakeBucket:
+    def __init__(self):
+        self.store = {}
+
+    def blob(self, name):
+        return FakeBlob(self.store, name)
+
+
+class FakeClient:
+    created = 0
+
+    def __init__(self):
+        FakeClient.created += 1
+        self._http = FakeSession()
+        self.buckets = {}
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, FakeBucket())
+
+
+def test_upload_if_absent_reuses_client_and_skips_duplicates():
+    FakeClient.created = 0
+    uploader = GcsUploader(client_factory=FakeClient)
+    assert uploader.upload_if_absent("bucket", b"image", "hash1")
+    assert uploader.upload_if_absent("bucket", b"image", "hash2")
+    assert not uploader.upload_if_absent("bucket", b"other", "hash1")
+    assert FakeClient.created == 1
+    assert uploader.bucket("bucket").store == {"hash1": b"image", "hash2": b"image"}
+    stats = uploader.stats()
+    assert stats["uploads"] == 2
+    assert stats["duplicates"] == 1
+    assert stats["buckets"] == 1
@@ -0,0 +1,18 @@
+"""
+Parser outputs for every cached Textract response must match tests/golden/ocr_outputs.json
+Regenerate after an intended change: python dev/replay_bench.py --json src/ocrlibrary.json dev/sandbox.json --update-golden
+"""
+import json
+from dev.replay_bench import DEFAULT_GOLDEN_PATH, compare_to_golden, load_json_libraries, replay_all
+
+CORPUS = ["src/ocrlibrary.json", "dev/sandbox.json"]
+
+
+def test_parser_outputs_match_golden():
+    results = replay_all(load_json_libraries(CORPUS))
+    outputs = {key: output for key, (output, _, _) in results.items()}
+    with open(DEFAULT_GOLDEN_PATH, "r") as f:
+        golden = json.load(f)
+    assert compare_to_golden(outputs, golden) == []
+    # stage timings are recorded for successful replays
+    assert all(timings["index"] > 0 for output, timings, _ in results.values() if "error" not in output)
@@ -0,0 +1,123 @@
+import threading
+import time
+from unittest.mock import patch
+import pytest
+from src import helper
+from src.schemas import CustomError
+
+
+def test_extract_and_process_erg_images_keeps_photo_order():
+    def fake_ocr(image_bytes, photo_hash, ints_var, tenant, user_id):
+        # first photo finishes last
+        time.sleep(0.1 if photo_hash == "hash1" else 0)
+        return photo_hash
+
+    with patch("src.helper.get_processed_ocr_data", side_effect=fake_ocr), patch(
+        "src.helper.merge_ocr_data", side_effect=lambda data, numSubs, varInts: data
+    ):
+        merged = helper.extract_and_process_erg_images(
+            [b"1", b"2", b"3"], ["hash1", "hash2", "hash3"], 1, False, 12, "user:uid"
+        )
+    assert merged == ["hash1", "hash2", "hash3"]
+
+
+def test_extract_and_process_erg_images_fails_fast():
+    def fake_ocr(image_bytes, photo_hash, ints_var, tenant, user_id):
+        if photo_hash == "hash2":
+            raise CustomError(status_code=400, message="No words detected in image")
+        return photo_hash
+
+    with patch("src.helper.get_processed_ocr_data", side_effect=fake_ocr):
+        with pytest.raises(CustomError):
+            helper.extract_and_process_erg_images([b"1", b"2"], ["hash1", "hash2"], 1, False, 8, "user:uid")
+
+
+
+def test_failing_photo_returns_without_waiting_for_a_slow_sibling():
+    release = threading.Event()
+
+    def fake_ocr(image_bytes, photo_hash, ints_var, tenant, user_id):
+        if photo_hash == "hash1":
+            # a Textract call that is still running when its sibling fails
+            release.wait(5)
+            return photo_hash
+        raise CustomError(status_code=400, message="No words detected in image")
+
+    with patch("src.helper.get_processed_ocr_data", side_effect=fake_ocr):
+        t1 = time.monotonic()
+        with pytest.raises(CustomError) as e:
+            helper.extract_and_process_erg_images([b"1", b"2"], ["hash1", "hash2"], 1, False, 8, "user:uid")
+        elapsed = time.monotonic() - t1
+    release.set()
+    assert e.value.status_code == 400
+    assert elapsed < 1
+
+
+
+def test_each_upload_ocrs_at_most_3_photos_at_once():
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def fake_ocr(image_bytes, photo_hash, ints_var, tenant, user_id):
+        with lock:
+            running.append(photo_hash)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(photo_hash)
+        return photo_hash
+
+    hashes = [f"hash{i}" for i in range(6)]
+    with patch("src.helper.get_processed_ocr_data", side_effect=fake_ocr), patch(
+        "src.helper.merge_ocr_data", side_effect=lambda data, numSubs, varInts: data
+    ):
+        result = helper.extract_and_process_erg_images([b"1"] * 6, hashes, 1, False, 8, "user:uid")
+    assert result == hashes
+    assert max(max_running) == 3
+
+def test_photos_that_take_too_long_return_503():
+    release = threading.Event()
+
+    def slow_ocr(image_bytes, photo_hash, ints_var, tenant, user_id):
+        release.wait(5)
+        return photo_hash
+
+    with patch("src.helper.get_processed_ocr_data", side_effect=slow_ocr), patch(
+        "src.helper.PHOTO_OCR_TIMEOUT_SECONDS", 0.1
+    ):
+        with pytest.raises(CustomError) as e:
+            helper.extract_and_process_erg_images([b"1", b"2"], ["hash1", "hash2"], 1, False, 8, "user:uid")
+    release.set()
+    assert e.value.status_code == 503
+    assert e.value.retry_after >= 1
+
+def test_resent_photo_ocr_is_stored_under_new_photo_hash():
+    class FakeStore(dict):
+        def get(self, photo_hash):
+            return super().get(photo_hash)
+
+        def put(self, photo_hash, raw_response):
+            self[photo_hash] = raw_response
+
+    store = FakeStore({"old-hash": {"Blocks": []}})
+    with patch("src.helper.raw_ocr_store", store), patch(
+        "src.helper.image_content_key", return_value="content-key"
+    ), patch(
+        "src.helper.near_dup_index.find", return_value="old-hash"
+    ), patch("src.helper.process_raw_ocr", side_effect=lambda resp, photo_hash, ints_var: photo_hash), patch(
+        "src.helper.textract_single_flight.do"
+    ) as textract:
+        assert helper.get_processed_ocr_data(b"photo", "new-hash", False, "user:uid", user_id=1) == "new-hash"
+    textract.assert_not_called()
+    assert store["new-hash"] == {"Blocks": []}
+
+
+def test_textract_calls_are_admitted_under_the_callers_tenant():
+    with patch("src.helper.raw_ocr_store.get", return_value=None), patch(
+        "src.helper.NEAR_DUP_ENABLED", False
+    ), patch("src.helper.process_raw_ocr", side_effect=lambda resp, photo_hash, ints_var: photo_hash), patch(
+        "src.helper.textract_single_flight.do", return_value={"Blocks": []}
+    ) as textract:
+        helper.get_processed_ocr_data(b"photo", "new-hash", False, "team:7", user_id=1)
+    textract.assert_called_once_with("new-hash", helper.fetch_and_store_raw_ocr, b"photo", "new-hash", "team:7")
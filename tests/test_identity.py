@@ -0,0 +1,90 @@
+import pytest
+from src.identity import AthleteIdentity, IdentityCache, get_athlete
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeQuery:
+    def __init__(self, session, auth_uid=None):
+        self.session = session
+        self.auth_uid = auth_uid
+
+    def filter_by(self, auth_uid):
+        return FakeQuery(self.session, auth_uid)
+
+    def first(self):
+        self.session.queries += 1
+        return self.session.rows.get(self.auth_uid)
+
+
+class FakeSession:
+    def __init__(self, rows):
+        # auth_uid -> (user_id, team, team_admin, email)
+        self.rows = rows
+        self.queries = 0
+
+    def query(self, *columns):
+        return FakeQuery(self)
+
+
+def test_identity_is_cached_until_ttl_expires():
+    clock = FakeClock()
+    cache = IdentityCache(ttl_seconds=60, clock=clock)
+    session = FakeSession({"uid1": (1, 7, True, "a@example.com")})
+    assert get_athlete("uid1", session, cache) == AthleteIdentity("uid1", 1, 7, True, "a@example.com")
+    get_athlete("uid1", session, cache)
+    assert session.queries == 1
+    clock.now = 61
+    get_athlete("uid1", session, cache)
+    assert session.queries == 2
+
+
+def test_invalidate_by_auth_uid_or_user_id():
+    cache = IdentityCache()
+    session = FakeSession({"uid1": (1, None, False, "a@example.com"), "uid2": (2, None, False, "b@example.com")})
+    get_athlete("uid1", session, cache)
+    get_athlete("uid2", session, cache)
+    session.rows["uid1"] = (1, 7, False, "a@example.com")
+    session.rows["uid2"] = (2, 7, True, "b@example.com")
+    cache.invalidate("uid1", user_id=2)
+    assert get_athlete("uid1", session, cache).team == 7
+    assert get_athlete("uid2", session, cache).team_admin is True
+
+
+def test_lookup_racing_an_invalidation_is_not_cached():
+    cache = IdentityCache()
+    generation = cache.generation
+    cache.invalidate("uid1")
+    cache.put(AthleteIdentity("uid1", 1, None, False, "a@example.com"), generation)
+    assert cache.get("uid1") is None
+
+
+def test_cache_is_bounded():
+    cache = IdentityCache(max_entries=2)
+    for user_id in range(3):
+        cache.put(AthleteIdentity(f"uid{user_id}", user_id, None, False, None), cache.generation)
+    assert cache.get("uid0") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_unknown_athlete_raises():
+    with pytest.raises(LookupError):
+        get_athlete("missing", FakeSession({}), IdentityCache())
+
+
+def test_invalidate_by_user_id_after_lru_churn():
+    cache = IdentityCache(max_entries=2)
+    cache.put(AthleteIdentity("uid0", 0, None, False, None), cache.generation)
+    cache.put(AthleteIdentity("uid1", 1, None, False, None), cache.generation)
+    # uid0 is recently used, so uid1 is the one evicted - from the identities and the user_id index alike
+    assert cache.get("uid0") is not None
+    cache.put(AthleteIdentity("uid2", 2, None, False, None), cache.generation)
+    cache.invalidate(user_id=0)
+    assert cache.get("uid0") is None
+    assert cache.get("uid2") is not None
@@ -0,0 +1,100 @@
+from io import BytesIO
+from unittest.mock import patch
+from PIL import Image, ImageOps
+from dev.replay_bench import load_json_libraries
+from src import helper
+from src.backends import ReplayOcrProvider
+from src.imageprep import image_prep_stats, locate_monitor, prepare_for_ocr, MIN_CROP_CONFIDENCE
+from src.ocr import process_raw_ocr
+from src.ocrstore import RawOcrStore
+from src.schemas import CustomError
+
+SAMPLE_SCREENS = ["./tests/erg-screen.jpeg", "./tests/erg-var-ints.jpg"]
+
+
+def _open(path: str) -> Image.Image:
+    return ImageOps.exif_transpose(Image.open(path))
+
+
+def test_locate_monitor_finds_lcd():
+    for path in ("./tests/erg-screen.jpeg", "./tests/erg-var-ints.jpg"):
+        img = _open(path)
+        box, confidence = locate_monitor(img)
+        assert confidence >= MIN_CROP_CONFIDENCE
+        left, top, right, bottom = box
+        # LCD is well inside the frame and a fraction of it
+        assert 0 < left < right < img.width and 0 < top < bottom < img.height
+        assert (right - left) * (bottom - top) < 0.5 * img.width * img.height
+
+
+def test_locate_monitor_falls_back_without_monitor():
+    box, confidence = locate_monitor(_open("./tests/not-an-erg.jpeg"))
+    assert box is None or confidence < MIN_CROP_CONFIDENCE
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_prepare_for_ocr_shrinks_payload():
+    for path in SAMPLE_SCREENS:
+        image_bytes = _read(path)
+        prepared = Image.open(BytesIO(prepare_for_ocr(image_bytes)))
+        assert len(prepare_for_ocr(image_bytes)) < len(image_bytes) / 2
+        assert prepared.mode == "L"
+        assert max(prepared.size) <= 2000
+
+
+def test_prepare_for_ocr_applies_exif_rotation():
+    # landscape pixels tagged "rotate 90 CW" - displayed (and sent to Textract) as portrait
+    img = Image.effect_noise((1200, 800), 60).convert("RGB")
+    exif = img.getexif()
+    exif[0x0112] = 6
+    out = BytesIO()
+    img.save(out, "JPEG", quality=95, exif=exif)
+    with patch("src.imageprep.CROP_TO_MONITOR", False):
+        prepared = Image.open(BytesIO(prepare_for_ocr(out.getvalue())))
+    assert prepared.size == (800, 1200)
+    assert 0x0112 not in prepared.getexif()
+
+
+def test_prepare_for_ocr_falls_back_on_undecodable_bytes():
+    failures = image_prep_stats.stats()["failures"]
+    assert prepare_for_ocr(b"not a jpeg") == b"not a jpeg"
+    assert image_prep_stats.stats()["failures"] == failures + 1
+
+
+def test_prepare_for_ocr_keeps_original_when_not_smaller():
+    # small, heavily compressed photo - re-encoding at jpeg_quality would only grow it
+    out = BytesIO()
+    Image.effect_noise((200, 200), 40).save(out, "JPEG", quality=30, optimize=True)
+    image_bytes = out.getvalue()
+    assert prepare_for_ocr(image_bytes) is image_bytes
+
+
+def _parse(raw_response: dict, photo_hash: str):
+    try:
+        return process_raw_ocr(raw_response, photo_hash, False)
+    except CustomError as e:
+        return e.message
+
+
+def test_replayed_ocr_parses_the_same_with_preprocessing(tmp_path):
+    # Textract stand-in serving the golden corpus - responses stay keyed by the original photo's hash
+    library = RawOcrStore(str(tmp_path / "library.db"))
+    library.put_many(load_json_libraries(["dev/sandbox.json"]).items())
+    for path in SAMPLE_SCREENS:
+        image_bytes = _read(path)
+        photo_hash = helper.create_photo_hash(image_bytes)
+        outputs = []
+        for name, prepare in (("prepared", prepare_for_ocr), ("original", lambda image_bytes: image_bytes)):
+            store = RawOcrStore(str(tmp_path / f"{name}.db"))
+            with patch("src.helper.ocr_provider", ReplayOcrProvider(library)), patch(
+                "src.helper.raw_ocr_store", store
+            ), patch("src.helper.prepare_for_ocr", side_effect=prepare) as prepared:
+                raw_response = helper.fetch_and_store_raw_ocr(image_bytes, photo_hash, "user:1")
+            assert prepared.call_count == 1
+            assert store.get(photo_hash) == raw_response
+            outputs.append(_parse(raw_response, photo_hash))
+        assert outputs[0] == outputs[1]
@@ -0,0 +1,106 @@
+import threading
+import time
+import pytest
+from src.jobs import OcrJobManager, DONE, FAILED
+from src.schemas import CustomError
+
+
+def _wait_for(manager, job_id, owner=1):
+    for _ in range(100):
+        job = manager.get(job_id, owner)
+        if job.status in (DONE, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_same_key_jobs_are_deduplicated():
+    manager = OcrJobManager(max_workers=2, result_ttl_seconds=60)
+    release = threading.Event()
+    calls = []
+
+    def ocr(value):
+        calls.append(value)
+        release.wait(1)
+        return {"value": value}
+
+    first = manager.submit(("hash",), 1, ocr, 1)
+    second = manager.submit(("hash",), 1, ocr, 1)
+    release.set()
+    assert first.job_id == second.job_id
+    assert _wait_for(manager, first.job_id).todict()["result"] == {"value": 1}
+    assert calls == [1]
+    manager.shutdown()
+
+
+def test_failed_job_reports_error_and_is_not_reused():
+    manager = OcrJobManager(max_workers=1, result_ttl_seconds=60)
+
+    def failing_ocr():
+        raise CustomError(status_code=400, message="No words detected in image")
+
+    job = _wait_for(manager, manager.submit(("hash",), 1, failing_ocr).job_id)
+    assert job.status_code == 400
+    assert manager.submit(("hash",), 1, lambda: {}).job_id != job.job_id
+    manager.shutdown()
+
+
+def test_finished_jobs_expire():
+    manager = OcrJobManager(max_workers=1, result_ttl_seconds=-1)
+    job = manager.submit(("hash",), 1, lambda: {})
+    manager.shutdown()
+    assert manager.get(job.job_id, 1) is None
+
+
+def test_jobs_belong_to_their_owner():
+    manager = OcrJobManager(max_workers=1, result_ttl_seconds=60)
+    mine = manager.submit(("hash",), 1, lambda: {"value": 1})
+    theirs = manager.submit(("hash",), 2, lambda: {"value": 2})
+    # same photos from another user is a separate job
+    assert theirs.job_id != mine.job_id
+    assert _wait_for(manager, mine.job_id).result == {"value": 1}
+    assert manager.get(mine.job_id, 2) is None
+    assert manager.get(theirs.job_id, 1) is None
+    assert _wait_for(manager, theirs.job_id, owner=2).result == {"value": 2}
+    manager.shutdown()
+
+
+def test_submit_after_shutdown_returns_503_and_leaves_no_job_behind():
+    manager = OcrJobManager(max_workers=1, result_ttl_seconds=60)
+    manager.shutdown()
+    for _ in range(2):
+        # the second upload of the same photos doesn't dedup onto a job that never ran
+        with pytest.raises(CustomError) as e:
+            manager.submit(("hash",), 1, lambda: {})
+        assert e.value.status_code == 503
+    stats = manager.stats()
+    assert stats["deduplicated"] == 0
+    assert stats["pending"] == 0
+
+
+def test_pending_jobs_are_capped_per_owner_and_overall():
+    manager = OcrJobManager(max_workers=1, result_ttl_seconds=60, max_pending=3, max_pending_per_owner=2)
+    release = threading.Event()
+
+    def ocr():
+        release.wait(1)
+        return {}
+
+    manager.submit(("hash1",), 1, ocr)
+    manager.submit(("hash2",), 1, ocr)
+    with pytest.raises(CustomError) as e:
+        manager.submit(("hash3",), 1, ocr)
+    assert e.value.status_code == 429
+    assert e.value.retry_after >= 1
+    manager.submit(("hash1",), 2, ocr)
+    with pytest.raises(CustomError) as e:
+        manager.submit(("hash1",), 3, ocr)
+    assert e.value.status_code == 429
+    # same photos as a queued job still dedup onto it
+    manager.submit(("hash1",), 1, ocr)
+    release.set()
+    manager.shutdown()
+    assert manager.stats()["rejected"] == 2
+    # slots are freed once jobs finish
+    assert manager._pending == 0
+    assert manager._pending_by_owner == {}
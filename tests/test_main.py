@@ -1,3 +1,4 @@
+import time
 from tests import utils as tu
 from unittest.mock import patch
 import pdb
@@ -46,21 +47,21 @@ def test_patch_user_succeeds(client, headers):
 def test_create_extract_and_process_ergImage_succeeds(client, headers):
     with open("./tests/erg-screen.jpeg", "rb") as f:
         files = {"photo1": ("erg-screen.jpeg", f, "image/jpeg")}
-        with patch("src.main.upload_blob"):
+        with patch("src.helper.upload_blob"):
             resp = client.post("/ergImage", headers=headers, files=files)
     assert "photo_hash" in resp.json()
 
 def test_create_extract_and_process_ergImage_var_intervals_succeeds(client, headers):
     with open("./tests/erg-var-ints.jpg", "rb") as f:
         files = {"photo1": ("erg-screen.jpeg", f, "image/jpeg")}
-        with patch("src.main.upload_blob"):
+        with patch("src.helper.upload_blob"):
             resp = client.post("/ergImage", headers=headers, files=files)
     assert "rest_info" in resp.json()
 
 def test_create_extract_and_process_ergImage_fails(client, headers): 
     with open("./tests/not-an-erg.jpeg", "rb") as f:
         files = {"photo1": ("erg-screen.jpeg", f, "image/jpeg")}
-        with patch("src.main.upload_blob"):
+        with patch("src.helper.upload_blob"):
             resp = client.post("/ergImage", headers=headers, files=files)
     assert resp.status_code == 400 
     assert "No words detected in image" in resp.json()['error_message']
@@ -132,3 +133,23 @@ def test_create_feedback_succeeds(client, headers):
     post_feedback = PostFeedbackSchema(**{"feedbackCategory": "fake-category", "comment": "fake-comment"}).dict()
     resp = client.post("/feedback", headers=headers, json=post_feedback)
     assert resp.status_code == 200
+
+
+def test_read_stats_succeeds(client):
+    resp = client.get("/stats")
+    assert "raw_ocr_memory_cache" in resp.json()
+
+
+def test_create_and_read_ergImage_job_succeeds(client, headers):
+    with open("./tests/erg-screen.jpeg", "rb") as f:
+        files = {"photo1": ("erg-screen.jpeg", f, "image/jpeg")}
+        with patch("src.helper.upload_blob"):
+            resp = client.post("/ergImageJob", headers=headers, files=files)
+            assert resp.status_code == 202
+            job_id = resp.json()["job_id"]
+            for _ in range(60):
+                resp = client.get(f"/ergImageJob/{job_id}", headers=headers)
+                if resp.json()["status"] == "done":
+                    break
+                time.sleep(1)
+    assert "photo_hash" in resp.json()["result"]
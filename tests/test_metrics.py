@@ -0,0 +1,74 @@
+import math
+import random
+from datetime import date
+from src import metrics
+from src.helper import process_dtm_workouts
+
+
+# the original one-value-at-a-time implementations - the batched engine must match them exactly
+def scalar_duration_to_seconds(duration):
+    time_components = [float(item) for item in duration.split(":")]
+    seconds = time_components.pop()
+    if len(time_components):
+        seconds += time_components.pop() * 60
+    if len(time_components):
+        seconds += time_components.pop() * 3600
+    return seconds
+
+
+def scalar_watts(split):
+    pace = scalar_duration_to_seconds(split) / 500
+    return math.ceil(2.8 / pace**3)
+
+
+def scalar_cals(time, watts):
+    time_hour = scalar_duration_to_seconds(time) / 3600
+    return math.ceil(watts / 1000 * time_hour * 860 * 4 + 300 * time_hour)
+
+
+def random_durations(n, seed=0):
+    rng = random.Random(seed)
+    durations = []
+    for _ in range(n):
+        seconds = f"{rng.randint(1, 59):02d}.{rng.randint(0, 9)}"
+        kind = rng.randint(0, 2)
+        if kind == 0:
+            durations.append(seconds)
+        elif kind == 1:
+            durations.append(f"{rng.randint(1, 59)}:{seconds}")
+        else:
+            durations.append(f"{rng.randint(1, 3)}:{rng.randint(0, 59):02d}:{seconds}")
+    return durations
+
+
+def test_batched_metrics_match_scalar_functions():
+    durations = random_durations(5000)
+    split_seconds = metrics.durations_to_seconds(durations)
+    assert split_seconds == [scalar_duration_to_seconds(d) for d in durations]
+    watts = metrics.watts(split_seconds)
+    assert watts == [scalar_watts(d) for d in durations]
+    assert metrics.calories(split_seconds, watts) == [scalar_cals(d, w) for d, w in zip(durations, watts)]
+
+
+def test_workout_summary():
+    table_metrics = [
+        {"time": "1:00:00.0", "split": "2:04.1"},
+        {"time": "10:00.0", "split": "2:04.0"},
+        {"time": "20:00.0", "split": "2:00.9"},
+        {"time": "30:00.0", "split": "2:06.1"},
+    ]
+    summary = metrics.workout_summary(table_metrics)
+    assert summary.split_var == 5.2
+    assert (summary.time_sec, summary.split_sec) == (3600.0, 124.1)
+    assert summary.watts == scalar_watts("2:04.1")
+    assert summary.cal == scalar_cals("1:00:00.0", summary.watts)
+    assert metrics.workout_summary(table_metrics[:1]).split_var == 0
+
+
+def test_process_dtm_workouts():
+    # second row not backfilled yet - time parsed from the string
+    rows = [(date(2022, 7, 1), "8:52.9", 2000, 532.9), (date(2023, 2, 14), "52:59.8", 12000, None)]
+    assert process_dtm_workouts(rows) == [
+        {"date": "2022-07-01", "time": 532.9, "meter": 2000},
+        {"date": "2023-02-14", "time": 3179.8, "meter": 12000},
+    ]
@@ -0,0 +1,67 @@
+from io import BytesIO
+from PIL import Image, ImageDraw
+from src.neardup import NearDupIndex, image_content_key
+
+
+def _load(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _photo(orientation: int = 1, software: str = "camera", quality: int = 90) -> bytes:
+    img = Image.new("L", (320, 240), 200)
+    ImageDraw.Draw(img).text((40, 100), "2000m 7:41.2", fill=20)
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x0131] = software
+    out = BytesIO()
+    img.save(out, "JPEG", quality=quality, exif=exif.tobytes())
+    return out.getvalue()
+
+
+def _add_comment(image_bytes: bytes, comment: bytes) -> bytes:
+    """COM segment straight after SOI, as some messaging apps add"""
+    return image_bytes[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + image_bytes[2:]
+
+
+def test_resent_photo_has_the_same_content_key():
+    image_bytes = _load("./tests/erg-screen.jpeg")
+    key = image_content_key(image_bytes)
+    assert key is not None
+    # bytes after EOI, extra metadata segments
+    assert image_content_key(image_bytes + b"trailer") == key
+    assert image_content_key(_add_comment(image_bytes, b"sent with app")) == key
+    # EXIF rewritten, same orientation + image data
+    assert image_content_key(_photo(software="gallery export")) == image_content_key(_photo())
+
+
+def test_different_image_data_has_a_different_content_key():
+    assert image_content_key(_load("./tests/erg-screen.jpeg")) != image_content_key(_load("./tests/erg-var-ints.jpg"))
+    # recompressed - same picture, different pixels once decoded
+    assert image_content_key(_photo(quality=70)) != image_content_key(_photo())
+    # same pixels shown rotated
+    assert image_content_key(_photo(orientation=6)) != image_content_key(_photo())
+
+
+def test_anything_but_a_complete_jpeg_has_no_content_key():
+    image_bytes = _photo()
+    out = BytesIO()
+    Image.new("L", (8, 8)).save(out, "PNG")
+    assert image_content_key(out.getvalue()) is None
+    assert image_content_key(image_bytes[:len(image_bytes) // 2]) is None
+    assert image_content_key(b"") is None
+
+
+def test_index_matches_same_user_only():
+    index = NearDupIndex(window_seconds=60, max_entries=10)
+    index.add(1, "content-key", "original-hash")
+    assert index.find(1, "content-key") == "original-hash"
+    assert index.find(2, "content-key") is None
+    assert index.find(1, "other-key") is None
+    assert index.stats()["matches"] == 1
+
+
+def test_entries_expire_after_window():
+    index = NearDupIndex(window_seconds=-1, max_entries=10)
+    index.add(1, "content-key", "original-hash")
+    assert index.find(1, "content-key") is None
@@ -0,0 +1,77 @@
+import json
+import pytest
+from src.ocr import (
+    CellTable,
+    build_document_index,
+    clean_table_data,
+    extract_metadata,
+    extract_table_data,
+    format_columns,
+    process_raw_ocr,
+)
+from src.schemas import CustomError
+
+
+def _library_response():
+    with open("src/ocrlibrary.json", "r") as f:
+        return next(iter(json.load(f).values()))
+
+
+def test_document_index_locates_table_header_and_metadata():
+    doc_index = build_document_index(_library_response())
+    assert doc_index.word_index[doc_index.time_id] == "time"
+    assert doc_index.time_row_index == 1
+    assert extract_metadata(doc_index) == ["OF concept 2.", "View Detail", "10000m", "Jan 28 2022"]
+    table_data = extract_table_data(doc_index)
+    assert table_data.texts[0] == ["time"]
+    assert len(table_data) == len(table_data.rows) == len(table_data.cols) == len(table_data.texts)
+
+
+def test_cell_table_adds_empty_hr_column_after_each_row():
+    cells = CellTable()
+    for row in (1, 2):
+        for col in range(1, 5):
+            cells.append(row, col, [f"{row}{col}"], [])
+    cells.append(3, 1, ["31"], [])
+    cells.add_empty_column_after_every(4, col=5)
+    assert cells.cols == [1, 2, 3, 4, 5, 1, 2, 3, 4, 5, 1]
+    assert cells.rows == [1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 3]
+    assert cells.texts[4] == cells.texts[9] == [""]
+
+
+def test_clean_table_data_drops_cells_before_time_header():
+    cells = CellTable()
+    cells.append(1, 1, ["View Detail"], [])
+    for col, heading in enumerate(["time", "meter", "500m", "s/m", ""], 1):
+        cells.append(2, col, [heading], [])
+    for col, text in enumerate(["2:08,7", "500", "2:08,7", "30", ""], 1):
+        cells.append(3, col, [text], [])
+    cells = clean_table_data(cells)
+    assert cells.rows[0] == 2
+    assert cells.texts[:5] == [["time"], ["meter"], ["split"], ["sr"], ["hr"]]
+    assert cells.texts[5] == ["2:08.7"]
+
+
+def test_missing_time_header_fails_table_extraction():
+    raw_response = _library_response()
+    for block in raw_response["Blocks"]:
+        if block.get("Text") == "time":
+            block["Text"] = "tme"
+    with pytest.raises(CustomError) as e:
+        process_raw_ocr(raw_response, "photo_hash", False)
+    assert e.value.status_code == 500
+
+
+def test_response_without_words_is_rejected():
+    with pytest.raises(CustomError) as e:
+        process_raw_ocr({"Blocks": [{"Id": "1", "BlockType": "PAGE"}]}, "photo_hash", False)
+    assert e.value.status_code == 400
+
+
+def test_format_columns_aligns_ragged_columns():
+    table = format_columns({"time": ["41:52.7", "1:51.8"], "hr": ["132"], "sr": None})
+    assert table.splitlines()[1:] == [
+        "time     hr   sr",
+        "41:52.7  132    ",
+        "1:51.8          ",
+    ]
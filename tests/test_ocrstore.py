@@ -0,0 +1,101 @@
+import json
+import threading
+from src.ocrstore import RawOcrStore, normalize_photo_hash, encode_ocr_record, decode_ocr_record
+from src.ocr import process_raw_ocr
+from src.cache import ByteBoundedLRU
+
+LIBRARY_PATH = "src/ocrlibrary.json"
+
+
+def test_put_and_get(tmp_path):
+    store = RawOcrStore(str(tmp_path / "rawocr.db"))
+    assert store.get("fake-hash") is None
+    assert store.put("fake-hash", {"Blocks": []})
+    assert store.get("fake-hash") == {"Blocks": []}
+    assert "fake-hash" in store
+
+
+def test_put_never_overwrites(tmp_path):
+    store = RawOcrStore(str(tmp_path / "rawocr.db"))
+    store.put("fake-hash", {"Blocks": [{"Id": "1"}]})
+    assert not store.put("fake-hash", {"Blocks": [{"Id": "2"}]})
+    assert store.get("fake-hash") == {"Blocks": [{"Id": "1"}]}
+
+
+def test_import_json_library(tmp_path):
+    store = RawOcrStore(str(tmp_path / "rawocr.db"))
+    with open(LIBRARY_PATH, "r") as f:
+        library = json.load(f)
+    assert store.import_json_library(LIBRARY_PATH) == len(library)
+    # re-importing adds nothing
+    assert store.import_json_library(LIBRARY_PATH) == 0
+    photo_hash = next(iter(library))
+    assert store.get(photo_hash)["Blocks"][0]["Id"] == library[photo_hash]["Blocks"][0]["Id"]
+
+
+def test_legacy_user_prefixed_keys_resolve_to_content_hash(tmp_path):
+    store = RawOcrStore(str(tmp_path / "rawocr.db"))
+    content_hash = "a" * 64
+    assert normalize_photo_hash(f"fake_user_{content_hash}") == content_hash
+    store.put(f"fake_user_{content_hash}", {"Blocks": []})
+    assert store.get(content_hash) == {"Blocks": []}
+    assert store.get(f"other_user_{content_hash}") == {"Blocks": []}
+
+
+def test_concurrent_writers(tmp_path):
+    store = RawOcrStore(str(tmp_path / "rawocr.db"))
+
+    def write(n):
+        for i in range(20):
+            store.put(f"hash-{n}-{i}", {"Blocks": [{"Id": f"{n}-{i}"}]})
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store) == 100
+
+
+def test_memory_tier_serves_repeat_lookups(tmp_path):
+    memory_cache = ByteBoundedLRU(max_bytes=1024)
+    store = RawOcrStore(str(tmp_path / "rawocr.db"), memory_cache=memory_cache)
+    store.put("fake-hash", {"Blocks": []})
+    assert store.get("fake-hash") == {"Blocks": []}
+    assert memory_cache.stats()["hits"] == 1
+
+
+def test_memory_tier_evicts_least_recently_used():
+    memory_cache = ByteBoundedLRU(max_bytes=100)
+    memory_cache.put("a", {}, 40)
+    memory_cache.put("b", {}, 40)
+    memory_cache.get("a")
+    memory_cache.put("c", {}, 40)
+    assert memory_cache.get("b") is None
+    assert memory_cache.get("a") == {}
+    assert memory_cache.stats()["evictions"] == 1
+    assert memory_cache.stats()["bytes"] == 80
+
+
+def test_compact_format_parses_identically():
+    with open(LIBRARY_PATH, "r") as f:
+        library = json.load(f)
+    for photo_hash, raw_response in library.items():
+        record, _ = encode_ocr_record(raw_response)
+        assert len(record) * 10 < len(json.dumps(raw_response))
+        compact_response, _ = decode_ocr_record(record)
+        assert process_raw_ocr(compact_response, photo_hash, False) == process_raw_ocr(raw_response, photo_hash, False)
+
+
+def test_compact_legacy_entries(tmp_path):
+    store = RawOcrStore(str(tmp_path / "rawocr.db"))
+    with open(LIBRARY_PATH, "r") as f:
+        library = json.load(f)
+    photo_hash, raw_response = next(iter(library.items()))
+    # plain json record as written before the compact format
+    store._conn().execute(
+        "INSERT INTO raw_ocr (photo_hash, response) VALUES (?, ?)", (photo_hash, json.dumps(raw_response))
+    )
+    assert store.get(photo_hash) == raw_response
+    assert store.compact_legacy_entries() == 1
+    assert store.get(photo_hash) == decode_ocr_record(encode_ocr_record(raw_response)[0])[0]
@@ -0,0 +1,128 @@
+import time
+import pytest
+from botocore.exceptions import ClientError
+from src.resilience import (
+    AdaptiveConcurrencyLimit,
+    CircuitBreaker,
+    ResilientCaller,
+    classify_error,
+    PERMANENT,
+    THROTTLE,
+    TRANSIENT,
+)
+from src.schemas import CustomError
+
+
+def _client_error(code, status):
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "AnalyzeDocument")
+
+
+def _caller(**kwargs):
+    return ResilientCaller("textract", backoff_base_seconds=0.001, backoff_max_seconds=0.01, **kwargs)
+
+
+def test_classify_error():
+    assert classify_error(_client_error("ThrottlingException", 400)) == THROTTLE
+    assert classify_error(_client_error("InternalServerError", 500)) == TRANSIENT
+    assert classify_error(_client_error("InvalidParameterException", 400)) == PERMANENT
+    assert classify_error(ValueError("bad")) == PERMANENT
+
+
+def test_throttling_is_retried_until_success():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _client_error("ThrottlingException", 400)
+        return {"Blocks": []}
+
+    caller = _caller()
+    assert caller.call(flaky) == {"Blocks": []}
+    stats = caller.stats()
+    assert stats["retries"] == 2
+    assert stats["throttled"] == 2
+
+
+def test_permanent_errors_are_not_retried():
+    attempts = []
+
+    def bad_document():
+        attempts.append(1)
+        raise _client_error("UnsupportedDocumentException", 400)
+
+    with pytest.raises(CustomError) as e:
+        _caller().call(bad_document)
+    assert e.value.status_code == 500
+    assert len(attempts) == 1
+
+
+def test_exhausted_retries_return_503_with_retry_after():
+    def throttled():
+        raise _client_error("ThrottlingException", 400)
+
+    with pytest.raises(CustomError) as e:
+        _caller(max_attempts=2).call(throttled)
+    assert e.value.status_code == 503
+    assert e.value.retry_after >= 1
+
+
+def test_open_circuit_fails_fast():
+    attempts = []
+
+    def unavailable():
+        attempts.append(1)
+        raise _client_error("ServiceUnavailable", 503)
+
+    caller = _caller(max_attempts=2, breaker=CircuitBreaker(failure_threshold=2, reset_seconds=60))
+    with pytest.raises(CustomError):
+        caller.call(unavailable)
+    with pytest.raises(CustomError) as e:
+        caller.call(unavailable)
+    assert len(attempts) == 2
+    assert e.value.status_code == 503
+    assert e.value.retry_after > 1
+    assert caller.stats()["circuit_breaker"]["state"] == CircuitBreaker.OPEN
+
+
+def test_half_open_breaker_closes_after_successful_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.retry_after() is None
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+
+def test_trial_call_that_never_gets_a_slot_does_not_wedge_the_breaker():
+    limiter = AdaptiveConcurrencyLimit(initial=1, minimum=1, maximum=1)
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    caller = _caller(limiter=limiter, breaker=breaker)
+    # the only slot is taken - the trial call times out waiting for it
+    assert limiter.acquire(timeout=0)
+    with pytest.raises(CustomError) as e:
+        caller.call(lambda: {"Blocks": []}, deadline=time.monotonic())
+    assert "concurrency limit" in e.value.message
+    assert breaker.state == CircuitBreaker.OPEN
+    # once a slot frees up the next call is the trial, and closes the breaker
+    limiter.release("success", latency=0.1)
+    assert caller.call(lambda: {"Blocks": []}) == {"Blocks": []}
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_aimd_limit_halves_on_throttle_and_grows_on_success():
+    limiter = AdaptiveConcurrencyLimit(initial=8, minimum=1, maximum=16)
+    assert limiter.acquire(timeout=0)
+    limiter.release(THROTTLE, latency=0.1)
+    assert limiter.limit == 4
+    for _ in range(4):
+        assert limiter.acquire(timeout=0)
+        limiter.release("success", latency=0.1)
+    assert 4.9 < limiter.limit < 5.1
+
+
+def test_limit_blocks_when_saturated():
+    limiter = AdaptiveConcurrencyLimit(initial=1, minimum=1, maximum=1)
+    assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0.01)
@@ -0,0 +1,47 @@
+import threading
+from src.uploads import UploadQueue
+
+
+def test_uploads_are_drained_on_shutdown():
+    uploaded = []
+    upload_queue = UploadQueue(lambda bucket, image_bytes, photo_hash: uploaded.append(photo_hash), workers=2, max_queue=10)
+    for i in range(5):
+        assert upload_queue.submit("bucket", b"image", f"hash{i}")
+    upload_queue.shutdown()
+    assert sorted(uploaded) == [f"hash{i}" for i in range(5)]
+    stats = upload_queue.stats()
+    assert stats["completed"] == 5
+    assert stats["queue_depth"] == 0
+    # no new uploads are accepted after shutdown
+    assert not upload_queue.submit("bucket", b"image", "late")
+    assert upload_queue.stats()["dropped"] == 1
+
+
+def test_full_queue_drops_uploads():
+    release = threading.Event()
+    upload_queue = UploadQueue(lambda *args: release.wait(1), workers=1, max_queue=1, backpressure="drop")
+    results = [upload_queue.submit("bucket", b"image", f"hash{i}") for i in range(4)]
+    release.set()
+    upload_queue.shutdown()
+    # one upload in the worker, one queued - the rest are dropped
+    assert results.count(False) >= 2
+    assert upload_queue.stats()["dropped"] == results.count(False)
+
+
+def test_blocking_backpressure_times_out():
+    release = threading.Event()
+    upload_queue = UploadQueue(lambda *args: release.wait(1), workers=1, max_queue=1, block_timeout_seconds=0.05)
+    results = [upload_queue.submit("bucket", b"image", f"hash{i}") for i in range(3)]
+    release.set()
+    upload_queue.shutdown()
+    assert results[-1] is False
+
+
+def test_failed_uploads_are_counted():
+    def failing_upload(*args):
+        raise RuntimeError("gcs unavailable")
+
+    upload_queue = UploadQueue(failing_upload, workers=1, max_queue=5)
+    upload_queue.submit("bucket", b"image", "hash")
+    upload_queue.shutdown()
+    assert upload_queue.stats()["failed"] == 1
@@ -1,3 +1,5 @@
+import pytest
+from unittest.mock import patch
 from src import utils
 from tests import utils as tu
 
@@ -5,3 +7,20 @@ def test_token_creation_and_validation():
     original_uid = "fake-auth-uid"
     final_uid = utils.validate_user_token(tu.generate_token(original_uid))
     assert final_uid == original_uid
+
+
+def test_verified_token_is_served_from_cache():
+    token = tu.generate_token("cached-auth-uid")
+    hits = utils.verified_token_cache.hits
+    assert utils.validate_user_token(token) == "cached-auth-uid"
+    with patch.object(utils.fernet, "decrypt", side_effect=AssertionError("decrypted again")):
+        assert utils.validate_user_token(token) == "cached-auth-uid"
+    assert utils.verified_token_cache.hits == hits + 1
+
+
+def test_invalid_token_is_not_cached():
+    token = "Bearer " + utils.fernet.encrypt(b"wrong-secretBREAKsome-uid").decode()
+    with pytest.raises(utils.InvalidTokenError):
+        utils.validate_user_token(token)
+    with pytest.raises(utils.InvalidTokenError):
+        utils.validate_user_token(token)